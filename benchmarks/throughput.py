@@ -0,0 +1,166 @@
+"""Throughput benchmark for the proxy's server modes and Gunicorn worker classes.
+
+Starts a stub upstream GraphQL server that answers after a fixed delay, runs ``gqlproxy start``
+against it with each configuration, and sends authorized GraphQL queries from concurrent
+keep-alive clients for a fixed time. Run from the repository root:
+
+    python benchmarks/throughput.py --duration 10 --concurrency 64 --upstream-delay 0.05
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+CONFIG_DIR = Path(__file__).resolve().parent.parent / "graphql_authz_proxy" / "tests" / "authz_configs"
+QUERY = {"query": '{ getUser(name: "Ann") { id name } }'}
+HEADERS = {"X-Forwarded-Email": "bob@company.com", "X-Forwarded-User": "bob"}
+
+# name -> extra ``gqlproxy start`` arguments
+CONFIGURATIONS = {
+    "sync": ["--worker-class", "sync"],
+    "gthread (16 threads)": ["--worker-class", "gthread", "--threads", "16", "--upstream-pool-size", "16"],
+    "gevent": ["--worker-class", "gevent", "--upstream-pool-size", "64"],
+    "async": ["--server-mode", "async", "--upstream-pool-size", "16", "--upstream-max-connections", "16"],
+}
+
+
+class _UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.delay)
+        body = b'{"data": {"getUser": {"id": 1, "name": "Ann"}}}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+class _UpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 resets connections under concurrent load.
+    request_queue_size = 1024
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_healthy(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Proxy did not become healthy at {url}")
+
+
+def _load(url: str, duration: float, concurrency: int) -> tuple[int, int, list[float]]:
+    """Send queries from ``concurrency`` keep-alive clients for ``duration`` seconds."""
+    deadline = time.monotonic() + duration
+
+    def _client(_: int) -> tuple[int, int, list[float]]:
+        ok = failed = 0
+        latencies = []
+        with requests.Session() as session:
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = session.post(url, json=QUERY, headers=HEADERS, timeout=30)
+                    response.raise_for_status()
+                    ok += 1
+                    latencies.append(time.perf_counter() - started)
+                except requests.RequestException:
+                    failed += 1
+        return ok, failed, latencies
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(_client, range(concurrency)))
+    return (
+        sum(result[0] for result in results),
+        sum(result[1] for result in results),
+        [latency for result in results for latency in result[2]],
+    )
+
+
+def _run(name: str, extra_args: list[str], upstream_url: str, args: argparse.Namespace) -> dict:
+    port = _free_port()
+    command = [
+        sys.executable, "-m", "graphql_authz_proxy.cli",
+        "--upstream-url", upstream_url,
+        "--users-config-file", str(CONFIG_DIR / "users.yaml"),
+        "--groups-config-file", str(CONFIG_DIR / "groups.yaml"),
+        "--port", str(port),
+        "--workers", str(args.workers),
+        "--healthcheck-path", "/gqlproxy/health",
+        *extra_args,
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=os.environ.copy())  # noqa: S603
+    try:
+        _wait_until_healthy(f"http://127.0.0.1:{port}/gqlproxy/health")
+        ok, failed, latencies = _load(f"http://127.0.0.1:{port}/graphql", args.duration, args.concurrency)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    latencies.sort()
+    return {
+        "configuration": name,
+        "requests_per_second": round(ok / args.duration, 1),
+        "failed": failed,
+        "p50_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1) if latencies else None,
+    }
+
+
+def main() -> None:
+    """Run the benchmark and print one JSON line per configuration."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per configuration")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent keep-alive clients")
+    parser.add_argument("--workers", type=int, default=2, help="Gunicorn workers")
+    parser.add_argument("--upstream-delay", type=float, default=0.05, help="Seconds the upstream takes per query")
+    parser.add_argument(
+        "--only", action="append", choices=list(CONFIGURATIONS), help="Run only these configurations",
+    )
+    args = parser.parse_args()
+
+    _UpstreamHandler.delay = args.upstream_delay
+    upstream = _UpstreamServer(("127.0.0.1", 0), _UpstreamHandler)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    upstream_url = f"http://127.0.0.1:{upstream.server_address[1]}"
+    try:
+        for name in args.only or CONFIGURATIONS:
+            print(json.dumps(_run(name, CONFIGURATIONS[name], upstream_url, args)), flush=True)  # noqa: T201
+    finally:
+        upstream.shutdown()
+
+
+if __name__ == "__main__":
+    main()
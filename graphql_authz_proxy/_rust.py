@@ -5,7 +5,7 @@ compiled ``graphql_authz_proxy_rs`` extension produced by the ``rust/`` crate
 (see issue #14). It exposes:
 
 * ``RUST_AVAILABLE`` -- ``True`` when the native extension is importable.
-* The native functions (e.g. ``extract_user_from_headers``, ``version``) when
+* The native functions (e.g. ``extract_user_from_headers``, ``field_trees``) when
   available, so callers can prefer them while keeping a pure-Python fallback.
 
 Keeping the ``try/except`` import isolated here means the rest of the codebase
@@ -34,6 +34,40 @@ def extract_user_from_headers(headers: object) -> tuple[str, str, str, list[str]
     return _native.extract_user_from_headers(headers)
 
 
+def field_trees(query: str, variables: dict, max_fields: int) -> list[tuple[str, dict]]:
+    """Native implementation of document parsing and field-tree extraction.
+
+    Raises:
+        RuntimeError: If the native extension is not available.
+        ValueError: If the native parser cannot handle the document or it selects more
+            than ``max_fields`` fields with fragments expanded.
+
+    """
+    if _native is None:
+        raise RuntimeError("Rust extension 'graphql_authz_proxy_rs' is not available")
+    return _native.field_trees(query, variables, max_fields)
+
+
+def compile_rules(bundle: dict) -> object:
+    """Compile a rule bundle for the native rule engine.
+
+    Args:
+        bundle (dict): The bundle's ``UserRules.model_dump()``.
+
+    Returns:
+        object: A native ``RuleSet`` whose ``authorize(operation, field_tree)`` returns
+        ``(is_allowed, reason, path)``, or None if the tree needs the Python checks.
+
+    Raises:
+        RuntimeError: If the native extension is not available.
+        ValueError: If the native engine cannot evaluate the rules, e.g. JSONPath expressions.
+
+    """
+    if _native is None:
+        raise RuntimeError("Rust extension 'graphql_authz_proxy_rs' is not available")
+    return _native.RuleSet(bundle)
+
+
 def version() -> str:
     """Return the version reported by the native extension.
 
@@ -0,0 +1,415 @@
+"""Native asyncio (ASGI) server running the same pipeline as the Flask app.
+
+Upstream requests and token validation do not block the worker, so one process keeps
+many slow upstream requests in flight. Requires the ``async`` extra (httpx, uvicorn).
+"""
+
+import asyncio
+import json
+import logging
+import sys
+from collections.abc import AsyncIterator, Awaitable, Callable, MutableMapping
+from typing import Any
+
+import httpx
+from werkzeug.datastructures import Headers
+
+from graphql_authz_proxy.async_upstream import AsyncUpstreamClient
+from graphql_authz_proxy.authz.utils import MAX_EXPANDED_FIELDS
+from graphql_authz_proxy.models import Groups, Users
+from graphql_authz_proxy.pipeline import (
+    WRITE_METHODS,
+    GraphQLRequest,
+    Identity,
+    ProxyConfig,
+    ProxyError,
+    authorize,
+    authorize_batch,
+    authorize_without_parsing,
+    batch_results,
+    build_config,
+    decode_graphql_body,
+    error_body,
+    health_status,
+    identify,
+    is_batch_request,
+    is_graphql_path,
+    is_parsed,
+    parse_graphql_batch,
+    parse_graphql_request,
+    upstream_graphql_url,
+    upstream_result,
+    validate_identity,
+)
+from graphql_authz_proxy.upstream import filter_hop_by_hop_headers
+
+logger = logging.getLogger(__name__)
+
+type Scope = MutableMapping[str, Any]
+type Message = MutableMapping[str, Any]
+type Receive = Callable[[], Awaitable[Message]]
+type Send = Callable[[Message], Awaitable[None]]
+
+# Methods Flask routes to proxy_all unless write methods are proxied too.
+_PROXY_ALL_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+def _json_bytes(body: dict | list) -> bytes:
+    """Serialize a response body exactly as Flask's ``jsonify`` does outside debug mode."""
+    return (json.dumps(body, sort_keys=True, separators=(",", ":")) + "\n").encode()
+
+
+def _request_headers(scope: Scope) -> Headers:
+    """Get the request headers, with names capitalized as WSGI servers present them."""
+    return Headers([
+        (name.decode("latin-1").title(), value.decode("latin-1")) for name, value in scope["headers"]
+    ])
+
+
+class AsgiProxy:
+
+    """ASGI application with the routes of the Flask app.
+
+    ``config`` holds the same keys as the Flask app config, so the shared pipeline and the
+    Gunicorn hooks work with either.
+    """
+
+    def __init__(self, config: ProxyConfig, graphql_path: str, healthcheck_path: str) -> None:
+        """Create the application.
+
+        Args:
+            config (ProxyConfig): Proxy config, see :func:`graphql_authz_proxy.pipeline.build_config`.
+            graphql_path (str): Path for GraphQL endpoint.
+            healthcheck_path (str): Path for health check endpoint.
+
+        """
+        self.config = config
+        self.graphql_path = graphql_path
+        self.healthcheck_path = healthcheck_path
+
+    @property
+    def upstream_client(self) -> AsyncUpstreamClient:
+        """The upstream client."""
+        return self.config["upstream_client"]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle an ASGI connection."""
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            raise NotImplementedError(f"Unsupported ASGI scope type: {scope['type']}")
+
+        path, method = scope["path"], scope["method"]
+        if path == self.graphql_path and method == "POST":
+            await self._proxy_graphql(scope, receive, send)
+        elif path == self.healthcheck_path and method in {"GET", "HEAD"}:
+            await self._send_json(scope, send, health_status(self.config))
+        elif method == "OPTIONS":
+            # Flask answers OPTIONS itself with the methods the path accepts.
+            await self._send(scope, send, 200, {"Allow": self._allowed_methods(path)}, b"")
+        elif method in _PROXY_ALL_METHODS or (
+            method in WRITE_METHODS
+            and self.config.get("proxy_write_methods", False)
+            and not is_graphql_path(path, self.config["upstream_graphql_path"])
+        ):
+            await self._proxy_all(scope, receive, send)
+        else:
+            await self._send(
+                scope, send, 405,
+                {"Allow": self._allowed_methods(path), "Content-Type": "text/plain; charset=utf-8"},
+                b"Method Not Allowed",
+            )
+
+    def _allowed_methods(self, path: str) -> str:
+        methods = set(_PROXY_ALL_METHODS)
+        if path == self.graphql_path:
+            methods.add("POST")
+        elif self.config.get("proxy_write_methods", False) and not is_graphql_path(
+            path, self.config["upstream_graphql_path"],
+        ):
+            methods.update(WRITE_METHODS)
+        return ", ".join(sorted(methods))
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        """Open upstream connections on startup and close them on shutdown."""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.upstream_client.warm()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.upstream_client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _send(self, scope: Scope, send: Send, status: int, headers: dict[str, str], body: bytes) -> None:
+        """Send a complete response. Responses to HEAD requests keep their headers but have no body."""
+        if scope["method"] == "HEAD":
+            body = b""
+        else:
+            headers = {name: value for name, value in headers.items() if name.lower() != "content-length"}
+            headers["Content-Length"] = str(len(body))
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _send_json(self, scope: Scope, send: Send, body: dict | list, status: int = 200) -> None:
+        """Send a JSON response."""
+        await self._send(scope, send, status, {"Content-Type": "application/json"}, _json_bytes(body))
+
+    async def _read_body(self, receive: Receive) -> bytes:
+        """Read the whole request body."""
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        return bytes(body)
+
+    async def _iter_body(self, receive: Receive) -> AsyncIterator[bytes]:
+        """Yield the request body as it arrives."""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            if chunk := message.get("body", b""):
+                yield chunk
+            if not message.get("more_body", False):
+                return
+
+    async def _relay(self, scope: Scope, send: Send, response: httpx.Response) -> None:
+        """Relay an upstream response, streaming it if it is large or of unknown length.
+
+        Sending waits for the client to accept each chunk before the next one is read from
+        the upstream, as with the Flask app.
+        """
+        try:
+            headers = filter_hop_by_hop_headers(response.headers)
+            content_length = response.headers.get("Content-Length", "")
+            if content_length.isdigit() and int(content_length) <= self.config["stream_threshold"]:
+                body = b"".join([chunk async for chunk in response.aiter_raw()])
+                await self._send(scope, send, response.status_code, headers, body)
+                return
+
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+            })
+            async for chunk in response.aiter_raw(self.config["stream_chunk_size"]):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+    async def _proxy_all(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Proxy a non-GraphQL request to the upstream server."""
+        try:
+            request_headers = _request_headers(scope)
+            headers = filter_hop_by_hop_headers(request_headers)
+            headers.pop("Host", None)
+
+            url = self.config["upstream_url"] + scope["path"]
+            if scope["query_string"]:
+                url += f"?{scope['query_string'].decode()}"
+
+            has_body = request_headers.get("Content-Length", "0") != "0" or (
+                "chunked" in request_headers.get("Transfer-Encoding", "").lower()
+            )
+            response = await self.upstream_client.send(
+                scope["method"],
+                url,
+                headers=list(headers.items()),
+                content=self._iter_body(receive) if has_body else None,
+            )
+        except Exception as e:
+            logger.exception(f"Error proxying request: {e!s}")
+            await self._send_json(scope, send, error_body("Proxy error", "PROXY_ERROR"), 502)
+            return
+        await self._relay(scope, send, response)
+
+    async def _proxy_graphql(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Authorize a GraphQL request and forward it to the upstream server if allowed."""
+        try:
+            headers = _request_headers(scope)
+            body = await self._read_body(receive)
+            if is_batch_request(body, headers.get("Content-Type", "")):
+                await self._proxy_graphql_batch(scope, send, headers, body)
+                return
+            try:
+                logger.info(f"Extracting user information from headers: {headers}")
+                identity = identify(self.config, headers)
+                if self.config.get("validate_token", False):
+                    # Identity providers make blocking HTTP calls.
+                    identity = await asyncio.to_thread(validate_identity, self.config, identity)
+                data = decode_graphql_body(body, headers.get("Content-Type", ""))
+                if authorize_without_parsing(self.config, identity, data):
+                    forward_body = body
+                elif is_parsed(self.config, data):
+                    forward_body = self._authorize(identity, body, headers, data)
+                else:
+                    # Parsing and checking a new document is CPU-bound; keep serving cached ones meanwhile.
+                    forward_body = await asyncio.to_thread(self._authorize, identity, body, headers, data)
+            except ProxyError as e:
+                await self._send_json(scope, send, e.body(), e.status)
+                return
+
+            forward_headers = filter_hop_by_hop_headers(headers)
+            # The body may have been rewritten; httpx sets the length of the body it sends.
+            forward_headers.pop("Content-Length", None)
+            response = await self.upstream_client.send(
+                "POST",
+                upstream_graphql_url(self.config),
+                headers=list(forward_headers.items()),
+                content=forward_body,
+            )
+        except Exception as e:
+            logger.exception(f"Error processing request: {e!s}")
+            await self._send_json(scope, send, error_body("Internal server error", "INTERNAL_ERROR"), 500)
+            return
+        await self._relay(scope, send, response)
+
+    def _authorize(self, identity: Identity, body: bytes, headers: Headers, data: Any) -> bytes:  # noqa: ANN401
+        """Parse and authorize a decoded GraphQL request.
+
+        Args:
+            identity (Identity): The validated identity of the caller.
+            body (bytes): Raw request body.
+            headers (Headers): Request headers.
+            data (Any): The body as decoded by :func:`decode_graphql_body`.
+
+        Returns:
+            bytes: The body to forward to the upstream server.
+
+        Raises:
+            ProxyError: If the request is malformed or not allowed.
+
+        """
+        graphql_request = parse_graphql_request(self.config, body, headers.get("Content-Type", ""), data)
+        authorize(self.config, identity, graphql_request, headers)
+        return graphql_request.forward_body
+
+    async def _proxy_graphql_batch(self, scope: Scope, send: Send, headers: Headers, body: bytes) -> None:
+        """Authorize each request of a batch and forward the allowed ones to the upstream concurrently."""
+        try:
+            batch = parse_graphql_batch(self.config, body)
+            identity = identify(self.config, headers)
+            if self.config.get("validate_token", False):
+                identity = await asyncio.to_thread(validate_identity, self.config, identity)
+        except ProxyError as e:
+            await self._send_json(scope, send, e.body(), e.status)
+            return
+        batch = authorize_batch(self.config, identity, batch, headers)
+
+        url = upstream_graphql_url(self.config)
+        forward_headers = filter_hop_by_hop_headers(headers)
+        forward_headers.pop("Content-Length", None)
+
+        async def forward(graphql_request: GraphQLRequest) -> dict:
+            try:
+                response = await self.upstream_client.send(
+                    "POST", url, headers=list(forward_headers.items()), content=graphql_request.forward_body,
+                )
+                try:
+                    return upstream_result(response.status_code, await response.aread())
+                finally:
+                    await response.aclose()
+            except Exception as e:
+                logger.exception(f"Error proxying batched request: {e!s}")
+                return error_body("Proxy error", "PROXY_ERROR")
+
+        results = await asyncio.gather(*(forward(item) for item in batch if isinstance(item, GraphQLRequest)))
+        await self._send_json(scope, send, batch_results(batch, results))
+
+
+def get_asgi_app(  # noqa: PLR0913
+    upstream_url: str,
+    upstream_graphql_path: str,
+    users_config: Users,
+    groups_config: Groups,
+    *,
+    enable_config_jinja: bool = False,
+    healthcheck_path: str = "/health",
+    version: bool = False,
+    validate_token: bool = False,
+    idp: str = "github",
+    document_cache_size: int = 512,
+    document_cache_max_bytes: int = 128 * 1024 * 1024,
+    upstream_supports_apq: bool = False,
+    decision_cache_size: int = 4096,
+    identity_cache_size: int = 4096,
+    max_expanded_fields: int = MAX_EXPANDED_FIELDS,
+    max_batch_size: int = 32,
+    proxy_write_methods: bool = False,
+    native_authz: bool = False,
+    upstream_pool_size: int = 10,
+    upstream_max_connections: int = 100,
+    upstream_connect_timeout: float = 5.0,
+    upstream_read_timeout: float = 30.0,
+    upstream_warm_connections: int = 0,
+    stream_threshold: int = 256 * 1024,
+    stream_chunk_size: int = 64 * 1024,
+    token_cache_ttl: float = 300.0,
+    token_cache_negative_ttl: float = 30.0,
+    token_cache_stale_ttl: float = 60.0,
+    token_cache_size: int = 10_000,
+    oidc_issuer: str | None = None,
+    oidc_audience: str | None = None,
+    oidc_jwks_uri: str | None = None,
+    introspection_url: str | None = None,
+    introspection_client_id: str | None = None,
+    introspection_client_secret: str | None = None,
+    introspection_max_in_flight: int = 16,
+) -> AsgiProxy:
+    """Create and configure the ASGI app instance."""
+    config = build_config(
+        upstream_url=upstream_url,
+        upstream_graphql_path=upstream_graphql_path,
+        users_config=users_config,
+        groups_config=groups_config,
+        upstream_client=AsyncUpstreamClient(
+            upstream_url,
+            pool_size=upstream_pool_size,
+            max_connections=upstream_max_connections,
+            connect_timeout=upstream_connect_timeout,
+            read_timeout=upstream_read_timeout,
+            warm_connections=upstream_warm_connections,
+        ),
+        enable_config_jinja=enable_config_jinja,
+        validate_token=validate_token,
+        idp=idp,
+        document_cache_size=document_cache_size,
+        document_cache_max_bytes=document_cache_max_bytes,
+        upstream_supports_apq=upstream_supports_apq,
+        decision_cache_size=decision_cache_size,
+        identity_cache_size=identity_cache_size,
+        max_expanded_fields=max_expanded_fields,
+        max_batch_size=max_batch_size,
+        proxy_write_methods=proxy_write_methods,
+        native_authz=native_authz,
+        stream_threshold=stream_threshold,
+        stream_chunk_size=stream_chunk_size,
+        token_cache_ttl=token_cache_ttl,
+        token_cache_negative_ttl=token_cache_negative_ttl,
+        token_cache_stale_ttl=token_cache_stale_ttl,
+        token_cache_size=token_cache_size,
+        oidc_issuer=oidc_issuer,
+        oidc_audience=oidc_audience,
+        oidc_jwks_uri=oidc_jwks_uri,
+        introspection_url=introspection_url,
+        introspection_client_id=introspection_client_id,
+        introspection_client_secret=introspection_client_secret,
+        introspection_max_in_flight=introspection_max_in_flight,
+    )
+
+    if version:
+        sys.exit(0)
+
+    return AsgiProxy(config, graphql_path=upstream_graphql_path, healthcheck_path=healthcheck_path)
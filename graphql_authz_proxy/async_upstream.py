@@ -0,0 +1,184 @@
+"""Asynchronous upstream client used by the asyncio server, built on httpx."""
+
+import asyncio
+import logging
+from collections.abc import AsyncIterable, AsyncIterator, Callable
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+
+    """Response body stream that frees an upstream request slot when it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]) -> None:
+        """Wrap a response body stream.
+
+        Args:
+            stream (httpx.AsyncByteStream): The response body stream.
+            release (Callable[[], None]): Called once when the stream is closed.
+
+        """
+        self._stream = stream
+        self._release: Callable[[], None] | None = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        """Yield the chunks of the wrapped stream."""
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        """Close the wrapped stream and free the request slot."""
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class AsyncUpstreamClient:
+
+    """Asynchronous HTTP client holding a pool of keep-alive connections to the upstream server.
+
+    Up to ``max_connections`` requests are in flight at once, of which ``pool_size``
+    connections are kept alive when idle. Further requests wait for a free slot in arrival
+    order before they reach httpx, whose pool rescans every queued request and connection
+    whenever one is released and does not serve waiters in order. The underlying httpx client
+    is created on first use, inside the event loop that serves requests.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        upstream_url: str,
+        *,
+        pool_size: int = 10,
+        max_connections: int = 100,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        warm_connections: int = 0,
+    ) -> None:
+        """Configure the client. No connection is opened until the first request or :meth:`warm`.
+
+        Args:
+            upstream_url (str): Base URL of the upstream server.
+            pool_size (int): Maximum number of idle connections kept alive.
+            max_connections (int): Maximum number of concurrent upstream connections.
+            connect_timeout (float): Seconds to wait for a connection to the upstream server.
+            read_timeout (float): Seconds to wait for the upstream server to send data.
+            warm_connections (int): Connections to open when the server starts.
+
+        """
+        self.upstream_url = upstream_url
+        self.pool_size = pool_size
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.warm_connections = warm_connections
+        self._client: httpx.AsyncClient | None = None
+        self._slots: asyncio.Semaphore | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The httpx client, created on first use."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.pool_size,
+                ),
+                # Waiting for a free connection counts against the read timeout.
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            )
+            self._slots = asyncio.Semaphore(self.max_connections)
+        return self._client
+
+    async def send(
+        self,
+        method: str,
+        url: str,
+        headers: list[tuple[str, str]],
+        content: bytes | AsyncIterable[bytes] | None = None,
+    ) -> httpx.Response:
+        """Send a request and return as soon as the response headers have arrived.
+
+        The caller must read the body with ``aiter_raw`` and close the response.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Absolute URL.
+            headers (list[tuple[str, str]]): Request headers.
+            content (bytes | AsyncIterable[bytes] | None): Request body.
+
+        Returns:
+            httpx.Response: The upstream response, body not yet read.
+
+        Raises:
+            httpx.PoolTimeout: If no request slot frees up within the read timeout.
+
+        """
+        request = self.client.build_request(method, url, headers=headers, content=content)
+        slots = self._slots
+        try:
+            async with asyncio.timeout(self.read_timeout):
+                await slots.acquire()
+        except TimeoutError as e:
+            raise httpx.PoolTimeout("Timed out waiting for a free upstream connection", request=request) from e
+        try:
+            response = await self.client.send(request, stream=True)
+        except BaseException:
+            slots.release()
+            raise
+        response.stream = _ReleasingStream(response.stream, slots.release)
+        return response
+
+    async def warm(self, connections: int | None = None) -> None:
+        """Open connections to the upstream server ahead of the first request.
+
+        Failures are logged and ignored.
+
+        Args:
+            connections (int | None): Number of connections to open, defaults to ``warm_connections``.
+
+        """
+        connections = min(self.warm_connections if connections is None else connections, self.pool_size)
+        if connections <= 0:
+            return
+
+        async def _open() -> None:
+            try:
+                await self.client.head(self.upstream_url)
+            except httpx.HTTPError as e:
+                logger.warning(f"Could not pre-connect to upstream {self.upstream_url}: {e!s}")
+
+        await asyncio.gather(*(_open() for _ in range(connections)))
+
+    async def aclose(self) -> None:
+        """Close all connections."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._slots = None
+
+    def stats(self) -> dict[str, int | str]:
+        """Get connection pool statistics.
+
+        httpx has no public API for its connection pool, so the counts are read from the
+        transport's httpcore pool where it has the expected shape, else reported as ``"unknown"``.
+
+        Returns:
+            dict[str, int | str]: Connections in use, idle in the pool, and open in total.
+
+        """
+        stats: dict[str, int | str] = {"pool_size": self.pool_size, "in_use": 0, "idle": 0, "created": 0}
+        if self._client is None:
+            return stats
+        try:
+            connections = list(self._client._transport._pool.connections)
+            idle = sum(1 for connection in connections if connection.is_idle())
+        except (AttributeError, TypeError):
+            logger.debug("The httpx connection pool cannot be inspected, connection counts are unknown")
+            return {**stats, "in_use": "unknown", "idle": "unknown", "created": "unknown"}
+        return {**stats, "in_use": len(connections) - idle, "idle": idle, "created": len(connections)}
@@ -0,0 +1,154 @@
+"""Static cost analysis of GraphQL operations against the cost budgets of groups."""
+
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from functools import partial
+from typing import Any
+
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    InlineFragmentNode,
+    IntValueNode,
+    SelectionSetNode,
+    VariableNode,
+)
+
+from graphql_authz_proxy.authz.utils import FragmentExpansion
+from graphql_authz_proxy.cache import CachedDocument
+from graphql_authz_proxy.models import CostPolicy, FieldCost
+
+
+@dataclass(frozen=True)
+class QueryCost:
+
+    """Cost and depth of a selection set with fragments expanded."""
+
+    cost: float
+    depth: int
+
+
+class CostAnalyzer:
+
+    """Computes the cost of selection sets under one group's cost policy.
+
+    Aliased selections of a field are each counted, and the cost of a field's sub-fields is
+    multiplied by the field's list size. The cost of a selection set grows linearly with the
+    list sizes above it, so each fragment is costed once per request and scaled at every spread.
+    """
+
+    def __init__(
+        self,
+        fragments: Mapping[str, FragmentDefinitionNode],
+        variables: dict[str, Any],
+        cost_policy: CostPolicy,
+    ) -> None:
+        """Create an analyzer for one request.
+
+        Args:
+            fragments (Mapping[str, FragmentDefinitionNode]): Fragment definitions by name.
+            variables (dict[str, Any]): Variable values for the query.
+            cost_policy (CostPolicy): Weights and list size arguments to cost fields with.
+
+        """
+        self.fragments = fragments
+        self.variables = variables
+        self.cost_policy = cost_policy
+        # Only used for its memo and cycle detection; costing spends none of its field limit.
+        self._expansion = FragmentExpansion()
+
+    def selection_cost(self, selection_set: SelectionSetNode) -> QueryCost:
+        """Get the cost and depth of a selection set.
+
+        Args:
+            selection_set (SelectionSetNode): Selection set to cost.
+
+        Returns:
+            QueryCost: The cost of the selections and the depth of the deepest one.
+
+        Raises:
+            FragmentExpansionError: If a fragment spreads itself.
+
+        """
+        cost = 0.0
+        depth = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                field_cost = self.cost_policy.field_cost(selection.name.value)
+                if field_cost is not None and field_cost.weight is not None:
+                    cost += field_cost.weight
+                else:
+                    cost += self.cost_policy.default_weight
+                if selection.selection_set:
+                    nested = self.selection_cost(selection.selection_set)
+                    cost += self._list_size(selection, field_cost) * nested.cost
+                    depth = max(depth, nested.depth + 1)
+                else:
+                    depth = max(depth, 1)
+                continue
+            if isinstance(selection, FragmentSpreadNode):
+                fragment = self.fragments.get(selection.name.value)
+                if fragment is None:
+                    continue
+                nested = self._expansion.expand(
+                    selection.name.value, partial(self.selection_cost, fragment.selection_set),
+                )
+            elif isinstance(selection, InlineFragmentNode):
+                nested = self.selection_cost(selection.selection_set)
+            else:
+                raise TypeError(f"Unexpected selection node type: {type(selection)}")
+            cost += nested.cost
+            depth = max(depth, nested.depth)
+        return QueryCost(cost=cost, depth=depth)
+
+    def _list_size(self, field: FieldNode, field_cost: FieldCost | None) -> int:
+        """Get the number of items a field is costed for: its list size argument, else its configured size."""
+        arguments = {argument.name.value: argument.value for argument in field.arguments or ()}
+        for argument_name in self.cost_policy.list_size_arguments:
+            value = arguments.get(argument_name)
+            if isinstance(value, IntValueNode):
+                return max(int(value.value), 0)
+            if isinstance(value, VariableNode):
+                variable_value = self.variables.get(value.name.value)
+                if isinstance(variable_value, int) and not isinstance(variable_value, bool):
+                    return max(variable_value, 0)
+        if field_cost is not None and field_cost.list_size is not None:
+            return field_cost.list_size
+        return 1
+
+
+def check_query_cost(
+    document: CachedDocument,
+    variables: dict,
+    cost_policies: Iterable[CostPolicy],
+) -> tuple[bool, str]:
+    """Check the operations of a document against the cost budgets of a user's groups.
+
+    A query is within budget if it is within the budget of any of the groups, like rules
+    allowed by any group are allowed.
+
+    Args:
+        document (CachedDocument): The parsed request document.
+        variables (dict): Request variables.
+        cost_policies (Iterable[CostPolicy]): Cost budgets of the user's groups. No budgets means no limit.
+
+    Returns:
+        tuple: (is_within_budget, reason)
+
+    """
+    reasons = []
+    for cost_policy in cost_policies:
+        analyzer = CostAnalyzer(document.fragments, variables, cost_policy)
+        costs = [analyzer.selection_cost(operation.selection_set) for operation in document.operations]
+        cost = max((operation_cost.cost for operation_cost in costs), default=0.0)
+        depth = max((operation_cost.depth for operation_cost in costs), default=0)
+        if cost_policy.max_cost is not None and cost > cost_policy.max_cost:
+            reasons.append(f"Query cost {cost:g} exceeds the budget of {cost_policy.max_cost:g}")
+        elif cost_policy.max_depth is not None and depth > cost_policy.max_depth:
+            reasons.append(f"Query depth {depth} exceeds the maximum depth of {cost_policy.max_depth}")
+        else:
+            return True, f"Query cost {cost:g} is within budget"
+    if not reasons:
+        return True, "No cost budget configured"
+    return False, reasons[0]
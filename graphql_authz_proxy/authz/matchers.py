@@ -0,0 +1,226 @@
+"""Argument value matchers compiled once from the argument rules in the groups config."""
+
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+from jsonpath_ng import JSONPath
+from jsonpath_ng import parse as jsonpath_parse
+from jsonpath_ng.lexer import JsonPathLexer
+
+# Path segments that can be looked up with plain dict access. Anything else (wildcards,
+# filters, slices, quoted names, reserved words) is a genuine JSONPath expression.
+_STATIC_KEY = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Memo of values extracted from argument values within one authorization check,
+# keyed by (id(argument value), path).
+type ExtractionMemo = dict[tuple[int, str], Any]
+
+_MISSING = object()
+
+
+@lru_cache(maxsize=1024)
+def compile_jsonpath(path: str) -> JSONPath:
+    """Compile a JSONPath expression relative to the document root.
+
+    Args:
+        path (str): JSONPath string (without leading $).
+
+    Returns:
+        JSONPath: The compiled expression.
+
+    """
+    return jsonpath_parse(f"$.{path}")
+
+
+def find_jsonpath(expression: JSONPath, data: Any) -> Any:  # noqa: ANN401
+    """Evaluate a compiled JSONPath expression.
+
+    Args:
+        expression (JSONPath): Compiled expression.
+        data (Any): The data to search.
+
+    Returns:
+        Any: The single value found, a list of values if several matched, or None.
+
+    """
+    matches = [match.value for match in expression.find(data)]
+    if not matches:
+        return None
+    if len(matches) == 1:
+        return matches[0]
+    return matches
+
+
+def flatten_jsonpaths(d: dict, parent_key: str = "") -> list[tuple[str, Any]]:
+    """Yield (jsonpath, value) pairs for all leaf nodes in a nested dict.
+
+    Args:
+        d (dict): Nested dictionary to flatten.
+        parent_key (str): Prefix for keys (used for recursion).
+
+    Returns:
+        list: List of (jsonpath, value) pairs for all leaf nodes.
+
+    """
+    items = []
+    for k, v in d.items():
+        new_key = f"{parent_key}.{k}" if parent_key else k
+        if isinstance(v, dict):
+            items.extend(flatten_jsonpaths(v, new_key))
+        else:
+            items.append((new_key, v))
+    return items
+
+
+def _get_by_keys(data: Any, keys: tuple[str, ...]) -> Any:  # noqa: ANN401
+    """Follow plain dict keys, returning None as soon as one is missing."""
+    value = data
+    for key in keys:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key, _MISSING)
+        if value is _MISSING:
+            return None
+    return value
+
+
+@dataclass(frozen=True)
+class PathMatcher:
+
+    """Expected value at one path inside an argument value.
+
+    Paths made only of plain keys are resolved with direct dict lookups; other paths
+    keep a JSONPath expression that was compiled when the matcher was built.
+    """
+
+    path: str
+    expected: Any
+    keys: tuple[str, ...] | None = None
+    expression: JSONPath | None = None
+
+    @classmethod
+    def compile(cls, path: str, expected: Any) -> "PathMatcher":  # noqa: ANN401
+        """Compile a matcher for a dotted path.
+
+        Args:
+            path (str): Dotted path (JSONPath without leading $).
+            expected (Any): Value expected at the path.
+
+        Returns:
+            PathMatcher: The compiled matcher.
+
+        """
+        keys = tuple(path.split("."))
+        if all(_STATIC_KEY.match(key) and key not in JsonPathLexer.reserved_words for key in keys):
+            return cls(path=path, expected=expected, keys=keys)
+        try:
+            return cls(path=path, expected=expected, expression=compile_jsonpath(path))
+        except Exception as e:
+            # An invalid expression never matches, as with per-request parsing.
+            logging.debug(f"JSONPath error for path '{path}': {e!s}")
+            return cls(path=path, expected=expected)
+
+    def extract(self, data: Any) -> Any:  # noqa: ANN401
+        """Get the value at this matcher's path.
+
+        Args:
+            data (Any): Argument value to search.
+
+        Returns:
+            Any: The value(s) found, or None if not found.
+
+        """
+        if not data:
+            return None
+        if self.keys is not None:
+            return _get_by_keys(data, self.keys)
+        if self.expression is None:
+            return None
+        try:
+            return find_jsonpath(self.expression, data)
+        except Exception as e:
+            logging.debug(f"JSONPath error for path '{self.path}': {e!s}")
+            return None
+
+    def matches(self, data: Any, memo: ExtractionMemo | None = None) -> bool:  # noqa: ANN401
+        """Check whether the value at this matcher's path equals the expected value.
+
+        Args:
+            data (Any): Argument value to search.
+            memo (ExtractionMemo | None): Values already extracted during this check.
+
+        Returns:
+            bool: True if the value equals the expected value.
+
+        """
+        if memo is None:
+            return self.extract(data) == self.expected
+        memo_key = (id(data), self.path)
+        actual = memo.get(memo_key, _MISSING)
+        if actual is _MISSING:
+            actual = self.extract(data)
+            memo[memo_key] = actual
+        return actual == self.expected
+
+
+@dataclass(frozen=True)
+class ObjectMatcher:
+
+    """Matcher for a dict-valued argument rule value, one path matcher per leaf."""
+
+    paths: tuple[PathMatcher, ...]
+
+    @classmethod
+    def compile(cls, value: dict) -> "ObjectMatcher":
+        """Compile a dict-valued argument rule value.
+
+        Args:
+            value (dict): Nested dict of expected values.
+
+        Returns:
+            ObjectMatcher: The compiled matcher.
+
+        """
+        return cls(paths=tuple(PathMatcher.compile(path, expected) for path, expected in flatten_jsonpaths(value)))
+
+    def all_match(self, data: Any, memo: ExtractionMemo | None = None) -> bool:  # noqa: ANN401
+        """Check whether every leaf of the rule value is present in an argument value.
+
+        Args:
+            data (Any): Argument value.
+            memo (ExtractionMemo | None): Values already extracted during this check.
+
+        Returns:
+            bool: True if all leaves match.
+
+        """
+        return all(path.matches(data, memo) for path in self.paths)
+
+    def any_match(self, data: Any, memo: ExtractionMemo | None = None) -> bool:  # noqa: ANN401
+        """Check whether any leaf of the rule value is present in an argument value.
+
+        Args:
+            data (Any): Argument value.
+            memo (ExtractionMemo | None): Values already extracted during this check.
+
+        Returns:
+            bool: True if at least one leaf matches.
+
+        """
+        return any(path.matches(data, memo) for path in self.paths)
+
+
+def compile_value_matchers(values: list | None) -> tuple[ObjectMatcher | None, ...]:
+    """Compile the values of an argument rule.
+
+    Args:
+        values (list | None): Allowed or denied values of an argument rule.
+
+    Returns:
+        tuple: One ObjectMatcher per dict value and None for values compared directly.
+
+    """
+    return tuple(ObjectMatcher.compile(value) if isinstance(value, dict) else None for value in values or ())
@@ -1,6 +1,4 @@
-from typing import Any
-
-from graphql_authz_proxy.authz.utils import get_value_of_jsonpath
+from graphql_authz_proxy.authz.matchers import ExtractionMemo
 from graphql_authz_proxy.models import FieldNodeDict, FieldRule
 
 
@@ -8,6 +6,7 @@ def check_field_denials(  # noqa: C901, PLR0911, PLR0912
         field_nodes: FieldNodeDict,
         field_denials: list[FieldRule],
         parent_fields: list[str] | None = None,
+        memo: ExtractionMemo | None = None,
     ) -> tuple[bool, str, list[str]]:
     """Check if any field or argument matches a restriction (deny rule).
 
@@ -15,6 +14,7 @@ def check_field_denials(  # noqa: C901, PLR0911, PLR0912
         field_nodes (FieldNodeDict): Parsed fields from query.
         field_denials (list[FieldRule]): List of deny rules.
         parent_fields (list[str] | None): Parent field path for nested checks.
+        memo (ExtractionMemo | None): Values extracted from arguments so far in this check.
 
     Returns:
         tuple: (is_allowed, reason, parent_fields)
@@ -25,6 +25,8 @@ def check_field_denials(  # noqa: C901, PLR0911, PLR0912
     
     if parent_fields is None:
         parent_fields = []
+    if memo is None:
+        memo = {}
 
     for field_restriction in field_denials:
         if field_restriction.field_name == "*":
@@ -37,18 +39,18 @@ def check_field_denials(  # noqa: C901, PLR0911, PLR0912
                     if arg_restriction.argument_name in field_node_args:
                         arg_value = field_node_args[arg_restriction.argument_name]
                         if arg_restriction.values:
-                            for denied_value in arg_restriction.values:
-                                if isinstance(denied_value, dict):
+                            for denied_value, matcher in zip(
+                                arg_restriction.values, arg_restriction.value_matchers, strict=True
+                            ):
+                                if matcher is not None:
                                     # Deny if ANY key/value in denied_value matches
-                                    for path, val in flatten_jsonpaths(denied_value):
-                                        actual = get_value_of_jsonpath(arg_value, path)
-                                        if actual == val:
-                                            return (
-                                                False,
-                                                f"Argument '{arg_restriction.argument_name}' "
-                                                f"value '{arg_value}' is forbidden for field '{field_restriction.field_name}'",  # noqa: E501
-                                                [*parent_fields, field_restriction.field_name]
-                                            )
+                                    if matcher.any_match(arg_value, memo):
+                                        return (
+                                            False,
+                                            f"Argument '{arg_restriction.argument_name}' "
+                                            f"value '{arg_value}' is forbidden for field '{field_restriction.field_name}'",  # noqa: E501
+                                            [*parent_fields, field_restriction.field_name]
+                                        )
                                 elif arg_value == denied_value:
                                     return (
                                         False,
@@ -67,6 +69,7 @@ def check_field_denials(  # noqa: C901, PLR0911, PLR0912
                         {sub_field_name: sub_field_node},
                         field_restriction.field_rules,
                         parent_fields,
+                        memo,
                     )
                     if not is_allowed:
                         all_subfields_allowed = False
@@ -92,6 +95,7 @@ def check_field_allowances(  # noqa: C901, PLR0912
         field_nodes: FieldNodeDict,
         field_rules: list[FieldRule],
         parent_fields: list[str] | None = None,
+        memo: ExtractionMemo | None = None,
     ) -> tuple[bool, str, list[str]]:
     """Check if any field or argument matches an allowance (allow rule).
 
@@ -99,6 +103,7 @@ def check_field_allowances(  # noqa: C901, PLR0912
         field_nodes (FieldNodeDict): Parsed fields from query.
         field_rules (list[FieldRule]): List of allow rules.
         parent_fields (list[str] | None): Parent field path for nested checks.
+        memo (ExtractionMemo | None): Values extracted from arguments so far in this check.
 
     Returns:
         tuple: (is_allowed, reason, parent_fields)
@@ -109,6 +114,8 @@ def check_field_allowances(  # noqa: C901, PLR0912
     
     if parent_fields is None:
         parent_fields = []
+    if memo is None:
+        memo = {}
 
     for field_rule in field_rules:
         if field_rule.field_name == "*":
@@ -123,19 +130,13 @@ def check_field_allowances(  # noqa: C901, PLR0912
             for arg_rule in field_rule.arguments:
                 if arg_rule.argument_name in field_node_args:
                     arg_value = field_node_args[arg_rule.argument_name]
-                    # If values are dicts, use JSONPath for deep matching
+                    # If values are dicts, use the compiled path matchers for deep matching
                     if arg_rule.values:
                         allowed = False
-                        for allowed_value in arg_rule.values:
-                            if isinstance(allowed_value, dict):
+                        for allowed_value, matcher in zip(arg_rule.values, arg_rule.value_matchers, strict=True):
+                            if matcher is not None:
                                 # All keys/values in allowed_value must match
-                                all_match = True
-                                for path, val in flatten_jsonpaths(allowed_value):
-                                    actual = get_value_of_jsonpath(arg_value, path)
-                                    if actual != val:
-                                        all_match = False
-                                        break
-                                if all_match:
+                                if matcher.all_match(arg_value, memo):
                                     allowed = True
                                     break
                             elif arg_value == allowed_value:
@@ -159,6 +160,7 @@ def check_field_allowances(  # noqa: C901, PLR0912
                     {sub_field_name: sub_field_node},
                     field_rule.field_rules,
                     parent_fields,
+                    memo,
                 )
                 if not is_allowed:
                     all_subfields_allowed = False
@@ -170,24 +172,3 @@ def check_field_allowances(  # noqa: C901, PLR0912
             return True, f"Field '{field_rule.field_name}' is allowed", [*parent_fields, field_rule.field_name]
 
     return False, "No matching field allowances found, access denied", parent_fields
-
-
-def flatten_jsonpaths(d: dict, parent_key: str = "") -> list[tuple[str, Any]]:
-    """Yield (jsonpath, value) pairs for all leaf nodes in a nested dict.
-
-    Args:
-        d (dict): Nested dictionary to flatten.
-        parent_key (str): Prefix for keys (used for recursion).
-
-    Returns:
-        list: List of (jsonpath, value) pairs for all leaf nodes.
-
-    """
-    items = []
-    for k, v in d.items():
-        new_key = f"{parent_key}.{k}" if parent_key else k
-        if isinstance(v, dict):
-            items.extend(flatten_jsonpaths(v, new_key))
-        else:
-            items.append((new_key, v))
-    return items
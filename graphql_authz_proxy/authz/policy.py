@@ -0,0 +1,461 @@
+"""Policy compiled from the groups config into per-group-set rule bundles."""
+
+import json
+import logging
+import threading
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from enum import StrEnum
+
+from graphql import OperationType
+
+from graphql_authz_proxy import _rust
+from graphql_authz_proxy.cache import CachedDocument, CacheStats, LRUCache, hash_identity
+from graphql_authz_proxy.models import CostPolicy, FieldRule, Group, Groups, PolicyEffect, UserRules
+
+# (is_allowed, reason, path of the field the decision was made on)
+type Decision = tuple[bool, str, tuple[str, ...]]
+# (group names, query hash, relevant variable values, hash of the template variable values)
+type DecisionKey = tuple[frozenset[str], str, tuple[tuple[str, str], ...], str]
+
+
+def collect_field_rules(user_groups: Iterable[Group | None]) -> UserRules:
+    """Collect field denials and allowances from user groups.
+
+    Args:
+        user_groups (Iterable[Group | None]): Groups of the user. ``None`` entries are skipped.
+
+    Returns:
+        UserRules: Field allowances and denials for queries and mutations.
+
+    """
+    query_field_denials = []
+    mutation_field_denials = []
+    query_field_allowances = []
+    mutation_field_allowances = []
+    for group in user_groups:
+        if group:
+            if group.permissions.queries and group.permissions.queries.fields:
+                if group.permissions.queries.effect == PolicyEffect.DENY:
+                    query_field_denials.extend(group.permissions.queries.fields)
+                elif group.permissions.queries.effect == PolicyEffect.ALLOW:
+                    query_field_allowances.extend(group.permissions.queries.fields)
+            if group.permissions.mutations and group.permissions.mutations.fields:
+                if group.permissions.mutations.effect == PolicyEffect.DENY:
+                    mutation_field_denials.extend(group.permissions.mutations.fields)
+                elif group.permissions.mutations.effect == PolicyEffect.ALLOW:
+                    mutation_field_allowances.extend(group.permissions.mutations.fields)
+    return UserRules(
+        query_field_allowances=tuple(query_field_allowances),
+        query_field_denials=tuple(query_field_denials),
+        mutation_field_allowances=tuple(mutation_field_allowances),
+        mutation_field_denials=tuple(mutation_field_denials),
+    )
+
+
+def referenced_argument_names(user_rules: UserRules) -> frozenset[str]:
+    """Get the names of all arguments inspected by the argument rules of a rule bundle.
+
+    Args:
+        user_rules (UserRules): Rule bundle to inspect.
+
+    Returns:
+        frozenset[str]: Argument names referenced anywhere in the bundle.
+
+    """
+    names: set[str] = set()
+
+    def collect(field_rules: Iterable[FieldRule] | None) -> None:
+        for field_rule in field_rules or ():
+            for argument_rule in field_rule.arguments or ():
+                names.add(argument_rule.argument_name)
+            collect(field_rule.field_rules)
+
+    collect(user_rules.query_field_allowances)
+    collect(user_rules.query_field_denials)
+    collect(user_rules.mutation_field_allowances)
+    collect(user_rules.mutation_field_denials)
+    return frozenset(names)
+
+
+class OperationAccess(StrEnum):
+
+    """How the rules of a group set decide the operations of one type."""
+
+    ALLOW = "allow"
+    DENY = "deny"
+    CONDITIONAL = "conditional"
+
+
+def classify_access(
+    field_allowances: tuple[FieldRule, ...] | None,
+    field_denials: tuple[FieldRule, ...] | None,
+    cost_policies: tuple[CostPolicy, ...] = (),
+) -> OperationAccess:
+    """Classify the rules for one operation type by whether their decision depends on the operation.
+
+    Allowances take precedence over denials, and a wildcard first rule decides every operation
+    before any field is looked at, as in :func:`check_field_allowances` and :func:`check_field_denials`.
+
+    Args:
+        field_allowances (tuple[FieldRule, ...] | None): Allow rules for the operation type.
+        field_denials (tuple[FieldRule, ...] | None): Deny rules for the operation type.
+        cost_policies (tuple[CostPolicy, ...]): Cost budgets allowed operations must be within.
+
+    Returns:
+        OperationAccess: ALLOW or DENY if every operation gets that decision, else CONDITIONAL.
+
+    """
+    if field_allowances:
+        if field_allowances[0].field_name == "*" and not cost_policies:
+            return OperationAccess.ALLOW
+        return OperationAccess.CONDITIONAL
+    if field_denials and field_denials[0].field_name == "*":
+        return OperationAccess.DENY
+    return OperationAccess.CONDITIONAL
+
+
+def collect_cost_policies(user_groups: Iterable[Group | None]) -> tuple[CostPolicy, ...]:
+    """Collect the cost budgets of user groups.
+
+    Groups without a ``cost`` section do not change the budgets of the others.
+
+    Args:
+        user_groups (Iterable[Group | None]): Groups of the user. ``None`` entries are skipped.
+
+    Returns:
+        tuple[CostPolicy, ...]: The budgets of the groups that define one, or an empty tuple if none
+        does or any group's budget is unlimited, as queries within the limits of any group are allowed.
+
+    """
+    cost_policies = tuple(group.cost for group in user_groups if group and group.cost is not None)
+    if any(cost_policy.unlimited for cost_policy in cost_policies):
+        return ()
+    return cost_policies
+
+
+def compile_native_rules(user_rules: UserRules) -> object | None:
+    """Compile a rule bundle for the native rule engine.
+
+    Args:
+        user_rules (UserRules): Rule bundle to compile.
+
+    Returns:
+        object | None: The native rule set, or None if the Rust extension is not built or
+        cannot evaluate the bundle's rules, in which case the Python checks are used.
+
+    """
+    if not _rust.RUST_AVAILABLE:
+        return None
+    try:
+        return _rust.compile_rules(user_rules.model_dump())
+    except ValueError as e:
+        logging.debug(f"Rule bundle not compiled for the native rule engine: {e!s}")
+        return None
+
+
+@dataclass(frozen=True)
+class CompiledGroupSet:
+
+    """Everything compiled for one set of group names, kept and dropped as one entry."""
+
+    bundle: UserRules
+    # Arguments whose values the rules inspect or that set list sizes for the cost budgets
+    argument_names: frozenset[str]
+    cost_policies: tuple[CostPolicy, ...]
+    access: Mapping[OperationType, OperationAccess]
+    template_variables: tuple[str, ...]
+    native_rules: object | None
+
+
+class CompiledPolicy:
+
+    """Rule bundles compiled from a groups config, one per distinct set of group names.
+
+    Bundles are built lazily on first use, are immutable, and are shared by all requests
+    (and threads) whose user belongs to the same set of groups. The policy also caches
+    authorization decisions and bundles rendered from Jinja templates; all caches belong
+    to this compiled policy, so they are dropped together whenever the policy is
+    recompiled or invalidated.
+    """
+
+    def __init__(
+        self,
+        groups_config: Groups,
+        decision_cache_size: int = 4096,
+        rendered_cache_size: int = 1024,
+        native_authz: bool = False,
+    ) -> None:
+        """Compile the policy for a groups config.
+
+        The bundle for the config's ``default_groups`` is built eagerly.
+
+        Args:
+            groups_config (Groups): Groups config to compile.
+            decision_cache_size (int): Maximum number of cached authorization decisions.
+            rendered_cache_size (int): Maximum number of cached rendered rule bundles.
+            native_authz (bool): Whether bundles are also compiled for the native rule engine.
+
+        """
+        self.groups_config = groups_config
+        self.decision_cache_size = decision_cache_size
+        self.rendered_cache_size = rendered_cache_size
+        self.native_authz = native_authz
+        self._compiled: dict[frozenset[str], CompiledGroupSet] = {}
+        self._decisions: LRUCache[DecisionKey, Decision] = LRUCache(max_entries=decision_cache_size)
+        self._rendered: LRUCache[tuple[frozenset[str], str], UserRules] = LRUCache(max_entries=rendered_cache_size)
+        self._rendered_native_rules: LRUCache[tuple[frozenset[str], str], object] = LRUCache(
+            max_entries=rendered_cache_size,
+        )
+        self._lock = threading.Lock()
+        if groups_config.default_groups:
+            self.rules_for(self.default_group_names)
+
+    @property
+    def default_group_names(self) -> frozenset[str]:
+        """Names of the groups assigned to users that are not configured."""
+        return frozenset(self.groups_config.default_groups or ())
+
+    def rules_for(self, group_names: frozenset[str]) -> UserRules:
+        """Get the rule bundle for a set of group names, compiling it on first use.
+
+        Rules are collected from the groups in sorted name order so the bundle only
+        depends on the set of names. Unknown group names are ignored.
+
+        Args:
+            group_names (frozenset[str]): Names of the user's groups.
+
+        Returns:
+            UserRules: The shared, immutable rule bundle.
+
+        """
+        return self.compiled_for(group_names).bundle
+
+    def compiled_for(self, group_names: frozenset[str]) -> CompiledGroupSet:
+        """Get everything compiled for a set of group names, compiling it on first use.
+
+        The entry is read with a single lookup, so it stays whole if the policy is
+        invalidated while a request is using it.
+
+        Args:
+            group_names (frozenset[str]): Names of the user's groups.
+
+        Returns:
+            CompiledGroupSet: The shared, immutable compiled entry.
+
+        """
+        compiled = self._compiled.get(group_names)
+        if compiled is not None:
+            return compiled
+        with self._lock:
+            compiled = self._compiled.get(group_names)
+            if compiled is None:
+                groups = [self.groups_config.get_group(group_name) for group_name in sorted(group_names)]
+                bundle = collect_field_rules(groups)
+                cost_policies = collect_cost_policies(groups)
+                compiled = CompiledGroupSet(
+                    bundle=bundle,
+                    # List sizes taken from variables change the cost, so they are part of the decision key.
+                    argument_names=referenced_argument_names(bundle).union(
+                        *(cost_policy.list_size_arguments for cost_policy in cost_policies)
+                    ),
+                    cost_policies=cost_policies,
+                    access={
+                        OperationType.QUERY: classify_access(
+                            bundle.query_field_allowances, bundle.query_field_denials, cost_policies,
+                        ),
+                        OperationType.MUTATION: classify_access(
+                            bundle.mutation_field_allowances, bundle.mutation_field_denials, cost_policies,
+                        ),
+                    },
+                    template_variables=tuple(sorted(bundle.template_variables)),
+                    native_rules=compile_native_rules(bundle) if self.native_authz else None,
+                )
+                self._compiled[group_names] = compiled
+        return compiled
+
+    def cost_policies_for(self, group_names: frozenset[str]) -> tuple[CostPolicy, ...]:
+        """Get the cost budgets that apply to a set of group names.
+
+        Args:
+            group_names (frozenset[str]): Names of the user's groups.
+
+        Returns:
+            tuple[CostPolicy, ...]: The budgets of the groups, empty if queries are not limited.
+
+        """
+        return self.compiled_for(group_names).cost_policies
+
+    def access_for(self, group_names: frozenset[str], operation: OperationType) -> OperationAccess:
+        """Get whether a group set's rules allow or deny every operation of a type.
+
+        Args:
+            group_names (frozenset[str]): Names of the user's groups.
+            operation (OperationType): Type of the operation.
+
+        Returns:
+            OperationAccess: ALLOW or DENY if the operation need not be looked at, else CONDITIONAL.
+
+        """
+        return self.compiled_for(group_names).access.get(operation, OperationAccess.CONDITIONAL)
+
+    def template_variables(self, group_names: frozenset[str]) -> tuple[str, ...]:
+        """Get the names of the variables the templates in a group set's rule bundle reference.
+
+        Args:
+            group_names (frozenset[str]): Names of the user's groups.
+
+        Returns:
+            tuple[str, ...]: Sorted variable names, empty if the bundle has no templates.
+
+        """
+        return self.compiled_for(group_names).template_variables
+
+    def rendered_rules_for(
+        self,
+        group_names: frozenset[str],
+        template_vars: Mapping[str, str | None],
+    ) -> tuple[UserRules, str]:
+        """Get the rule bundle for a set of group names rendered with the given template variables.
+
+        Rendered bundles are cached per group set and values of the variables the templates
+        reference, so repeat requests from the same user do not render again.
+
+        Args:
+            group_names (frozenset[str]): Names of the user's groups.
+            template_vars (Mapping[str, str | None]): Values of the variables in :meth:`template_variables`,
+                None for missing ones.
+
+        Returns:
+            tuple: (rendered bundle, key of the variable values to pass to :meth:`decision_key`)
+
+        """
+        compiled = self.compiled_for(group_names)
+        bundle = compiled.bundle
+        if not bundle.has_templates:
+            return bundle, ""
+        variables = compiled.template_variables
+        # Hashed, so e.g. header values are not kept as keys.
+        render_key = hash_identity(*(f"{name}={template_vars.get(name)!r}" for name in variables))
+        rendered = self._rendered.get((group_names, render_key))
+        if rendered is None:
+            rendered = bundle.render({name: value for name, value in template_vars.items() if value is not None})
+            self._rendered.put((group_names, render_key), rendered)
+            native_rules = compile_native_rules(rendered) if self.native_authz else None
+            if native_rules is not None:
+                self._rendered_native_rules.put((group_names, render_key), native_rules)
+        return rendered, render_key
+
+    def native_rules_for(self, group_names: frozenset[str], render_key: str = "") -> object | None:
+        """Get the native rule set compiled alongside a group set's rule bundle.
+
+        Args:
+            group_names (frozenset[str]): Names of the user's groups.
+            render_key (str): Key from :meth:`rendered_rules_for` if the bundle was rendered, else "".
+
+        Returns:
+            object | None: The native rule set, or None if the native rule engine is not enabled or
+            the Python checks must be used.
+
+        """
+        if render_key:
+            return self._rendered_native_rules.get((group_names, render_key))
+        return self.compiled_for(group_names).native_rules
+
+    def warm(self, group_sets: Iterable[frozenset[str]]) -> None:
+        """Compile the bundles for the given group sets ahead of the first request.
+
+        Args:
+            group_sets (Iterable[frozenset[str]]): Group sets to compile.
+
+        """
+        for group_names in group_sets:
+            self.rules_for(group_names)
+
+    def decision_key(
+        self,
+        group_names: frozenset[str],
+        document: CachedDocument,
+        variables: dict,
+        render_key: str = "",
+    ) -> DecisionKey:
+        """Build the decision cache key for a request.
+
+        Only the values of variables passed to arguments that the group set's rules inspect,
+        or that set list sizes for its cost budgets, are part of the key, so e.g. pagination
+        cursors do not fragment the cache.
+
+        Args:
+            group_names (frozenset[str]): Names of the user's groups.
+            document (CachedDocument): Parsed request document.
+            variables (dict): Request variables.
+            render_key (str): Key of the template variable values from :meth:`rendered_rules_for`, if rendered.
+
+        Returns:
+            DecisionKey: Hashable key identifying the decision.
+
+        """
+        argument_names = self.compiled_for(group_names).argument_names
+        relevant_variables = tuple(
+            (variable, json.dumps(variables.get(variable), sort_keys=True, default=str))
+            for variable, arguments in sorted(document.variable_arguments.items())
+            if not arguments.isdisjoint(argument_names)
+        )
+        return group_names, document.query_hash, relevant_variables, render_key
+
+    def get_decision(self, key: DecisionKey) -> Decision | None:
+        """Get a cached authorization decision.
+
+        Args:
+            key (DecisionKey): Key built by :meth:`decision_key`.
+
+        Returns:
+            Decision | None: Cached (is_allowed, reason, path), or None on a miss.
+
+        """
+        return self._decisions.get(key)
+
+    def put_decision(self, key: DecisionKey, decision: Decision) -> None:
+        """Cache an authorization decision.
+
+        Args:
+            key (DecisionKey): Key built by :meth:`decision_key`.
+            decision (Decision): The (is_allowed, reason, path) to cache.
+
+        """
+        self._decisions.put(key, decision)
+
+    def decision_stats(self) -> CacheStats:
+        """Get the decision cache counters.
+
+        Returns:
+            CacheStats: Hits, misses, evictions and entries of the decision cache.
+
+        """
+        return self._decisions.stats()
+
+    def rendered_stats(self) -> CacheStats:
+        """Get the rendered bundle cache counters.
+
+        Returns:
+            CacheStats: Hits, misses, evictions and entries of the rendered bundle cache.
+
+        """
+        return self._rendered.stats()
+
+    def invalidate(self) -> None:
+        """Drop all compiled bundles, cost budgets, access classes, native rule sets, rendered bundles and decisions."""
+        with self._lock:
+            self._compiled.clear()
+            self._decisions.clear()
+            self._rendered.clear()
+            self._rendered_native_rules.clear()
+
+    def bundle_count(self) -> int:
+        """Get the number of compiled rule bundles.
+
+        Returns:
+            int: Number of distinct group sets compiled so far.
+
+        """
+        return len(self._compiled)
@@ -1,24 +1,169 @@
 import logging
-from typing import Any
+from collections.abc import Callable, Iterator, Mapping, MutableMapping, Sequence
+from copy import copy
+from functools import partial
+from typing import TYPE_CHECKING, Any
 
 from graphql import (
     ConstValueNode,
     FieldNode,
     FragmentDefinitionNode,
     FragmentSpreadNode,
+    GraphQLError,
     InlineFragmentNode,
     Node,
+    NullValueNode,
     OperationType,
     SelectionSetNode,
     ValueNode,
     VariableNode,
 )
 from graphql.pyutils import is_iterable
-from jsonpath_ng import parse as jsonpath_parse
 
 from graphql_authz_proxy import _rust
+from graphql_authz_proxy.authz.matchers import compile_jsonpath, find_jsonpath
 from graphql_authz_proxy.models import FieldNodeDict, RenderedFields
 
+if TYPE_CHECKING:
+    from graphql_authz_proxy.cache import CachedDocument
+
+# Default limit on the number of fields a document may select with its fragments inlined.
+MAX_EXPANDED_FIELDS = 100_000
+
+
+class FragmentExpansionError(GraphQLError):
+
+    """Raised when a fragment spreads itself or a document expands to too many fields."""
+
+
+def fragment_cycle_message(cycle: Sequence[str]) -> str:
+    """Describe a fragment cycle like graphql-core's ``NoFragmentCyclesRule`` does.
+
+    Args:
+        cycle (Sequence[str]): Names of the fragments on the cycle, starting with the one spread within itself.
+
+    Returns:
+        str: The error message.
+
+    """
+    name, *via = cycle
+    if not via:
+        return f"Cannot spread fragment '{name}' within itself."
+    return f"Cannot spread fragment '{name}' within itself via {', '.join(f"'{other}'" for other in via)}."
+
+
+class SelectionConflictError(GraphQLError):
+
+    """Raised when a response key selects a field both with and without sub-fields."""
+
+
+def check_selection_conflict(fields: Mapping[str, Any], name: str, is_leaf: bool) -> None:
+    """Reject a field whose response key is already selected with, or without, sub-fields.
+
+    Collected fields keep one field with sub-fields or a list of leaves per response key, so
+    such a selection could hide one of the fields from the checks.
+
+    Args:
+        fields (Mapping[str, Any]): Fields collected so far, by response key.
+        name (str): Response key of the field.
+        is_leaf (bool): Whether the field has no sub-fields.
+
+    Raises:
+        SelectionConflictError: If the response key is selected the other way.
+
+    """
+    selected = fields.get(name)
+    if selected is not None and isinstance(selected, list) != is_leaf:
+        raise SelectionConflictError(
+            f"Fields '{name}' conflict because they are selected both with and without sub-fields.",
+        )
+
+
+def merge_selections(fields: MutableMapping[str, Any], collected: Mapping[str, Any]) -> None:
+    """Add the fields collected from a fragment, replacing earlier fields with the same response key.
+
+    Args:
+        fields (MutableMapping[str, Any]): Fields collected so far, by response key.
+        collected (Mapping[str, Any]): Fields of the fragment, by response key.
+
+    Raises:
+        SelectionConflictError: If a response key is selected both with and without sub-fields.
+
+    """
+    for name, selected in collected.items():
+        check_selection_conflict(fields, name, isinstance(selected, list))
+    fields.update(collected)
+
+
+class FragmentExpansion:
+
+    """Memoized, bounded expansion of the named fragments of one document.
+
+    Each fragment is expanded once and its fields are reused at every further spread. The fields
+    of a memoized expansion still count against the limit every time they are spread, so a
+    document whose fragments multiply into a huge selection is rejected after doing work
+    proportional to the limit rather than to the selection.
+    """
+
+    def __init__(self, max_fields: int = MAX_EXPANDED_FIELDS, memo: dict[str, tuple[Any, int]] | None = None) -> None:
+        """Start an expansion.
+
+        Args:
+            max_fields (int): Maximum number of fields the expansion may select.
+            memo (dict | None): Expanded fragments and their field counts, by fragment name. Pass a
+                memo kept with the document to reuse expansions that do not depend on the variables.
+
+        """
+        self.max_fields = max_fields
+        self.remaining = max_fields
+        self.memo: dict[str, tuple[Any, int]] = {} if memo is None else memo
+        self._expanding: list[str] = []
+
+    def spend(self, fields: int) -> None:
+        """Count selected fields against the limit.
+
+        Args:
+            fields (int): Number of fields selected.
+
+        Raises:
+            FragmentExpansionError: If the limit is exceeded.
+
+        """
+        self.remaining -= fields
+        if self.remaining < 0:
+            raise FragmentExpansionError(f"Query selects more than {self.max_fields} fields with fragments expanded.")
+
+    def expand[T](self, name: str, build: Callable[[], T]) -> T:
+        """Get the expansion of a named fragment, building it on the first spread.
+
+        Args:
+            name (str): Name of the fragment.
+            build (Callable[[], T]): Expands the fragment's selection set, spending its fields.
+
+        Returns:
+            T: The expansion. It is shared between spreads and must not be modified.
+
+        Raises:
+            FragmentExpansionError: If the fragment is spread within itself or the limit is exceeded.
+
+        """
+        memoized = self.memo.get(name)
+        if memoized is not None:
+            expansion, fields = memoized
+            self.spend(fields)
+            return expansion
+        if name in self._expanding:
+            cycle = self._expanding[self._expanding.index(name):]
+            raise FragmentExpansionError(fragment_cycle_message(cycle))
+        self._expanding.append(name)
+        remaining = self.remaining
+        try:
+            expansion = build()
+        finally:
+            self._expanding.pop()
+        self.memo[name] = (expansion, remaining - self.remaining)
+        return expansion
+
 
 def get_value_of_jsonpath(data: dict, path: str) -> Any:  # noqa: ANN401
     """Get nested value from data using JSONPath notation.
@@ -34,15 +179,7 @@ def get_value_of_jsonpath(data: dict, path: str) -> Any:  # noqa: ANN401
     if not data or not path:
         return None
     try:
-        jsonpath_expr = f"$.{path}"
-        jsonpath_expression = jsonpath_parse(jsonpath_expr)
-        matches = [match.value for match in jsonpath_expression.find(data)]
-        if not matches:
-            return None
-        elif len(matches) == 1:
-            return matches[0]
-        else:
-            return matches
+        return find_jsonpath(compile_jsonpath(path), data)
     except Exception as e:
         logging.debug(f"JSONPath error for path '{path}': {e!s}")
         return None
@@ -90,6 +227,126 @@ def _extract_user_from_headers_py(headers: dict) -> tuple[str, str, str, list[st
     return user_email, user, access_token, groups
 
 
+_OPERATION_KEYWORDS = {
+    "query": OperationType.QUERY,
+    "mutation": OperationType.MUTATION,
+    "subscription": OperationType.SUBSCRIPTION,
+}
+_CLOSING_BRACKETS = {"}": "{", ")": "("}
+# Whitespace and commas are ignored tokens, as in the GraphQL lexer.
+_IGNORED = frozenset("\ufeff \t\n\r,")
+
+
+def _is_name_start(char: str) -> bool:
+    return char == "_" or ("a" <= char <= "z") or ("A" <= char <= "Z")
+
+
+def _is_name_continue(char: str) -> bool:
+    return _is_name_start(char) or ("0" <= char <= "9")
+
+
+def _string_end(query: str, start: int) -> int | None:
+    """Get the index after the string literal starting at ``start``, or None if it is not terminated."""
+    if query.startswith('"""', start):
+        end = start + 3
+        while True:
+            end = query.find('"""', end)
+            if end < 0:
+                return None
+            if query[end - 1] != "\\":
+                return end + 3
+            end += 1
+    end = start + 1
+    while end < len(query):
+        char = query[end]
+        if char == "\\":
+            end += 2
+            continue
+        if char == '"':
+            return end + 1
+        if char in "\r\n":
+            return None
+        end += 1
+    return None
+
+
+def sniff_operation_types(query: str) -> tuple[OperationType, ...] | None:  # noqa: C901, PLR0911, PLR0912
+    """Find the types of the operations in a document without parsing it.
+
+    Only the top level of the document is scanned; strings, comments and everything inside
+    braces or parentheses are skipped. The document is not validated, so a document that is
+    not executable may still get operation types, but a document with characters the lexer
+    would not accept where they are, or that is not tokenized the same way here, gets None.
+
+    Args:
+        query (str): GraphQL query text.
+
+    Returns:
+        tuple[OperationType, ...] | None: The operation types in document order, or None if the
+        document does not look like a sequence of operation and fragment definitions.
+
+    """
+    operation_types: list[OperationType] = []
+    brackets: list[str] = []
+    # At the start of a definition; a definition ends when its selection set is closed.
+    at_definition = True
+    position = 0
+    while position < len(query):
+        char = query[position]
+        if char == "#":
+            # Comments end at a line terminator, which is either character.
+            position += 1
+            while position < len(query) and query[position] not in "\r\n":
+                position += 1
+            continue
+        if char in _IGNORED:
+            position += 1
+            continue
+        if not " " <= char <= "~":
+            # Not a GraphQL token; leave the error to the parser.
+            return None
+        if char == '"':
+            end = _string_end(query, position)
+            # Descriptions are only allowed on type system definitions.
+            if end is None or not brackets:
+                return None
+            position = end
+            continue
+        if char in "{(":
+            if not brackets and at_definition:
+                if char == "(":
+                    return None
+                # Anonymous query shorthand
+                operation_types.append(OperationType.QUERY)
+                at_definition = False
+            brackets.append(char)
+        elif char in "})":
+            if not brackets or brackets.pop() != _CLOSING_BRACKETS[char]:
+                return None
+            if not brackets and char == "}":
+                at_definition = True
+        elif _is_name_start(char) and not brackets:
+            end = position + 1
+            while end < len(query) and _is_name_continue(query[end]):
+                end += 1
+            if at_definition:
+                keyword = query[position:end]
+                if keyword in _OPERATION_KEYWORDS:
+                    operation_types.append(_OPERATION_KEYWORDS[keyword])
+                elif keyword != "fragment":
+                    return None
+                at_definition = False
+            position = end
+            continue
+        elif not brackets and (char != "@" or at_definition):
+            # Only names, directives and brackets appear at the top level.
+            return None
+        position += 1
+    if brackets or not at_definition:
+        return None
+    return tuple(operation_types)
+
+
 def graphql_ast_to_dict(
     node: Node, locations: bool = False
 ) -> dict | list | str:
@@ -117,7 +374,7 @@ def graphql_ast_to_dict(
     return node
 
 
-def convert_fields_to_dict(fields: RenderedFields) -> FieldNodeDict:  # noqa: C901, PLR0912
+def convert_fields_to_dict(fields: RenderedFields) -> FieldNodeDict:
     """Convert RenderedFields to a nested dict of field arguments and selection sets.
 
     Args:
@@ -135,15 +392,7 @@ def convert_fields_to_dict(fields: RenderedFields) -> FieldNodeDict:  # noqa: C9
             field_dicts = []
             for field in selection:
                 if isinstance(field, FieldNode):
-                    try:
-                        field_dict = graphql_ast_to_dict(field)
-                    except TypeError:
-                        # If argument value is a list, convert to tuple for hashing
-                        for arg in getattr(field, "arguments", []):
-                            if hasattr(arg.value, "values") and isinstance(arg.value.values, list):
-                                arg.value.values = tuple(arg.value.values)
-                        field_dict = graphql_ast_to_dict(field)
-                    field_dicts.append(field_dict)
+                    field_dicts.append(graphql_ast_to_dict(field))
             if len(field_dicts) == 1:
                 field_dict = field_dicts[0]
                 result[field_name] = {
@@ -161,13 +410,7 @@ def convert_fields_to_dict(fields: RenderedFields) -> FieldNodeDict:  # noqa: C9
             field_node = selection.get("_field_node")
             nested = selection.get("_nested")
             if field_node:
-                try:
-                    field_dict = graphql_ast_to_dict(field_node)
-                except TypeError:
-                    for arg in getattr(field_node, "arguments", []):
-                        if hasattr(arg.value, "values") and isinstance(arg.value.values, list):
-                            arg.value.values = tuple(arg.value.values)
-                    field_dict = graphql_ast_to_dict(field_node)
+                field_dict = graphql_ast_to_dict(field_node)
                 arguments = {arg["name"]["value"]: arg["value"] for arg in field_dict.get("arguments", [])}
             else:
                 arguments = {}
@@ -184,57 +427,72 @@ def render_fields(  # noqa: C901, PLR0912
     fragments: dict[str, FragmentDefinitionNode],
     variable_values: dict[str, Any],
     selection_set: SelectionSetNode,
+    expansion: FragmentExpansion | None = None,
 ) -> RenderedFields:
     """Recursively collect fields from a GraphQL selection set, resolving fragments and variables.
 
+    Named fragments are expanded once per expansion and shared between their spreads.
+
     Args:
         fragments (dict): Fragment definitions by name.
         variable_values (dict): Variable values for the query.
         selection_set (SelectionSetNode): Selection set to process.
+        expansion (FragmentExpansion | None): Fragment expansion of the request, shared by the
+            recursive calls. A new one with the default field limit is started if None.
 
     Returns:
         RenderedFields: Nested dict of fields and subfields.
 
+    Raises:
+        FragmentExpansionError: If a fragment spreads itself or too many fields are selected.
+        SelectionConflictError: If a response key is selected both with and without sub-fields.
+
     """
+    if expansion is None:
+        expansion = FragmentExpansion()
     fields: RenderedFields = {}
+    # Keys whose leaf lists came from a fragment; they may be shared and are copied before appending.
+    shared: set[str] = set()
 
     for selection in selection_set.selections:
         if isinstance(selection, FragmentSpreadNode):
             name = selection.name.value
             fragment = fragments.get(selection.name.value)
             if fragment is not None:
-                fields.update(
-                    render_fields(
-                        fragments,
-                        variable_values,
-                        fragment.selection_set,
-                    ),
+                rendered = expansion.expand(
+                    name, partial(render_fields, fragments, variable_values, fragment.selection_set, expansion),
                 )
+                merge_selections(fields, rendered)
+                shared.update(rendered)
         elif isinstance(selection, InlineFragmentNode):
             if selection.selection_set:
-                fields.update(
-                    render_fields(
-                        fragments,
-                        variable_values,
-                        selection.selection_set,
-                    ),
-                )
+                rendered = render_fields(fragments, variable_values, selection.selection_set, expansion)
+                merge_selections(fields, rendered)
+                shared.update(rendered)
         elif isinstance(selection, FieldNode):
+            expansion.spend(1)
             name = selection.alias.value if selection.alias else selection.name.value
-            # Insert variable values into arguments
+            check_selection_conflict(fields, name, not selection.selection_set)
+            # Insert variable values into copies of the arguments; the parsed document may be
+            # shared between requests through the document cache and must not be mutated.
             if selection.arguments:
+                rendered_arguments = []
                 for arg in selection.arguments:
+                    rendered_arg = copy(arg)
                     if isinstance(arg.value, VariableNode):
                         variable_value = variable_values.get(arg.value.name.value)
-                        arg.value = variable_value
+                        rendered_arg.value = variable_value
+                    elif isinstance(arg.value, NullValueNode):
+                        rendered_arg.value = None
                     elif isinstance(arg.value, ConstValueNode):
-                        arg.value = arg.value.value
+                        rendered_arg.value = arg.value.value
                     elif isinstance(arg.value, ValueNode):
-                        arg.value = arg.value
-                    # elif isinstance(arg.value, ObjectValueNode):
-                    #     arg.value = arg.value
+                        rendered_arg.value = arg.value
                     else:
                         raise TypeError(f"Unsupported argument value type: {type(arg.value)}: {arg.value.to_dict()}")
+                    rendered_arguments.append(rendered_arg)
+                selection = copy(selection)  # noqa: PLW2901
+                selection.arguments = tuple(rendered_arguments)
             if selection.selection_set:
                 fields[name] = {
                     "_field_node": selection,
@@ -242,10 +500,50 @@ def render_fields(  # noqa: C901, PLR0912
                         fragments,
                         variable_values,
                         selection.selection_set,
+                        expansion,
                     ),
                 }
+                shared.discard(name)
             else:
+                if name in shared:
+                    fields[name] = copy(fields[name])
+                    shared.discard(name)
                 fields.setdefault(name, []).append(selection)
         else:
             raise TypeError(f"Unexpected selection node type: {type(selection)}")
-    return fields
\ No newline at end of file
+    return fields
+
+
+def field_trees(
+    document: "CachedDocument",
+    variables: dict,
+    max_fields: int = MAX_EXPANDED_FIELDS,
+) -> Iterator[tuple[OperationType, FieldNodeDict]]:
+    """Build the field tree of each operation in a document, with fragments and variables resolved.
+
+    The trees are built from the cached AST with :func:`render_fields` and
+    :func:`convert_fields_to_dict`, so the document is not parsed again.
+
+    Args:
+        document (CachedDocument): The parsed request document.
+        variables (dict): Variable values for the query.
+        max_fields (int): Maximum number of fields the operations may select with fragments expanded.
+
+    Returns:
+        Iterator: (operation type, field tree) for each operation, in document order.
+
+    Raises:
+        FragmentExpansionError: If a fragment spreads itself or too many fields are selected.
+        SelectionConflictError: If a response key is selected both with and without sub-fields.
+
+    """
+    # Rendered fragments hold variable values, so they are only shared within the request.
+    expansion = FragmentExpansion(max_fields)
+    for definition in document.operations:
+        fields = render_fields(
+            fragments=document.fragments,
+            variable_values=variables,
+            selection_set=definition.selection_set,
+            expansion=expansion,
+        )
+        yield definition.operation, convert_fields_to_dict(fields)
@@ -0,0 +1,284 @@
+"""Single-pass authorization of GraphQL operations, evaluated on the parsed document."""
+
+from collections.abc import Mapping
+from functools import partial
+from typing import Any
+
+from graphql import (
+    ConstValueNode,
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    InlineFragmentNode,
+    NullValueNode,
+    SelectionSetNode,
+    ValueNode,
+    VariableNode,
+)
+
+from graphql_authz_proxy.authz.matchers import ExtractionMemo
+from graphql_authz_proxy.authz.utils import (
+    FragmentExpansion,
+    check_selection_conflict,
+    graphql_ast_to_dict,
+    merge_selections,
+)
+from graphql_authz_proxy.models import FieldRule
+
+# The fields selected under one response key: the last field with a selection set,
+# or every leaf field, in document order.
+type SelectedField = FieldNode | list[FieldNode]
+type Selections = dict[str, SelectedField]
+
+_MISSING = object()
+
+
+class SelectionWalker:
+
+    """Evaluates field allowances and denials while descending an operation's selection sets.
+
+    Makes the decisions of :func:`check_field_allowances` and :func:`check_field_denials` on
+    ``convert_fields_to_dict(render_fields(...))``, without building that tree first: fragments
+    are inlined one selection set at a time, only for fields a rule has sub-field rules for, and
+    only the argument values a rule inspects are resolved. The walk stops at the first denial.
+
+    A leaf field selected several times under one response key is checked once per selection.
+    """
+
+    def __init__(
+        self,
+        fragments: Mapping[str, FragmentDefinitionNode],
+        variables: dict[str, Any],
+        expansion: FragmentExpansion | None = None,
+    ) -> None:
+        """Create a walker for one request.
+
+        Args:
+            fragments (Mapping[str, FragmentDefinitionNode]): Fragment definitions by name.
+            variables (dict[str, Any]): Variable values for the query.
+            expansion (FragmentExpansion | None): Fragment expansion to collect fragments with. Collected
+                fragments do not depend on the variables, so its memo may be kept with the document.
+
+        """
+        self.fragments = fragments
+        self.variables = variables
+        self.expansion = FragmentExpansion() if expansion is None else expansion
+        # Resolved values are kept for the whole check, which the memo's id() keys rely on.
+        self._argument_values: dict[tuple[int, str], Any] = {}
+        self._memo: ExtractionMemo = {}
+
+    def collect(self, selection_set: SelectionSetNode) -> Selections:
+        """Collect the fields of one selection set by response key, inlining fragments.
+
+        Fragments replace earlier fields with the same response key, as in :func:`render_fields`.
+
+        Args:
+            selection_set (SelectionSetNode): Selection set to collect.
+
+        Returns:
+            Selections: Response keys mapped to their fields, in selection order.
+
+        Raises:
+            FragmentExpansionError: If a fragment spreads itself or too many fields are selected.
+            SelectionConflictError: If a response key is selected both with and without sub-fields.
+
+        """
+        fields: Selections = {}
+        # Keys whose leaf lists came from a fragment; they may be shared and are copied before appending.
+        shared: set[str] = set()
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                self.expansion.spend(1)
+                name = selection.alias.value if selection.alias else selection.name.value
+                check_selection_conflict(fields, name, not selection.selection_set)
+                if selection.selection_set:
+                    fields[name] = selection
+                    shared.discard(name)
+                    continue
+                selected = fields.setdefault(name, [])
+                if name in shared:
+                    selected = fields[name] = selected.copy()
+                    shared.discard(name)
+                selected.append(selection)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self.fragments.get(selection.name.value)
+                if fragment is not None:
+                    collected = self.expansion.expand(
+                        selection.name.value, partial(self.collect, fragment.selection_set),
+                    )
+                    merge_selections(fields, collected)
+                    shared.update(collected)
+            elif isinstance(selection, InlineFragmentNode):
+                if selection.selection_set:
+                    collected = self.collect(selection.selection_set)
+                    merge_selections(fields, collected)
+                    shared.update(collected)
+            else:
+                raise TypeError(f"Unexpected selection node type: {type(selection)}")
+        return fields
+
+    def _sub_fields(self, selected: SelectedField) -> Selections | None:
+        if isinstance(selected, list):
+            return None
+        return self.collect(selected.selection_set) or None
+
+    def _argument_value(self, field: FieldNode, argument_name: str) -> Any:  # noqa: ANN401
+        """Get an argument value of a field, resolved like :func:`render_fields`, or ``_MISSING``."""
+        key = (id(field), argument_name)
+        value = self._argument_values.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        # Like a dict built from the arguments, the last one with a name wins.
+        argument = next((arg for arg in reversed(field.arguments or ()) if arg.name.value == argument_name), None)
+        if argument is None:
+            return _MISSING
+        if isinstance(argument.value, VariableNode):
+            value = graphql_ast_to_dict(self.variables.get(argument.value.name.value))
+        elif isinstance(argument.value, NullValueNode):
+            value = None
+        elif isinstance(argument.value, ConstValueNode):
+            value = argument.value.value
+        elif isinstance(argument.value, ValueNode):
+            value = graphql_ast_to_dict(argument.value)
+        else:
+            raise TypeError(f"Unsupported argument value type: {type(argument.value)}")
+        self._argument_values[key] = value
+        return value
+
+    def _selections(self, selected: SelectedField) -> list[FieldNode]:
+        return selected if isinstance(selected, list) else [selected]
+
+    def check_denials(  # noqa: C901, PLR0912
+        self,
+        fields: Selections,
+        field_denials: list[FieldRule] | tuple[FieldRule, ...],
+        parent_fields: list[str] | None = None,
+    ) -> tuple[bool, str, list[str]]:
+        """Check if any field or argument matches a restriction (deny rule).
+
+        Args:
+            fields (Selections): Fields collected by :meth:`collect`.
+            field_denials (list[FieldRule]): List of deny rules.
+            parent_fields (list[str] | None): Parent field path for nested checks.
+
+        Returns:
+            tuple: (is_allowed, reason, parent_fields)
+
+        """
+        if not field_denials:
+            return True, "No field restrictions to check", parent_fields
+        if parent_fields is None:
+            parent_fields = []
+
+        for field_restriction in field_denials:
+            field_name = field_restriction.field_name
+            if field_name == "*":
+                return False, "Wildcard '*' found in field restrictions, all fields are denied", parent_fields
+            selected = fields.get(field_name)
+            if selected is None:
+                continue
+
+            for arg_restriction in field_restriction.arguments or ():
+                if not arg_restriction.values:
+                    continue
+                for field in self._selections(selected):
+                    arg_value = self._argument_value(field, arg_restriction.argument_name)
+                    if arg_value is _MISSING:
+                        continue
+                    for denied_value, matcher in zip(
+                        arg_restriction.values, arg_restriction.value_matchers, strict=True
+                    ):
+                        if matcher is not None:
+                            # Deny if ANY key/value in denied_value matches
+                            is_denied = matcher.any_match(arg_value, self._memo)
+                        else:
+                            is_denied = arg_value == denied_value
+                        if is_denied:
+                            return (
+                                False,
+                                f"Argument '{arg_restriction.argument_name}' "
+                                f"value '{arg_value}' is forbidden for field '{field_name}'",
+                                [*parent_fields, field_name],
+                            )
+
+            # Field is allowed, check sub-fields if any
+            sub_fields = self._sub_fields(selected)
+            if not sub_fields:
+                continue
+            if not field_restriction.field_rules:
+                reason = f"Field '{field_name}' has sub-fields but no sub-field restrictions defined"
+                return False, reason, parent_fields
+            parent_fields.append(field_name)
+            for sub_field_name, sub_field in sub_fields.items():
+                is_allowed, reason, parent_fields = self.check_denials(
+                    {sub_field_name: sub_field}, field_restriction.field_rules, parent_fields,
+                )
+                if not is_allowed:
+                    return False, reason, parent_fields
+            parent_fields.pop()
+
+        return True, "All field permissions are satisfied.", parent_fields
+
+    def check_allowances(  # noqa: C901, PLR0912
+        self,
+        fields: Selections,
+        field_rules: list[FieldRule] | tuple[FieldRule, ...],
+        parent_fields: list[str] | None = None,
+    ) -> tuple[bool, str, list[str]]:
+        """Check if any field or argument matches an allowance (allow rule).
+
+        Args:
+            fields (Selections): Fields collected by :meth:`collect`.
+            field_rules (list[FieldRule]): List of allow rules.
+            parent_fields (list[str] | None): Parent field path for nested checks.
+
+        Returns:
+            tuple: (is_allowed, reason, parent_fields)
+
+        """
+        if not field_rules:
+            return False, "No field allowances defined, all fields are denied", parent_fields
+        if parent_fields is None:
+            parent_fields = []
+
+        for field_rule in field_rules:
+            field_name = field_rule.field_name
+            if field_name == "*":
+                return True, "Wildcard '*' found in field allowances, all fields are allowed", parent_fields
+            selected = fields.get(field_name)
+            if selected is None:
+                continue
+
+            for arg_rule in field_rule.arguments or ():
+                if not arg_rule.values:
+                    continue
+                for field in self._selections(selected):
+                    arg_value = self._argument_value(field, arg_rule.argument_name)
+                    if arg_value is _MISSING:
+                        continue
+                    # All keys/values of a dict value must match; other values are compared directly
+                    if not any(
+                        matcher.all_match(arg_value, self._memo) if matcher is not None else arg_value == allowed_value
+                        for allowed_value, matcher in zip(arg_rule.values, arg_rule.value_matchers, strict=True)
+                    ):
+                        return (
+                            False,
+                            f"Argument '{arg_rule.argument_name}'"
+                            f"value '{arg_value}' is not allowed for field '{field_name}'",
+                            [*parent_fields, field_name],
+                        )
+
+            # Field is allowed, check sub-fields if any
+            sub_fields = self._sub_fields(selected) if field_rule.field_rules else None
+            if not sub_fields:
+                return True, f"Field '{field_name}' is allowed", [*parent_fields, field_name]
+            parent_fields.append(field_name)
+            for sub_field_name, sub_field in sub_fields.items():
+                is_allowed, reason, parent_fields = self.check_allowances(
+                    {sub_field_name: sub_field}, field_rule.field_rules, parent_fields,
+                )
+                if not is_allowed:
+                    return False, reason, parent_fields
+            parent_fields.pop()
+
+        return False, "No matching field allowances found, access denied", parent_fields
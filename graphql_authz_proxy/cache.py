@@ -0,0 +1,634 @@
+"""Bounded, thread-safe caches shared by the request handling pipeline."""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Collection, Hashable, Iterable, Mapping
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any
+
+from graphql import (
+    ArgumentNode,
+    DocumentNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    OperationDefinitionNode,
+    VariableNode,
+    Visitor,
+    parse,
+    visit,
+)
+
+
+@dataclass(frozen=True)
+class CacheStats:
+
+    """Point-in-time counters for an LRU cache."""
+
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size_bytes: int
+
+    def to_dict(self) -> dict[str, int]:
+        """Return the counters as a JSON-serializable dict.
+
+        Returns:
+            dict[str, int]: Counter names mapped to their values.
+
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": self.entries,
+            "size_bytes": self.size_bytes,
+        }
+
+
+class LRUCache[K: Hashable, V]:
+
+    """Least-recently-used cache bounded by entry count and total size in bytes.
+
+    Every entry is stored with a caller-supplied size. When either the entry limit
+    or the byte limit is exceeded the least recently used entries are evicted.
+    All operations take a lock so one instance can be shared by threaded workers.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int | None = None) -> None:
+        """Create an empty cache.
+
+        Args:
+            max_entries (int): Maximum number of entries kept.
+            max_bytes (int | None): Maximum total size of all entries, or None for no byte limit.
+
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[K, tuple[V, int]] = OrderedDict()
+        self._size_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of cached entries."""
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        """Check membership without touching recency or counters."""
+        return key in self._entries
+
+    def get(self, key: K) -> V | None:
+        """Get a cached value and mark it as most recently used.
+
+        Args:
+            key (K): Cache key.
+
+        Returns:
+            V | None: Cached value, or None on a miss.
+
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key: K, value: V, size: int = 0) -> None:
+        """Insert or replace a value, evicting old entries to stay within the limits.
+
+        Values larger than ``max_bytes`` on their own are not cached.
+
+        Args:
+            key (K): Cache key.
+            value (V): Value to cache.
+            size (int): Size of the value in bytes, counted against ``max_bytes``.
+
+        """
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size_bytes -= previous[1]
+            self._entries[key] = (value, size)
+            self._size_bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._size_bytes > self.max_bytes
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size_bytes -= evicted_size
+                self._evictions += 1
+
+    def clear(self) -> None:
+        """Remove all entries. Counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._size_bytes = 0
+
+    def stats(self) -> CacheStats:
+        """Get the current cache counters.
+
+        Returns:
+            CacheStats: Hits, misses, evictions, entries and total size.
+
+        """
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                entries=len(self._entries),
+                size_bytes=self._size_bytes,
+            )
+
+
+@dataclass(frozen=True)
+class TTLCacheStats:
+
+    """Point-in-time counters for a TTL cache."""
+
+    hits: int
+    stale_hits: int
+    misses: int
+    coalesced: int
+    entries: int
+
+    def to_dict(self) -> dict[str, int]:
+        """Return the counters as a JSON-serializable dict.
+
+        Returns:
+            dict[str, int]: Counter names mapped to their values.
+
+        """
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "entries": self.entries,
+        }
+
+
+@dataclass(frozen=True)
+class _TTLEntry[V]:
+
+    """A cached value with the times until which it is fresh and may be served stale."""
+
+    value: V
+    fresh_until: float
+    stale_until: float
+
+
+class TTLCache[K: Hashable, V]:
+
+    """Cache of loaded values that expire, for results of slow calls such as token validation.
+
+    The loader passed to :meth:`get_or_load` returns the value and how long it may be cached,
+    so callers can keep e.g. negative results for less time than positive ones.
+
+    * Concurrent misses for the same key are coalesced into one call of the loader.
+    * An expired entry is still served for ``stale_ttl`` seconds while one background thread
+      reloads it (stale-while-revalidate).
+    * At most ``max_entries`` entries are kept, least recently used first out.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        stale_ttl: float = 0.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Create an empty cache.
+
+        Args:
+            max_entries (int): Maximum number of entries kept.
+            stale_ttl (float): Seconds an expired entry is served while it is reloaded.
+            clock (Callable[[], float]): Monotonic clock in seconds.
+
+        """
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+        self._entries: LRUCache[K, _TTLEntry[V]] = LRUCache(max_entries=max_entries)
+        self._in_flight: dict[K, Future[V]] = {}
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key: K, load: Callable[[], tuple[V, float]]) -> V:
+        """Get a cached value, loading it if it is missing or expired.
+
+        Args:
+            key (K): Cache key.
+            load (Callable[[], tuple[V, float]]): Returns the value and the seconds it may
+                be cached for; values with a TTL of 0 or less are not cached.
+
+        Returns:
+            V: The cached or loaded value.
+
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            now = self._clock()
+            if now < entry.fresh_until:
+                with self._lock:
+                    self._hits += 1
+                return entry.value
+            if now < entry.stale_until:
+                with self._lock:
+                    self._stale_hits += 1
+                    refresh = key not in self._in_flight
+                    if refresh:
+                        future = self._in_flight[key] = Future()
+                if refresh:
+                    threading.Thread(target=self._load, args=(key, load, future, True), daemon=True).start()
+                return entry.value
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                self._misses += 1
+                future = self._in_flight[key] = Future()
+            else:
+                self._coalesced += 1
+        if not leader:
+            return future.result()
+        return self._load(key, load, future)
+
+    def _load(self, key: K, load: Callable[[], tuple[V, float]], future: Future, background: bool = False) -> V | None:
+        """Call the loader, cache its result and hand it to coalesced callers."""
+        try:
+            value, ttl = load()
+        except BaseException as e:
+            future.set_exception(e)
+            if background:
+                # The stale value stays in place until it runs out.
+                return None
+            raise
+        else:
+            if ttl > 0:
+                now = self._clock()
+                self._entries.put(key, _TTLEntry(value, now + ttl, now + ttl + self.stale_ttl))
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def stats(self) -> TTLCacheStats:
+        """Get the current cache counters.
+
+        Returns:
+            TTLCacheStats: Fresh and stale hits, misses, coalesced loads and entries.
+
+        """
+        with self._lock:
+            return TTLCacheStats(
+                hits=self._hits,
+                stale_hits=self._stale_hits,
+                misses=self._misses,
+                coalesced=self._coalesced,
+                entries=len(self._entries),
+            )
+
+
+def hash_query(query: str) -> str:
+    """Hash GraphQL query text.
+
+    Args:
+        query (str): GraphQL query text.
+
+    Returns:
+        str: Hex encoded SHA-256 digest of the UTF-8 encoded query.
+
+    """
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+def hash_identity(*parts: str) -> str:
+    """Hash identity header values into a cache key, so the raw values are not kept as keys.
+
+    Args:
+        *parts (str): Header values.
+
+    Returns:
+        str: Hex encoded SHA-256 digest of the NUL-separated values.
+
+    """
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+class _DocumentIndexVisitor(Visitor):
+
+    """Collect the arguments each variable is used in, and the fields and fragment spreads of each definition."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.argument_name: str | None = None
+        self.variable_arguments: dict[str, set[str]] = {}
+        self.fragment_name: str | None = None
+        self.fragment_spreads: dict[str, list[str]] = {}
+        self.fragment_field_counts: dict[str, int] = {}
+        self.operation_spreads: list[str] = []
+        self.operation_field_count = 0
+
+    def enter_argument(self, node: ArgumentNode, *_: object) -> None:
+        self.argument_name = node.name.value
+
+    def leave_argument(self, *_: object) -> None:
+        self.argument_name = None
+
+    def enter_variable(self, node: VariableNode, *_: object) -> None:
+        if self.argument_name is not None:
+            self.variable_arguments.setdefault(node.name.value, set()).add(self.argument_name)
+
+    def enter_fragment_definition(self, node: FragmentDefinitionNode, *_: object) -> None:
+        self.fragment_name = node.name.value
+        self.fragment_spreads.setdefault(self.fragment_name, [])
+        self.fragment_field_counts.setdefault(self.fragment_name, 0)
+
+    def leave_fragment_definition(self, *_: object) -> None:
+        self.fragment_name = None
+
+    def enter_field(self, *_: object) -> None:
+        if self.fragment_name is None:
+            self.operation_field_count += 1
+        else:
+            self.fragment_field_counts[self.fragment_name] += 1
+
+    def enter_fragment_spread(self, node: FragmentSpreadNode, *_: object) -> None:
+        if self.fragment_name is None:
+            self.operation_spreads.append(node.name.value)
+        else:
+            self.fragment_spreads[self.fragment_name].append(node.name.value)
+
+
+def find_fragment_cycle(fragment_spreads: Mapping[str, Collection[str]]) -> tuple[str, ...] | None:
+    """Find a fragment that spreads itself, directly or through other fragments.
+
+    Args:
+        fragment_spreads (Mapping[str, Collection[str]]): Names of the fragments each fragment spreads.
+
+    Returns:
+        tuple[str, ...] | None: The fragments of one cycle, starting with the fragment that spreads
+        itself, or None if there is no cycle.
+
+    """
+    done: set[str] = set()
+    for start in sorted(fragment_spreads):
+        if start in done:
+            continue
+        # Iterative depth-first search, so deep fragment chains do not hit the recursion limit.
+        path = [start]
+        on_path = {start}
+        stack = [iter(sorted(fragment_spreads[start]))]
+        while stack:
+            name = next(stack[-1], None)
+            if name is None:
+                stack.pop()
+                finished = path.pop()
+                on_path.discard(finished)
+                done.add(finished)
+                continue
+            if name in on_path:
+                return tuple(path[path.index(name):])
+            if name in done or name not in fragment_spreads:
+                continue
+            path.append(name)
+            on_path.add(name)
+            stack.append(iter(sorted(fragment_spreads[name])))
+    return None
+
+
+def count_expanded_fields(
+    field_count: int,
+    spreads: Iterable[str],
+    fragment_field_counts: Mapping[str, int],
+    fragment_spreads: Mapping[str, Collection[str]],
+) -> int:
+    """Count the fields a selection selects with fragments inlined at every spread.
+
+    Each fragment is counted once, so this takes time linear in the size of the document even
+    when the expanded selection is exponentially larger. The fragments must not form a cycle.
+
+    Args:
+        field_count (int): Number of fields in the selection itself.
+        spreads (Iterable[str]): Names of the fragments spread in the selection, once per spread.
+        fragment_field_counts (Mapping[str, int]): Number of fields in each fragment itself.
+        fragment_spreads (Mapping[str, Collection[str]]): Names of the fragments spread in each
+            fragment, once per spread.
+
+    Returns:
+        int: Number of fields in the expanded selection.
+
+    """
+    totals: dict[str, int] = {}
+    for start in fragment_spreads:
+        stack = [start]
+        while stack:
+            name = stack[-1]
+            if name in totals:
+                stack.pop()
+                continue
+            spreads_of_name = fragment_spreads[name]
+            pending = [spread for spread in spreads_of_name if spread in fragment_spreads and spread not in totals]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            totals[name] = fragment_field_counts[name] + sum(totals.get(spread, 0) for spread in spreads_of_name)
+    return field_count + sum(totals.get(spread, 0) for spread in spreads)
+
+
+# Measured memory of a parsed document per lexer token, including its AST nodes, locations and
+# tokens, rounded up. Parsed documents take roughly 100-250 times the size of their text.
+TOKEN_BYTES = 512
+
+
+def estimate_document_size(query: str, document: DocumentNode) -> int:
+    """Estimate the memory a parsed document and its text take.
+
+    The parser keeps every token of the source linked from the document's location, so the
+    number of tokens is counted from that chain.
+
+    Args:
+        query (str): GraphQL query text.
+        document (DocumentNode): The document parsed from it.
+
+    Returns:
+        int: Estimated size in bytes.
+
+    """
+    tokens = 0
+    token = document.loc.start_token if document.loc else None
+    while token is not None:
+        tokens += 1
+        token = token.next
+    return len(query.encode()) + tokens * TOKEN_BYTES
+
+
+@dataclass(frozen=True)
+class CachedDocument:
+
+    """A parsed GraphQL document together with the text it was parsed from.
+
+    Fragment and operation definitions, the names of the arguments each variable
+    is passed to, fragment cycles and the number of fields the operations select with
+    fragments expanded are indexed once when the document is parsed.
+    Cached documents are shared between requests and must be treated as read-only,
+    except for ``fragment_fields``, which memoizes fragment expansions across requests.
+    """
+
+    query_hash: str
+    query: str
+    document: DocumentNode
+    fragments: dict[str, FragmentDefinitionNode]
+    operations: tuple[OperationDefinitionNode, ...]
+    variable_arguments: dict[str, frozenset[str]]
+    fragment_cycle: tuple[str, ...] | None = None
+    # Fields selected by all operations with fragments inlined; 0 if the fragments form a cycle.
+    expanded_fields: int = 0
+    # Estimated memory of the parsed document and its text, see estimate_document_size.
+    size_bytes: int = 0
+    # Fields collected from each fragment, filled in as fragments are expanded. The values only
+    # depend on the document, so concurrent requests may fill in the same entry.
+    fragment_fields: dict[str, Any] = field(default_factory=dict, compare=False, repr=False)
+
+    @classmethod
+    def from_query(cls, query: str, query_hash: str | None = None) -> "CachedDocument":
+        """Parse a query and index its definitions.
+
+        Args:
+            query (str): GraphQL query text.
+            query_hash (str | None): Precomputed hash of the query, computed if not given.
+
+        Returns:
+            CachedDocument: The parsed document.
+
+        """
+        document = parse(query)
+        fragments = {}
+        operations = []
+        for definition in document.definitions:
+            if isinstance(definition, FragmentDefinitionNode):
+                fragments[definition.name.value] = definition
+            elif isinstance(definition, OperationDefinitionNode):
+                operations.append(definition)
+        visitor = _DocumentIndexVisitor()
+        visit(document, visitor)
+        fragment_cycle = find_fragment_cycle(visitor.fragment_spreads)
+        expanded_fields = 0
+        if fragment_cycle is None:
+            expanded_fields = count_expanded_fields(
+                visitor.operation_field_count,
+                visitor.operation_spreads,
+                visitor.fragment_field_counts,
+                visitor.fragment_spreads,
+            )
+        return cls(
+            query_hash=query_hash or hash_query(query),
+            query=query,
+            document=document,
+            fragments=fragments,
+            operations=tuple(operations),
+            variable_arguments={
+                variable: frozenset(arguments) for variable, arguments in visitor.variable_arguments.items()
+            },
+            fragment_cycle=fragment_cycle,
+            expanded_fields=expanded_fields,
+            size_bytes=estimate_document_size(query, document),
+        )
+
+    def operation_name(self) -> str:
+        """Get the name of the first operation in the document.
+
+        Returns:
+            str: Operation name, or an empty string for anonymous operations.
+
+        """
+        if self.operations and self.operations[0].name:
+            return self.operations[0].name.value
+        return ""
+
+
+class DocumentCache:
+
+    """LRU cache of parsed GraphQL documents keyed by the SHA-256 hash of the query text.
+
+    The key is the same hash clients use for automatic persisted queries, so the cache
+    doubles as the registry of persisted queries.
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int | None = 128 * 1024 * 1024) -> None:
+        """Create an empty document cache.
+
+        Args:
+            max_entries (int): Maximum number of documents kept.
+            max_bytes (int | None): Maximum estimated memory of the cached parsed documents.
+
+        """
+        self._cache: LRUCache[str, CachedDocument] = LRUCache(max_entries=max_entries, max_bytes=max_bytes)
+
+    def parse(self, query: str) -> CachedDocument:
+        """Get the parsed document for a query, parsing and caching it on a miss.
+
+        Args:
+            query (str): GraphQL query text.
+
+        Returns:
+            CachedDocument: The cached, read-only parsed document.
+
+        """
+        query_hash = hash_query(query)
+        cached = self._cache.get(query_hash)
+        if cached is not None:
+            return cached
+        cached = CachedDocument.from_query(query, query_hash)
+        self._cache.put(query_hash, cached, size=cached.size_bytes)
+        return cached
+
+    def is_cached(self, query: str) -> bool:
+        """Check whether a query's document is cached, without touching recency or counters.
+
+        Args:
+            query (str): GraphQL query text.
+
+        Returns:
+            bool: True if :meth:`parse` would return the document without parsing it.
+
+        """
+        return hash_query(query) in self._cache
+
+    def get(self, query_hash: str) -> CachedDocument | None:
+        """Get a previously parsed document by the hash of its query text.
+
+        Args:
+            query_hash (str): Hex encoded SHA-256 digest of the query text.
+
+        Returns:
+            CachedDocument | None: The cached document, or None if it is unknown or was evicted.
+
+        """
+        return self._cache.get(query_hash)
+
+    def stats(self) -> CacheStats:
+        """Get the document cache counters.
+
+        Returns:
+            CacheStats: Hits, misses, evictions, entries and total size.
+
+        """
+        return self._cache.stats()
@@ -3,8 +3,9 @@ import logging
 
 import typer
 
+from graphql_authz_proxy.authz.utils import MAX_EXPANDED_FIELDS
 from graphql_authz_proxy.flask_app import get_flask_app
-from graphql_authz_proxy.gunicorn_runner import run_with_gunicorn
+from graphql_authz_proxy.gunicorn_runner import WSGI_WORKER_CLASSES, run_with_gunicorn
 from graphql_authz_proxy.models import Groups, Users
 
 logging.basicConfig(level=logging.INFO)
@@ -31,13 +32,147 @@ def start(  # noqa: PLR0913
     validate_token: bool = \
         typer.Option(False, help="Enable token validation with the identity provider", envvar="VALIDATE_TOKEN"),
     idp: str = \
-        typer.Option("github", help="Identity provider for token validation (github, azure, custom)", envvar="IDP"),
+        typer.Option(
+            "github",
+            help="Identity provider for token validation (github, azure, oidc, introspection, custom)",
+            envvar="IDP"
+        ),
+    token_cache_ttl: float = \
+        typer.Option(300.0, help="Seconds a validated token is cached", envvar="TOKEN_CACHE_TTL"),
+    token_cache_negative_ttl: float = \
+        typer.Option(30.0, help="Seconds a rejected token is cached", envvar="TOKEN_CACHE_NEGATIVE_TTL"),
+    token_cache_stale_ttl: float = \
+        typer.Option(
+            60.0,
+            help="Seconds an expired token validation is served while it is refreshed",
+            envvar="TOKEN_CACHE_STALE_TTL"
+        ),
+    token_cache_size: int = \
+        typer.Option(10_000, help="Maximum number of cached token validations", envvar="TOKEN_CACHE_SIZE"),
+    oidc_issuer: str | None = \
+        typer.Option(
+            None,
+            help="OIDC issuer URL whose signing keys verify tokens (oidc and azure identity providers)",
+            envvar="OIDC_ISSUER"
+        ),
+    oidc_audience: str | None = \
+        typer.Option(None, help="Expected audience of OIDC access tokens", envvar="OIDC_AUDIENCE"),
+    oidc_jwks_uri: str | None = \
+        typer.Option(None, help="OIDC JWKS URI, to skip issuer discovery", envvar="OIDC_JWKS_URI"),
+    introspection_url: str | None = \
+        typer.Option(None, help="OAuth 2.0 token introspection endpoint URL", envvar="INTROSPECTION_URL"),
+    introspection_client_id: str | None = \
+        typer.Option(None, help="Client ID for the introspection endpoint", envvar="INTROSPECTION_CLIENT_ID"),
+    introspection_client_secret: str | None = \
+        typer.Option(None, help="Client secret for the introspection endpoint", envvar="INTROSPECTION_CLIENT_SECRET"),
+    introspection_max_in_flight: int = \
+        typer.Option(
+            16, help="Maximum concurrent token introspections per worker", envvar="INTROSPECTION_MAX_IN_FLIGHT"
+        ),
     host: str = \
         typer.Option("127.0.0.1", help="Host to run the Flask app on", envvar="HOST"),
     port: int = \
         typer.Option(5000, help="Port to run the Flask app on", envvar="PORT"),
     workers: int = \
         typer.Option(2, help="Number of Gunicorn workers to use", envvar="WORKERS"),
+    worker_class: str = \
+        typer.Option(
+            "sync",
+            help="Gunicorn worker class in sync mode: sync, gthread or gevent",
+            envvar="WORKER_CLASS"
+        ),
+    threads: int = \
+        typer.Option(1, help="Threads per gthread worker", envvar="THREADS"),
+    worker_connections: int = \
+        typer.Option(1000, help="Concurrent clients per gevent worker", envvar="WORKER_CONNECTIONS"),
+    keepalive: int = \
+        typer.Option(2, help="Seconds to wait for requests on a keep-alive connection", envvar="KEEPALIVE"),
+    backlog: int = \
+        typer.Option(2048, help="Maximum number of pending connections", envvar="BACKLOG"),
+    worker_timeout: int = \
+        typer.Option(30, help="Seconds a silent worker is given before it is restarted", envvar="WORKER_TIMEOUT"),
+    graceful_timeout: int = \
+        typer.Option(30, help="Seconds workers get to finish requests on restart", envvar="GRACEFUL_TIMEOUT"),
+    max_requests: int = \
+        typer.Option(0, help="Restart a worker after this many requests (0 disables)", envvar="MAX_REQUESTS"),
+    max_requests_jitter: int = \
+        typer.Option(
+            0, help="Random extra requests before a worker restart", envvar="MAX_REQUESTS_JITTER"
+        ),
+    server_mode: str = \
+        typer.Option(
+            "sync",
+            help="Server mode: sync (Flask on Gunicorn sync workers) or async (asyncio on Uvicorn workers)",
+            envvar="SERVER_MODE"
+        ),
+    document_cache_size: int = \
+        typer.Option(512, help="Maximum number of parsed GraphQL documents to cache", envvar="DOCUMENT_CACHE_SIZE"),
+    document_cache_max_bytes: int = \
+        typer.Option(
+            128 * 1024 * 1024,
+            help="Maximum estimated memory in bytes of cached parsed GraphQL documents",
+            envvar="DOCUMENT_CACHE_MAX_BYTES"
+        ),
+    upstream_pool_size: int = \
+        typer.Option(10, help="Keep-alive connections to the upstream per worker", envvar="UPSTREAM_POOL_SIZE"),
+    upstream_max_connections: int = \
+        typer.Option(
+            100,
+            help="Concurrent upstream connections per worker in async mode",
+            envvar="UPSTREAM_MAX_CONNECTIONS"
+        ),
+    upstream_connect_timeout: float = \
+        typer.Option(
+            5.0, help="Seconds to wait when connecting to the upstream", envvar="UPSTREAM_CONNECT_TIMEOUT"
+        ),
+    upstream_read_timeout: float = \
+        typer.Option(30.0, help="Seconds to wait for upstream response data", envvar="UPSTREAM_READ_TIMEOUT"),
+    upstream_warm_connections: int = \
+        typer.Option(
+            0,
+            help="Upstream connections each worker opens when it boots",
+            envvar="UPSTREAM_WARM_CONNECTIONS"
+        ),
+    stream_threshold: int = \
+        typer.Option(
+            256 * 1024,
+            help="Upstream responses larger than this many bytes (or of unknown size) are streamed",
+            envvar="STREAM_THRESHOLD"
+        ),
+    stream_chunk_size: int = \
+        typer.Option(64 * 1024, help="Chunk size in bytes for streamed responses", envvar="STREAM_CHUNK_SIZE"),
+    decision_cache_size: int = \
+        typer.Option(4096, help="Maximum number of authorization decisions to cache", envvar="DECISION_CACHE_SIZE"),
+    identity_cache_size: int = \
+        typer.Option(
+            4096, help="Maximum number of resolved user and group identities to cache", envvar="IDENTITY_CACHE_SIZE"
+        ),
+    max_expanded_fields: int = \
+        typer.Option(
+            MAX_EXPANDED_FIELDS,
+            help="Maximum number of fields a query may select with its fragments expanded",
+            envvar="MAX_EXPANDED_FIELDS"
+        ),
+    max_batch_size: int = \
+        typer.Option(32, help="Maximum number of operations in a batched request", envvar="MAX_BATCH_SIZE"),
+    proxy_write_methods: bool = \
+        typer.Option(
+            False,
+            help="Proxy POST, PUT, PATCH and DELETE requests to non-GraphQL paths, unauthorized",
+            envvar="PROXY_WRITE_METHODS"
+        ),
+    native_authz: bool = \
+        typer.Option(
+            False,
+            help="Evaluate field allowances and denials with the native rule engine, if the Rust extension is built",
+            envvar="NATIVE_AUTHZ"
+        ),
+    upstream_supports_apq: bool = \
+        typer.Option(
+            False,
+            help="Forward automatic persisted queries as hashes instead of full query text",
+            envvar="UPSTREAM_SUPPORTS_APQ"
+        ),
     healthcheck_path: str = \
         typer.Option("/gqlproxy/health", help="Path for health check endpoint", envvar="HEALTHCHECK_PATH"),
     debug: bool = \
@@ -56,34 +191,146 @@ def start(  # noqa: PLR0913
         enable_config_jinja (bool): Enable Jinja templating in config files.
         validate_token (bool): Enable token validation.
         idp (str): Identity provider name.
+        token_cache_ttl (float): Seconds a validated token is cached.
+        token_cache_negative_ttl (float): Seconds a rejected token is cached.
+        token_cache_stale_ttl (float): Seconds an expired token validation is served while it is refreshed.
+        token_cache_size (int): Maximum number of cached token validations.
+        oidc_issuer (str | None): OIDC issuer URL.
+        oidc_audience (str | None): Expected audience of OIDC access tokens.
+        oidc_jwks_uri (str | None): OIDC JWKS URI.
+        introspection_url (str | None): Token introspection endpoint URL.
+        introspection_client_id (str | None): Client ID for the introspection endpoint.
+        introspection_client_secret (str | None): Client secret for the introspection endpoint.
+        introspection_max_in_flight (int): Maximum concurrent token introspections per worker.
         host (str): Host to bind server.
         port (int): Port to bind server.
         workers (int): Number of Gunicorn workers.
+        worker_class (str): Gunicorn worker class in sync mode (sync, gthread, gevent).
+        threads (int): Threads per gthread worker.
+        worker_connections (int): Concurrent clients per gevent worker.
+        keepalive (int): Keep-alive timeout in seconds.
+        backlog (int): Maximum number of pending connections.
+        worker_timeout (int): Seconds a silent worker is given before it is restarted.
+        graceful_timeout (int): Seconds workers get to finish requests on restart.
+        max_requests (int): Requests after which a worker is restarted, 0 to disable.
+        max_requests_jitter (int): Random extra requests before a worker restart.
+        server_mode (str): ``sync`` to serve the Flask app, ``async`` to serve the asyncio app.
+        document_cache_size (int): Maximum number of cached parsed documents.
+        document_cache_max_bytes (int): Maximum estimated memory of cached parsed documents.
+        upstream_pool_size (int): Keep-alive connections to the upstream per worker.
+        upstream_max_connections (int): Concurrent upstream connections per worker in async mode.
+        upstream_connect_timeout (float): Upstream connect timeout in seconds.
+        upstream_read_timeout (float): Upstream read timeout in seconds.
+        upstream_warm_connections (int): Upstream connections opened when a worker boots.
+        stream_threshold (int): Largest upstream response in bytes that is buffered instead of streamed.
+        stream_chunk_size (int): Chunk size in bytes for streamed responses.
+        decision_cache_size (int): Maximum number of cached authorization decisions.
+        identity_cache_size (int): Maximum number of cached identities.
+        max_expanded_fields (int): Maximum number of fields a query may select with fragments expanded.
+        max_batch_size (int): Maximum number of operations in a batched request.
+        proxy_write_methods (bool): Whether write requests to non-GraphQL paths are proxied.
+        native_authz (bool): Whether the native rule engine evaluates field allowances and denials.
+        upstream_supports_apq (bool): Whether the upstream server understands persisted query hashes.
         healthcheck_path (str): Health check endpoint path.
         debug (bool): Enable Flask debug mode.
         version (bool): Show version and exit.
 
     """
+    if idp == "oidc" and not (oidc_issuer or oidc_jwks_uri):
+        raise typer.BadParameter(
+            "the oidc identity provider needs --oidc-issuer or --oidc-jwks-uri", param_hint="--idp"
+        )
+    if idp == "introspection" and not introspection_url:
+        raise typer.BadParameter("the introspection identity provider needs --introspection-url", param_hint="--idp")
+
     users_config = Users.parse_config(users_config_file)
-    logger.info(f"Users config loaded from {users_config_file}: {len(users_config.users)} users")
+    logger.info(
+        f"Users config loaded from {users_config_file}: {len(users_config.users)} users "
+        f"(indexed in {users_config.index_build_seconds * 1000:.1f} ms)"
+    )
 
     groups_config = Groups.parse_config(groups_config_file)
-    logger.info(f"Groups config loaded from {groups_config_file}: {len(groups_config.groups)} groups")
-
-    flask_app = get_flask_app(
-        upstream_url=upstream_url,
-        upstream_graphql_path=upstream_graphql_path,
-        users_config=users_config,
-        groups_config=groups_config,
-        enable_config_jinja=enable_config_jinja,
-        healthcheck_path=healthcheck_path,
-        debug=debug,
-        version=version,
-        validate_token=validate_token,
-        idp=idp,
+    logger.info(
+        f"Groups config loaded from {groups_config_file}: {len(groups_config.groups)} groups "
+        f"(indexed in {groups_config.index_build_seconds * 1000:.1f} ms)"
     )
 
-    run_with_gunicorn(flask_app, host=host, port=port, workers=workers)
+    app_options = {
+        "upstream_url": upstream_url,
+        "upstream_graphql_path": upstream_graphql_path,
+        "users_config": users_config,
+        "groups_config": groups_config,
+        "enable_config_jinja": enable_config_jinja,
+        "healthcheck_path": healthcheck_path,
+        "version": version,
+        "validate_token": validate_token,
+        "idp": idp,
+        "token_cache_ttl": token_cache_ttl,
+        "token_cache_negative_ttl": token_cache_negative_ttl,
+        "token_cache_stale_ttl": token_cache_stale_ttl,
+        "token_cache_size": token_cache_size,
+        "oidc_issuer": oidc_issuer,
+        "oidc_audience": oidc_audience,
+        "oidc_jwks_uri": oidc_jwks_uri,
+        "introspection_url": introspection_url,
+        "introspection_client_id": introspection_client_id,
+        "introspection_client_secret": introspection_client_secret,
+        "introspection_max_in_flight": introspection_max_in_flight,
+        "document_cache_size": document_cache_size,
+        "document_cache_max_bytes": document_cache_max_bytes,
+        "stream_threshold": stream_threshold,
+        "stream_chunk_size": stream_chunk_size,
+        "decision_cache_size": decision_cache_size,
+        "identity_cache_size": identity_cache_size,
+        "max_expanded_fields": max_expanded_fields,
+        "max_batch_size": max_batch_size,
+        "proxy_write_methods": proxy_write_methods,
+        "native_authz": native_authz,
+        "upstream_pool_size": upstream_pool_size,
+        "upstream_connect_timeout": upstream_connect_timeout,
+        "upstream_read_timeout": upstream_read_timeout,
+        "upstream_warm_connections": upstream_warm_connections,
+        "upstream_supports_apq": upstream_supports_apq,
+    }
+    if server_mode == "sync":
+        if worker_class not in WSGI_WORKER_CLASSES:
+            raise typer.BadParameter(f"must be one of {', '.join(WSGI_WORKER_CLASSES)}", param_hint="--worker-class")
+        concurrency = {"gthread": threads, "gevent": worker_connections}.get(worker_class, threads)
+        if concurrency > upstream_pool_size:
+            logger.warning(
+                f"Each worker serves up to {concurrency} requests at once but keeps only {upstream_pool_size} "
+                "upstream connections alive; consider raising --upstream-pool-size"
+            )
+        app = get_flask_app(**app_options, debug=debug)
+    elif server_mode == "async":
+        if worker_class != "sync":
+            raise typer.BadParameter("async mode always uses Uvicorn workers", param_hint="--worker-class")
+        try:
+            from graphql_authz_proxy.asgi_app import get_asgi_app  # noqa: PLC0415
+        except ImportError as e:
+            raise typer.BadParameter(
+                f"async mode needs the 'async' extra (pip install 'graphql-authz-proxy[async]'): {e!s}",
+                param_hint="--server-mode",
+            ) from e
+        app = get_asgi_app(**app_options, upstream_max_connections=upstream_max_connections)
+    else:
+        raise typer.BadParameter("must be 'sync' or 'async'", param_hint="--server-mode")
+
+    run_with_gunicorn(
+        app,
+        host=host,
+        port=port,
+        workers=workers,
+        worker_class=worker_class,
+        threads=threads,
+        worker_connections=worker_connections,
+        keepalive=keepalive,
+        backlog=backlog,
+        timeout=worker_timeout,
+        graceful_timeout=graceful_timeout,
+        max_requests=max_requests,
+        max_requests_jitter=max_requests_jitter,
+    )
 
 
 if __name__ == "__main__":
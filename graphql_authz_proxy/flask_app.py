@@ -4,8 +4,11 @@ import sys
 
 from flask import Flask, logging
 
+from graphql_authz_proxy.authz.utils import MAX_EXPANDED_FIELDS
 from graphql_authz_proxy.models import Groups, Users
+from graphql_authz_proxy.pipeline import build_config
 from graphql_authz_proxy.routes import register_routes
+from graphql_authz_proxy.upstream import UpstreamClient
 
 
 def get_flask_app(  # noqa: PLR0913
@@ -18,21 +21,83 @@ def get_flask_app(  # noqa: PLR0913
     version: bool = False,
     validate_token: bool = False,
     idp: str = "github",
+    document_cache_size: int = 512,
+    document_cache_max_bytes: int = 128 * 1024 * 1024,
+    upstream_supports_apq: bool = False,
+    decision_cache_size: int = 4096,
+    identity_cache_size: int = 4096,
+    max_expanded_fields: int = MAX_EXPANDED_FIELDS,
+    max_batch_size: int = 32,
+    proxy_write_methods: bool = False,
+    native_authz: bool = False,
+    upstream_pool_size: int = 10,
+    upstream_connect_timeout: float = 5.0,
+    upstream_read_timeout: float = 30.0,
+    upstream_warm_connections: int = 0,
+    stream_threshold: int = 256 * 1024,
+    stream_chunk_size: int = 64 * 1024,
+    token_cache_ttl: float = 300.0,
+    token_cache_negative_ttl: float = 30.0,
+    token_cache_stale_ttl: float = 60.0,
+    token_cache_size: int = 10_000,
+    oidc_issuer: str | None = None,
+    oidc_audience: str | None = None,
+    oidc_jwks_uri: str | None = None,
+    introspection_url: str | None = None,
+    introspection_client_id: str | None = None,
+    introspection_client_secret: str | None = None,
+    introspection_max_in_flight: int = 16,
     debug: bool = False,  # noqa: ARG001
 ) -> Flask:
     """Create and configure the Flask app instance."""
     flask_app = Flask(__name__)
     logging.create_logger(flask_app)
 
-    register_routes(flask_app, graphql_path=upstream_graphql_path, healthcheck_path=healthcheck_path)
+    register_routes(
+        flask_app,
+        graphql_path=upstream_graphql_path,
+        healthcheck_path=healthcheck_path,
+        proxy_write_methods=proxy_write_methods,
+    )
 
-    flask_app.config["users_config"] = users_config
-    flask_app.config["groups_config"] = groups_config
-    flask_app.config["upstream_url"] = upstream_url
-    flask_app.config["upstream_graphql_path"] = upstream_graphql_path
-    flask_app.config["enable_config_jinja"] = enable_config_jinja
-    flask_app.config["validate_token"] = validate_token
-    flask_app.config["idp"] = idp
+    flask_app.config.update(build_config(
+        upstream_url=upstream_url,
+        upstream_graphql_path=upstream_graphql_path,
+        users_config=users_config,
+        groups_config=groups_config,
+        upstream_client=UpstreamClient(
+            upstream_url,
+            pool_size=upstream_pool_size,
+            connect_timeout=upstream_connect_timeout,
+            read_timeout=upstream_read_timeout,
+            warm_connections=upstream_warm_connections,
+        ),
+        enable_config_jinja=enable_config_jinja,
+        validate_token=validate_token,
+        idp=idp,
+        document_cache_size=document_cache_size,
+        document_cache_max_bytes=document_cache_max_bytes,
+        upstream_supports_apq=upstream_supports_apq,
+        decision_cache_size=decision_cache_size,
+        identity_cache_size=identity_cache_size,
+        max_expanded_fields=max_expanded_fields,
+        max_batch_size=max_batch_size,
+        proxy_write_methods=proxy_write_methods,
+        native_authz=native_authz,
+        stream_threshold=stream_threshold,
+        stream_chunk_size=stream_chunk_size,
+        token_cache_ttl=token_cache_ttl,
+        token_cache_negative_ttl=token_cache_negative_ttl,
+        token_cache_stale_ttl=token_cache_stale_ttl,
+        token_cache_size=token_cache_size,
+        oidc_issuer=oidc_issuer,
+        oidc_audience=oidc_audience,
+        oidc_jwks_uri=oidc_jwks_uri,
+        introspection_url=introspection_url,
+        introspection_client_id=introspection_client_id,
+        introspection_client_secret=introspection_client_secret,
+        introspection_max_in_flight=introspection_max_in_flight,
+    ))
 
     if version:
         sys.exit(0)
@@ -1,8 +1,14 @@
-"""Run the FastAPI app with Gunicorn for production deployments."""
-from typing import override
+"""Run the proxy with Gunicorn for production deployments."""
+from typing import TYPE_CHECKING, override
 
 from flask import Flask
 from gunicorn.app.base import BaseApplication
+from gunicorn.workers.base import Worker
+
+from graphql_authz_proxy.upstream import UpstreamClient
+
+if TYPE_CHECKING:
+    from graphql_authz_proxy.asgi_app import AsgiProxy
 
 
 class GunicornApp(BaseApplication):
@@ -10,7 +16,7 @@ class GunicornApp(BaseApplication):
     """Custom Gunicorn application to run a Flask app with specified options."""
 
     @override
-    def __init__(self, app: Flask, options: dict | None = None) -> None:
+    def __init__(self, app: "Flask | AsgiProxy", options: dict | None = None) -> None:
         self.application = app
         self.options = options or {}
         super().__init__()
@@ -21,15 +27,109 @@ class GunicornApp(BaseApplication):
             self.cfg.set(key, value)
 
     @override
-    def load(self) -> "GunicornApp":
+    def load(self) -> "Flask | AsgiProxy":
         return self.application
 
 
-def run_with_gunicorn(app: Flask, host: str, port: int, workers: int = 2) -> None:
-    """Run the Flask app with Gunicorn."""
-    options = {
+def warm_upstream_connections(worker: Worker) -> None:
+    """Gunicorn ``post_worker_init`` hook opening the worker's upstream connections.
+
+    The asyncio server opens its connections on ASGI lifespan startup instead, inside its event loop.
+    """
+    upstream_client = worker.wsgi.config.get("upstream_client")
+    if isinstance(upstream_client, UpstreamClient):
+        upstream_client.warm()
+
+
+def asgi_worker_class() -> str:
+    """Get the Gunicorn worker class that serves ASGI apps with Uvicorn."""
+    try:
+        import uvicorn_worker  # noqa: F401, PLC0415
+    except ImportError:
+        # Older Uvicorn releases ship the worker themselves.
+        return "uvicorn.workers.UvicornWorker"
+    return "uvicorn_worker.UvicornWorker"
+
+
+# Worker classes for the Flask app. gthread serves several requests per process from a
+# thread pool and keeps client connections alive; gevent serves them from greenlets.
+WSGI_WORKER_CLASSES = ("sync", "gthread", "gevent")
+
+
+def gunicorn_options(  # noqa: PLR0913
+    app: "Flask | AsgiProxy",
+    host: str,
+    port: int,
+    *,
+    workers: int = 2,
+    worker_class: str = "sync",
+    threads: int = 1,
+    worker_connections: int = 1000,
+    keepalive: int = 2,
+    backlog: int = 2048,
+    timeout: int = 30,
+    graceful_timeout: int = 30,
+    max_requests: int = 0,
+    max_requests_jitter: int = 0,
+) -> dict:
+    """Build the Gunicorn settings to serve the proxy with.
+
+    The defaults are Gunicorn's own. The ASGI app is always served by Uvicorn workers.
+
+    Args:
+        app (Flask | AsgiProxy): The app to serve.
+        host (str): Host to bind.
+        port (int): Port to bind.
+        workers (int): Number of worker processes.
+        worker_class (str): Worker class for the Flask app, one of ``WSGI_WORKER_CLASSES``.
+        threads (int): Threads per gthread worker.
+        worker_connections (int): Concurrent clients per gevent worker.
+        keepalive (int): Seconds to wait for the next request on a keep-alive connection.
+        backlog (int): Maximum number of pending connections.
+        timeout (int): Seconds a worker may be silent before it is killed and restarted.
+        graceful_timeout (int): Seconds workers get to finish requests on restart.
+        max_requests (int): Requests after which a worker is restarted, 0 to never restart.
+        max_requests_jitter (int): Random extra requests added to ``max_requests`` per worker,
+            so workers do not all restart at once.
+
+    Returns:
+        dict: Gunicorn settings.
+
+    Raises:
+        ValueError: If the worker class is not supported.
+
+    """
+    if isinstance(app, Flask):
+        if worker_class not in WSGI_WORKER_CLASSES:
+            raise ValueError(f"Unsupported worker class '{worker_class}', expected one of {WSGI_WORKER_CLASSES}")
+        # Gunicorn switches sync workers to gthread when threads > 1; make that explicit.
+        resolved_worker_class = "gthread" if worker_class == "sync" and threads > 1 else worker_class
+    else:
+        resolved_worker_class = asgi_worker_class()
+    return {
         "bind": f"{host}:{port}",
         "workers": workers,
+        "worker_class": resolved_worker_class,
+        "threads": threads,
+        "worker_connections": worker_connections,
+        "keepalive": keepalive,
+        "backlog": backlog,
+        "timeout": timeout,
+        "graceful_timeout": graceful_timeout,
+        "max_requests": max_requests,
+        "max_requests_jitter": max_requests_jitter,
+        "post_worker_init": warm_upstream_connections,
     }
 
-    GunicornApp(app, options).run()
+
+def run_with_gunicorn(app: "Flask | AsgiProxy", host: str, port: int, **settings: object) -> None:
+    """Run the Flask app, or the ASGI app on Uvicorn workers, with Gunicorn.
+
+    Args:
+        app (Flask | AsgiProxy): The app to serve.
+        host (str): Host to bind.
+        port (int): Port to bind.
+        **settings: Worker settings, see :func:`gunicorn_options`.
+
+    """
+    GunicornApp(app, gunicorn_options(app, host, port, **settings)).run()
@@ -1,29 +1,26 @@
 
-from graphql_authz_proxy.identity_providers.base import IdentityProvider
+from graphql_authz_proxy.identity_providers.oidc import OIDCIdentityProvider
 
+AZURE_AUTHORITY = "https://login.microsoftonline.com"
 
-class AzureIdentityProvider(IdentityProvider):
-    def validate_token(self, token: str, claimed_username: str | None, claimed_email: str | None) -> tuple[bool, str | None]:
-        """Validate an Azure access token and check claimed identity.
 
-        Args:
-            token (str): Azure access token (JWT).
-            claimed_username (str | None): Username claimed by the user.
-            claimed_email (str | None): Email claimed by the user.
+class AzureIdentityProvider(OIDCIdentityProvider):
+    """Microsoft Entra ID (Azure AD) identity provider.
+
+    Tokens are verified against the tenant's signing keys. The default ``common`` tenant
+    accepts tokens from any tenant, so their issuer is not checked.
+    """
+
+    display_name = "Azure"
+    username_claims = ("preferred_username", "upn")
 
-        Returns:
-            tuple: (is_valid, error_reason_if_any)
+    def __init__(self, issuer: str | None = None, *, tenant_id: str = "common", **options) -> None:
+        """Create the provider.
+
+        Args:
+            issuer (str | None): Issuer URL, defaults to the v2.0 endpoint of ``tenant_id``.
+            tenant_id (str): Directory (tenant) ID or domain.
+            **options: Further settings, see :class:`OIDCIdentityProvider`.
 
         """
-        try:
-            import jwt
-            decoded = jwt.decode(token, options={"verify_signature": False})
-            az_username = decoded.get("preferred_username") or decoded.get("upn")
-            az_email = decoded.get("email")
-            if claimed_username and az_username and claimed_username != az_username:
-                return False, f"Username mismatch: header={claimed_username} azure={az_username}"
-            if claimed_email and az_email and claimed_email != az_email:
-                return False, f"Email mismatch: header={claimed_email} azure={az_email}"
-            return True, None
-        except Exception as e:
-            return False, f"Azure token invalid: {e!s}"
+        super().__init__(issuer or f"{AZURE_AUTHORITY}/{tenant_id}/v2.0", **options)
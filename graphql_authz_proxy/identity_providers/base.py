@@ -1,6 +1,58 @@
+import hashlib
+
+from graphql_authz_proxy.cache import TTLCache, TTLCacheStats
 
 
 class IdentityProvider:
+    """Base class for identity providers.
+
+    Instances are long-lived: one instance validates the tokens of all requests, so
+    providers that call out to the identity provider keep their validation results in
+    ``token_cache``, keyed by a hash of the token.
+    """
+
+    def __init__(
+        self,
+        token_cache_ttl: float = 300.0,
+        token_cache_negative_ttl: float = 30.0,
+        token_cache_stale_ttl: float = 60.0,
+        token_cache_size: int = 10_000,
+    ) -> None:
+        """Create the provider.
+
+        Args:
+            token_cache_ttl (float): Seconds a valid token's identity is cached.
+            token_cache_negative_ttl (float): Seconds a rejected token is cached.
+            token_cache_stale_ttl (float): Seconds an expired entry is served while it is refreshed.
+            token_cache_size (int): Maximum number of cached tokens.
+
+        """
+        self.token_cache_ttl = token_cache_ttl
+        self.token_cache_negative_ttl = token_cache_negative_ttl
+        self.token_cache = TTLCache(max_entries=token_cache_size, stale_ttl=token_cache_stale_ttl)
+
+    @staticmethod
+    def hash_token(token: str) -> str:
+        """Get the cache key for a token, so raw tokens are not kept in memory.
+
+        Args:
+            token (str): Access token.
+
+        Returns:
+            str: Hex SHA-256 digest of the token.
+
+        """
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def cache_stats(self) -> TTLCacheStats:
+        """Get the token cache counters.
+
+        Returns:
+            TTLCacheStats: Token cache counters.
+
+        """
+        return self.token_cache.stats()
+
     def validate_token(self, token: str, claimed_username: str | None, claimed_email: str | None) -> tuple[bool, str | None]:
         """Validate the token and check if the claimed identity matches.
 
@@ -14,3 +66,19 @@ class IdentityProvider:
 
         """
         raise NotImplementedError
+
+    def get_groups(self, token: str, claimed_username: str | None) -> list[str]:
+        """Get the identity provider groups of a validated token's user.
+
+        Called after :meth:`validate_token` accepted the token. Providers that do not
+        know group memberships return no groups.
+
+        Args:
+            token (str): The validated access token.
+            claimed_username (str | None): Username claimed by the user.
+
+        Returns:
+            list[str]: Identity provider group names, as used in ``idp_groups``.
+
+        """
+        return []
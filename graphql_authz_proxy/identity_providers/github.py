@@ -1,15 +1,70 @@
+import logging
 
 import requests
 
 from graphql_authz_proxy.identity_providers.base import IdentityProvider
+from graphql_authz_proxy.upstream import UpstreamClient
+
+logger = logging.getLogger(__name__)
+
+GITHUB_API_URL = "https://api.github.com"
+
+# The user, their organizations and their teams in one request. Teams are filtered by the
+# claimed login; a token of another user fails validation, so its teams are never used.
+USER_QUERY = """
+query($login: String!, $withTeams: Boolean!) {
+  viewer {
+    login
+    email
+    organizations(first: 100) {
+      nodes {
+        login
+        teams(first: 100, userLogins: [$login]) @include(if: $withTeams) {
+          nodes { slug }
+        }
+      }
+    }
+  }
+}
+"""
 
 
 class GitHubIdentityProvider(IdentityProvider):
-    """GitHub identity provider implementation."""
-    
+    """GitHub identity provider implementation.
+
+    The user of a token and the organizations and teams they belong to are read with one
+    GitHub GraphQL API request. Organizations become IdP groups named ``org`` and teams
+    ``org:team-slug``, as oauth2-proxy names them in ``X-Forwarded-Groups``.
+    """
+
+    def __init__(
+        self,
+        api_url: str = GITHUB_API_URL,
+        pool_size: int = 10,
+        timeout: float = 10.0,
+        graphql_url: str | None = None,
+        **cache_options,
+    ) -> None:
+        """Create the provider.
+
+        Args:
+            api_url (str): GitHub API base URL.
+            pool_size (int): Keep-alive connections to the GitHub API per worker.
+            timeout (float): Seconds to wait for the GitHub API.
+            graphql_url (str | None): GitHub GraphQL API URL, defaults to ``{api_url}/graphql``.
+            **cache_options: Token cache settings, see :class:`IdentityProvider`.
+
+        """
+        super().__init__(**cache_options)
+        self.api_url = api_url.rstrip("/")
+        self.graphql_url = graphql_url or f"{self.api_url}/graphql"
+        self.client = UpstreamClient(self.api_url, pool_size=pool_size, connect_timeout=timeout, read_timeout=timeout)
+
     def validate_token(self, token: str, claimed_username: str | None, claimed_email: str | None) -> tuple[bool, str | None]:
         """Validate a GitHub access token and check claimed identity.
 
+        The GitHub user of a token is cached; the claims are checked against it on every call.
+
         Args:
             token (str): GitHub access token.
             claimed_username (str | None): Username claimed by the user.
@@ -19,7 +74,7 @@ class GitHubIdentityProvider(IdentityProvider):
             tuple: (is_valid, error_reason_if_any)
 
         """
-        user_info, _ = self._get_github_user_info(token)
+        user_info = self.get_user_info(token, claimed_username)
         if not user_info:
             return False, "GitHub token invalid"
         gh_username = user_info.get("login")
@@ -30,41 +85,79 @@ class GitHubIdentityProvider(IdentityProvider):
             return False, f"Email mismatch: header={claimed_email} github={gh_email}"
         return True, None
 
-    def _get_github_user_info(self, access_token):
-        """Get GitHub user information and organizations for a given access token.
+    def get_groups(self, token: str, claimed_username: str | None) -> list[str]:
+        """Get the organizations and teams of a validated token's user.
+
+        Args:
+            token (str): The validated GitHub access token.
+            claimed_username (str | None): Username claimed by the user.
+
+        Returns:
+            list[str]: Organization logins and ``org:team-slug`` names.
+
+        """
+        user_info = self.get_user_info(token, claimed_username)
+        return user_info["groups"] if user_info else []
+
+    def get_user_info(self, access_token: str, login: str | None = None) -> dict | None:
+        """Get the GitHub user of an access token, from the token cache if possible.
+
+        Args:
+            access_token (str): GitHub access token.
+            login (str | None): Login whose team memberships to include.
+
+        Returns:
+            dict | None: ``login``, ``email`` and ``groups`` of the user, or None if the token is invalid.
+
+        """
+        if not access_token:
+            return None
+        return self.token_cache.get_or_load(
+            self.hash_token(f"{login or ''}:{access_token}"),
+            lambda: self._fetch_user_info(access_token, login),
+        )
+
+    def _fetch_user_info(self, access_token: str, login: str | None) -> tuple[dict | None, float]:
+        """Get the GitHub user of an access token and their groups from the GitHub API.
 
         Args:
             access_token (str): GitHub access token.
+            login (str | None): Login whose team memberships to include.
 
         Returns:
-            tuple: (user_info dict, user_orgs list)
+            tuple: (user_info dict or None, seconds the result may be cached)
 
         """
         github_api_headers = {
             "Authorization": f"token {access_token}",
-            "Accept": "application/vnd.github.v3+json",
+            "Accept": "application/vnd.github.v4+json",
             "User-Agent": "dagster-api-gateway",
         }
+        variables = {"login": login or "", "withTeams": bool(login)}
         try:
-            user_response = requests.get(
-                "https://api.github.com/user",
-                headers=github_api_headers,
-                timeout=10,
-            )
-            user_info = None
-            if user_response.status_code == 200:
-                user_info = user_response.json()
-            else:
-                return None, []
-            orgs_response = requests.get(
-                "https://api.github.com/user/orgs",
-                headers=github_api_headers,
-                timeout=10,
+            response = self.client.request(
+                "POST", self.graphql_url, headers=github_api_headers, json={"query": USER_QUERY, "variables": variables},
             )
-            user_orgs = []
-            if orgs_response.status_code == 200:
-                orgs = orgs_response.json()
-                user_orgs = [org["login"] for org in orgs]
-            return user_info, user_orgs
-        except Exception:
-            return None, []
+            body = response.json() if response.status_code == 200 else {}
+        except requests.RequestException as e:
+            # Not cached: the next request tries again.
+            logger.warning(f"GitHub token validation failed: {e!s}")
+            return None, 0
+        if response.status_code == 401:
+            return None, self.token_cache_negative_ttl
+        viewer = (body.get("data") or {}).get("viewer")
+        if viewer is None:
+            # Rate limiting and server errors say nothing about the token.
+            logger.warning(f"GitHub token validation failed with status {response.status_code}: {body.get('errors')}")
+            return None, 0
+        if body.get("errors"):
+            # Without the read:org scope, organizations and teams may be partly missing.
+            logger.warning(f"GitHub groups of {viewer['login']} may be incomplete: {body['errors']}")
+        groups = []
+        for organization in (viewer.get("organizations") or {}).get("nodes") or []:
+            if not organization:
+                continue
+            groups.append(organization["login"])
+            teams = (organization.get("teams") or {}).get("nodes") or []
+            groups.extend(f"{organization['login']}:{team['slug']}" for team in teams if team)
+        return {"login": viewer["login"], "email": viewer.get("email") or None, "groups": groups}, self.token_cache_ttl
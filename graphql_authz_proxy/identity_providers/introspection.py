@@ -0,0 +1,153 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import requests
+
+from graphql_authz_proxy.identity_providers.base import IdentityProvider
+from graphql_authz_proxy.upstream import UpstreamClient
+
+logger = logging.getLogger(__name__)
+
+
+class IntrospectionIdentityProvider(IdentityProvider):
+    """Identity provider that checks tokens with an OAuth 2.0 token introspection endpoint (RFC 7662).
+
+    Introspections run on a thread pool of ``max_in_flight`` threads, so a slow
+    introspection endpoint gets at most that many requests at once per worker and a request
+    waits no longer than ``timeout`` for its result. Active tokens are cached until their
+    ``exp``, at most ``token_cache_ttl`` seconds.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        introspection_url: str | None = None,
+        *,
+        client_id: str | None = None,
+        client_secret: str | None = None,
+        max_in_flight: int = 16,
+        pool_size: int = 10,
+        timeout: float = 10.0,
+        **cache_options,
+    ) -> None:
+        """Create the provider.
+
+        Args:
+            introspection_url (str | None): URL of the introspection endpoint.
+            client_id (str | None): Client ID the proxy authenticates to the endpoint with (HTTP Basic).
+            client_secret (str | None): Client secret for ``client_id``.
+            max_in_flight (int): Maximum concurrent introspection requests per worker.
+            pool_size (int): Keep-alive connections to the endpoint per worker.
+            timeout (float): Seconds a request waits for an introspection.
+            **cache_options: Token cache settings, see :class:`IdentityProvider`.
+
+        """
+        if not introspection_url:
+            raise ValueError("Introspection identity provider needs an introspection URL")
+        # A result must not be served after the token expires.
+        cache_options["token_cache_stale_ttl"] = 0
+        super().__init__(**cache_options)
+        self.introspection_url = introspection_url
+        self.auth = (client_id, client_secret or "") if client_id else None
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.client = UpstreamClient(
+            introspection_url, pool_size=max(pool_size, max_in_flight), connect_timeout=timeout, read_timeout=timeout,
+        )
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="token-introspection")
+
+    def validate_token(self, token: str, claimed_username: str | None, claimed_email: str | None) -> tuple[bool, str | None]:
+        """Introspect an access token and check claimed identity.
+
+        Args:
+            token (str): Access token.
+            claimed_username (str | None): Username claimed by the user.
+            claimed_email (str | None): Email claimed by the user.
+
+        Returns:
+            tuple: (is_valid, error_reason_if_any)
+
+        """
+        claims, error = self.introspect(token)
+        if claims is None:
+            return False, f"Token invalid: {error}"
+        username = claims.get("username")
+        email = claims.get("email")
+        if claimed_username and username and claimed_username != username:
+            return False, f"Username mismatch: header={claimed_username} introspection={username}"
+        if claimed_email and email and claimed_email != email:
+            return False, f"Email mismatch: header={claimed_email} introspection={email}"
+        return True, None
+
+    def get_groups(self, token: str, claimed_username: str | None) -> list[str]:  # noqa: ARG002
+        """Get the ``groups`` the introspection endpoint reports for a validated token, if any.
+
+        Args:
+            token (str): The validated access token.
+            claimed_username (str | None): Username claimed by the user.
+
+        Returns:
+            list[str]: Group names from the introspection response.
+
+        """
+        claims, _ = self.introspect(token)
+        groups = claims.get("groups") if claims else None
+        return [str(group) for group in groups] if isinstance(groups, list) else []
+
+    def introspect(self, token: str) -> tuple[dict | None, str | None]:
+        """Get the introspection response of an active token, from the token cache if possible.
+
+        Args:
+            token (str): Access token.
+
+        Returns:
+            tuple: (introspection response or None if the token is not active, error_reason_if_any)
+
+        """
+        if not token:
+            return None, "token missing"
+        return self.token_cache.get_or_load(self.hash_token(token), lambda: self._introspect_in_pool(token))
+
+    def _introspect_in_pool(self, token: str) -> tuple[tuple[dict | None, str | None], float]:
+        future = self._executor.submit(self._introspect, token)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Not cached: the next request tries again.
+            logger.warning(f"Token introspection at {self.introspection_url} timed out")
+            return (None, "introspection timed out"), 0
+
+    def _introspect(self, token: str) -> tuple[tuple[dict | None, str | None], float]:
+        """Call the introspection endpoint.
+
+        Args:
+            token (str): Access token.
+
+        Returns:
+            tuple: ((introspection response or None, error_reason_if_any), seconds the result may be cached)
+
+        """
+        try:
+            response = self.client.request(
+                "POST",
+                self.introspection_url,
+                data={"token": token, "token_type_hint": "access_token"},
+                headers={"Accept": "application/json"},
+                auth=self.auth,
+            )
+            response.raise_for_status()
+            claims = response.json()
+        except requests.RequestException as e:
+            # Not cached: the next request tries again.
+            logger.warning(f"Token introspection failed: {e!s}")
+            return (None, "introspection failed"), 0
+        if not claims.get("active"):
+            return (None, "token not active"), self.token_cache_negative_ttl
+        ttl = self.token_cache_ttl
+        if "exp" in claims:
+            remaining = claims["exp"] - time.time()
+            if remaining <= 0:
+                return (None, "token expired"), self.token_cache_negative_ttl
+            ttl = min(ttl, remaining)
+        return (claims, None), ttl
@@ -1,23 +1,57 @@
 """Module to get identity provider instances by name."""
+import threading
+
 from graphql_authz_proxy.identity_providers.azure import AzureIdentityProvider
 from graphql_authz_proxy.identity_providers.base import IdentityProvider
 from graphql_authz_proxy.identity_providers.custom import CustomIdentityProvider
 from graphql_authz_proxy.identity_providers.github import GitHubIdentityProvider
+from graphql_authz_proxy.identity_providers.introspection import IntrospectionIdentityProvider
+from graphql_authz_proxy.identity_providers.oidc import OIDCIdentityProvider
+
+_providers: dict[tuple, IdentityProvider] = {}
+_providers_lock = threading.Lock()
+
+# Settings that only token-verifying (JWT) providers take.
+OIDC_OPTIONS = ("issuer", "audience", "jwks_uri")
+# Settings that only the introspection provider takes.
+INTROSPECTION_OPTIONS = ("introspection_url", "client_id", "client_secret", "max_in_flight")
+
+_PROVIDERS: dict[str, tuple[type[IdentityProvider], tuple[str, ...]]] = {
+    "github": (GitHubIdentityProvider, ()),
+    "azure": (AzureIdentityProvider, OIDC_OPTIONS),
+    "oidc": (OIDCIdentityProvider, OIDC_OPTIONS),
+    "introspection": (IntrospectionIdentityProvider, INTROSPECTION_OPTIONS),
+}
+_PROVIDER_OPTIONS = frozenset(OIDC_OPTIONS + INTROSPECTION_OPTIONS)
+
 
+def get_identity_provider(idp_name: str, **options) -> IdentityProvider:
+    """Get the identity provider instance for a name.
 
-def get_identity_provider(idp_name: str) -> IdentityProvider:
-    """Get an identity provider instance by name.
+    Providers are long-lived, so their HTTP connections and token caches are shared by all
+    requests. The same name and options always give the same instance.
 
     Args:
-        idp_name (str): Name of the identity provider (github, azure, custom).
+        idp_name (str): Name of the identity provider (github, azure, oidc, introspection, custom).
+        **options: Provider settings, e.g. token cache TTLs. Provider-specific settings
+            (``OIDC_OPTIONS``, ``INTROSPECTION_OPTIONS``) that are None or belong to another
+            provider are left out.
 
     Returns:
         IdentityProvider: Instance of the requested provider.
 
     """
-    if idp_name == "github":
-        return GitHubIdentityProvider()
-    elif idp_name == "azure":
-        return AzureIdentityProvider()
-    else:
-        return CustomIdentityProvider()
\ No newline at end of file
+    provider_class, own_options = _PROVIDERS.get(idp_name, (CustomIdentityProvider, ()))
+    options = {
+        name: value
+        for name, value in options.items()
+        if name not in _PROVIDER_OPTIONS or (name in own_options and value is not None)
+    }
+    key = (idp_name, tuple(sorted(options.items())))
+    provider = _providers.get(key)
+    if provider is None:
+        with _providers_lock:
+            provider = _providers.get(key)
+            if provider is None:
+                provider = _providers[key] = provider_class(**options)
+    return provider
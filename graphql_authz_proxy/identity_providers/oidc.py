@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+
+import jwt
+import requests
+
+from graphql_authz_proxy.identity_providers.base import IdentityProvider
+from graphql_authz_proxy.upstream import UpstreamClient
+
+logger = logging.getLogger(__name__)
+
+# Asymmetric algorithms only: the keys come from a public JWKS.
+DEFAULT_ALGORITHMS = ("RS256", "RS384", "RS512", "PS256", "PS384", "PS512", "ES256", "ES384", "ES512", "EdDSA")
+
+
+class OIDCIdentityProvider(IdentityProvider):
+    """OpenID Connect identity provider that verifies JWT access tokens locally.
+
+    The discovery document and the signing keys (JWKS) are fetched once and kept by key ID.
+    A token signed with an unknown key ID refetches the JWKS, at most once every
+    ``jwks_refresh_interval`` seconds. Verified claims are cached until the token expires.
+    """
+
+    display_name = "OIDC"
+    username_claims: tuple[str, ...] = ("preferred_username",)
+    email_claim = "email"
+
+    def __init__(  # noqa: PLR0913
+        self,
+        issuer: str | None = None,
+        *,
+        audience: str | None = None,
+        jwks_uri: str | None = None,
+        algorithms: tuple[str, ...] = DEFAULT_ALGORITHMS,
+        jwks_refresh_interval: float = 60.0,
+        leeway: float = 30.0,
+        timeout: float = 10.0,
+        **cache_options,
+    ) -> None:
+        """Create the provider. Nothing is fetched until the first token is validated.
+
+        Args:
+            issuer (str | None): Issuer URL; its discovery document gives the JWKS URI and tokens' ``iss`` must match.
+            audience (str | None): Expected ``aud`` claim, or None to accept tokens without one.
+            jwks_uri (str | None): JWKS URI, to skip discovery.
+            algorithms (tuple[str, ...]): Accepted signature algorithms.
+            jwks_refresh_interval (float): Minimum seconds between JWKS fetches.
+            leeway (float): Seconds of clock skew tolerated on ``exp`` and ``nbf``.
+            timeout (float): Seconds to wait for the identity provider.
+            **cache_options: Token cache settings, see :class:`IdentityProvider`.
+
+        """
+        if not issuer and not jwks_uri:
+            raise ValueError(f"{self.display_name} identity provider needs an issuer or a JWKS URI")
+        # Verified claims must not be served after the token expires.
+        cache_options["token_cache_stale_ttl"] = 0
+        super().__init__(**cache_options)
+        self.issuer = issuer.rstrip("/") if issuer else None
+        self.audience = audience
+        self.jwks_uri = jwks_uri
+        self.algorithms = list(algorithms)
+        self.jwks_refresh_interval = jwks_refresh_interval
+        self.leeway = leeway
+        self.client = UpstreamClient(issuer or jwks_uri, connect_timeout=timeout, read_timeout=timeout)
+        self._expected_issuer = self.issuer
+        self._keys: dict[str | None, jwt.PyJWK] = {}
+        self._keys_fetched_at: float | None = None
+        self._keys_lock = threading.Lock()
+
+    def validate_token(self, token: str, claimed_username: str | None, claimed_email: str | None) -> tuple[bool, str | None]:
+        """Verify a JWT access token and check claimed identity.
+
+        Args:
+            token (str): JWT access token.
+            claimed_username (str | None): Username claimed by the user.
+            claimed_email (str | None): Email claimed by the user.
+
+        Returns:
+            tuple: (is_valid, error_reason_if_any)
+
+        """
+        if not token:
+            return False, f"{self.display_name} token missing"
+        claims, error = self.token_cache.get_or_load(self.hash_token(token), lambda: self._verify(token))
+        if claims is None:
+            return False, f"{self.display_name} token invalid: {error}"
+        username = next((claims[claim] for claim in self.username_claims if claims.get(claim)), None)
+        email = claims.get(self.email_claim)
+        label = self.display_name.lower()
+        if claimed_username and username and claimed_username != username:
+            return False, f"Username mismatch: header={claimed_username} {label}={username}"
+        if claimed_email and email and claimed_email != email:
+            return False, f"Email mismatch: header={claimed_email} {label}={email}"
+        return True, None
+
+    def _verify(self, token: str) -> tuple[tuple[dict | None, str | None], float]:
+        """Verify a token's signature and claims.
+
+        Args:
+            token (str): JWT access token.
+
+        Returns:
+            tuple: ((claims or None, error_reason_if_any), seconds the result may be cached)
+
+        """
+        try:
+            key = self.signing_key(jwt.get_unverified_header(token).get("kid"))
+        except (requests.RequestException, KeyError) as e:
+            # Not cached: the next request tries again.
+            logger.warning(f"Could not fetch {self.display_name} signing keys: {e!s}")
+            return (None, "signing keys unavailable"), 0
+        except jwt.PyJWTError as e:
+            return (None, str(e)), self.token_cache_negative_ttl
+        if key is None:
+            if not self._keys:
+                return (None, "signing keys unavailable"), 0
+            return (None, "unknown signing key"), self.token_cache_negative_ttl
+        try:
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=self.algorithms,
+                audience=self.audience,
+                issuer=self._expected_issuer,
+                leeway=self.leeway,
+                options={"require": ["exp"], "verify_aud": self.audience is not None},
+            )
+        except jwt.PyJWTError as e:
+            return (None, str(e)), self.token_cache_negative_ttl
+        return (claims, None), max(0.0, claims["exp"] - time.time())
+
+    def signing_key(self, kid: str | None) -> jwt.PyJWK | None:
+        """Get a signing key by key ID, refetching the JWKS if the ID is unknown.
+
+        Args:
+            kid (str | None): Key ID from the token header.
+
+        Returns:
+            jwt.PyJWK | None: The key, or None if the JWKS has no such key.
+
+        """
+        key = self._lookup_key(kid)
+        if key is None:
+            self._refresh_keys()
+            key = self._lookup_key(kid)
+        return key
+
+    def _lookup_key(self, kid: str | None) -> jwt.PyJWK | None:
+        keys = self._keys
+        if kid is None and len(keys) == 1:
+            return next(iter(keys.values()))
+        return keys.get(kid)
+
+    def _refresh_keys(self) -> None:
+        """Fetch the JWKS, unless it was fetched less than ``jwks_refresh_interval`` seconds ago.
+
+        Failed fetches count as well, so an unreachable identity provider is not retried on every request.
+        """
+        with self._keys_lock:
+            now = time.monotonic()
+            if self._keys_fetched_at is not None and now - self._keys_fetched_at < self.jwks_refresh_interval:
+                return
+            self._keys_fetched_at = now
+            if self.jwks_uri is None:
+                self._discover()
+            response = self.client.request("GET", self.jwks_uri)
+            response.raise_for_status()
+            key_set = jwt.PyJWKSet.from_dict(response.json())
+            self._keys = {key.key_id: key for key in key_set.keys}
+            logger.info(f"Loaded {len(self._keys)} {self.display_name} signing keys from {self.jwks_uri}")
+
+    def _discover(self) -> None:
+        """Read the JWKS URI and issuer from the issuer's discovery document."""
+        response = self.client.request("GET", f"{self.issuer}/.well-known/openid-configuration")
+        response.raise_for_status()
+        document = response.json()
+        self.jwks_uri = document["jwks_uri"]
+        issuer = document.get("issuer", self.issuer)
+        # Multi-tenant issuers such as Azure's "common" carry a placeholder instead of the tenant's issuer.
+        self._expected_issuer = None if "{" in issuer else issuer
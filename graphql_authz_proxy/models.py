@@ -1,14 +1,19 @@
 """Models used throughout the app for users, groups, permissions, and policies."""
 
+from collections.abc import Iterable, Iterator, Mapping
 from enum import Enum
 import json
+import time
 from typing import Any, Optional, TypedDict
 
 import yaml
 from graphql import FieldNode
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, PrivateAttr
 
 import jinja2
+import jinja2.meta
+
+from graphql_authz_proxy.authz.matchers import ObjectMatcher, compile_value_matchers
 
 
 class _ConfigParser:
@@ -57,13 +62,63 @@ class User(BaseModel):
     groups: list[str]
 
 
+class FrozenIndex[K, V](Mapping[K, V]):
+
+    """Read-only mapping used for lookup indexes built once at model construction."""
+
+    def __init__(self, data: dict[K, V]) -> None:
+        """Wrap a dict that must not be modified afterwards."""
+        self._data = data
+
+    def __getitem__(self, key: K) -> V:
+        """Get the value for a key."""
+        return self._data[key]
+
+    def __iter__(self) -> Iterator[K]:
+        """Iterate over the keys."""
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        """Get the number of keys."""
+        return len(self._data)
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        """Get the value for a key, or a default if it is missing."""
+        return self._data.get(key, default)
+
+
 class Users(_ConfigParser, BaseModel):
 
-    """Users model containing a list of User objects."""
+    """Users model containing a list of User objects.
+
+    Lookup indexes by username and email are built once when the model is constructed and
+    are read-only afterwards, so the model is safe to share between threads. Lookups match
+    the configured values exactly, after stripping surrounding whitespace from the looked up value.
+    """
 
     users: list[User]
-    _user_lookup_cache: dict[str, User] = {}
-    _user_email_lookup_cache: dict[str, User] = {}
+
+    _users_by_name: FrozenIndex[str, User] = PrivateAttr(default_factory=lambda: FrozenIndex({}))
+    _users_by_email: FrozenIndex[str, User] = PrivateAttr(default_factory=lambda: FrozenIndex({}))
+    _index_build_seconds: float = PrivateAttr(default=0.0)
+
+    def model_post_init(self, _: None = None) -> None:
+        """Post-init hook to build the username and email indexes."""
+        started = time.perf_counter()
+        users_by_name: dict[str, User] = {}
+        users_by_email: dict[str, User] = {}
+        for user in self.users:
+            # The first user configured with a given name or email wins, as with a linear scan.
+            users_by_name.setdefault(user.username, user)
+            users_by_email.setdefault(user.email, user)
+        self._users_by_name = FrozenIndex(users_by_name)
+        self._users_by_email = FrozenIndex(users_by_email)
+        self._index_build_seconds = time.perf_counter() - started
+
+    @property
+    def index_build_seconds(self) -> float:
+        """Time spent building the lookup indexes, in seconds."""
+        return self._index_build_seconds
 
     def get_user(self, username: str) -> User | None:
         """Get a user by username.
@@ -75,14 +130,7 @@ class Users(_ConfigParser, BaseModel):
             User | None: User object if found, else None.
 
         """
-        if username in self._user_lookup_cache:
-            return self._user_lookup_cache[username]
-
-        for user in self.users:
-            if user.username == username.strip():
-                self._user_lookup_cache[username] = user
-                return user
-        return None
+        return self._users_by_name.get(username.strip())
     
     def get_user_by_email(self, email: str) -> User | None:
         """Get a user by email address.
@@ -94,14 +142,7 @@ class Users(_ConfigParser, BaseModel):
             User | None: User object if found, else None.
 
         """
-        if email in self._user_email_lookup_cache:
-            return self._user_email_lookup_cache[email]
-
-        for user in self.users:
-            if user.email == email.strip():
-                self._user_email_lookup_cache[email] = user
-                return user
-        return None
+        return self._users_by_email.get(email.strip())
 
 
 class PolicyEffect(str, Enum):
@@ -118,6 +159,40 @@ type PrimitiveDict = dict[Primitive, Primitive | PrimitiveDict | PrimitiveList]
 type Serializable = Primitive | PrimitiveDict | PrimitiveList
 
 
+# Values are rendered from their JSON form, so templates compile from that form.
+_JINJA_ENVIRONMENT = jinja2.Environment(autoescape=True)
+_JINJA_MARKERS = ("{{", "{%", "{#")
+
+
+def compile_value_templates(values: list | None) -> tuple[tuple[jinja2.Template | None, ...], frozenset[str]]:
+    """Compile the Jinja templates in the values of an argument rule.
+
+    Args:
+        values (list | None): Allowed or denied values of an argument rule.
+
+    Returns:
+        tuple: One compiled template per templated value and None for plain values, and the
+            names of the variables the templates reference. Values that are not valid templates,
+            e.g. a literal ``"{{ broken"``, are plain values.
+
+    """
+    templates: list[jinja2.Template | None] = []
+    variables: set[str] = set()
+    for value in values or ():
+        serialized = json.dumps(value)
+        if not any(marker in serialized for marker in _JINJA_MARKERS):
+            templates.append(None)
+            continue
+        try:
+            parsed = _JINJA_ENVIRONMENT.parse(serialized)
+        except jinja2.TemplateSyntaxError:
+            templates.append(None)
+            continue
+        variables.update(jinja2.meta.find_undeclared_variables(parsed))
+        templates.append(_JINJA_ENVIRONMENT.from_string(parsed))
+    return tuple(templates), frozenset(variables)
+
+
 class ArgumentRule(BaseModel):
 
     """Argument rule model defining allowed values for a specific GraphQL field argument."""
@@ -125,25 +200,51 @@ class ArgumentRule(BaseModel):
     argument_name: str
     values: list[Serializable] | None
 
-    def render_values(self, template_vars: dict[str, str]) -> list[str]:
-        """Render the argument values as strings for logging or error messages.
+    _value_matchers: tuple[ObjectMatcher | None, ...] = PrivateAttr(default=())
+    _value_templates: tuple[jinja2.Template | None, ...] = PrivateAttr(default=())
+    _template_variables: frozenset[str] = PrivateAttr(default=frozenset())
 
-        Returns:
-            list[str]: List of argument values as strings.
+    def model_post_init(self, _: None = None) -> None:
+        """Post-init hook to compile dict-valued rule values into path matchers and templated values."""
+        self._value_matchers = compile_value_matchers(self.values)
+        self._value_templates, self._template_variables = compile_value_templates(self.values)
 
-        """
-        if not self.values:
-            return self.values
+    @property
+    def value_matchers(self) -> tuple[ObjectMatcher | None, ...]:
+        """Compiled matchers parallel to ``values``: an ObjectMatcher per dict value, else None."""
+        return self._value_matchers
 
-        rendered_values: list[Serializable] = []
-        for value in self.values:
-            serialized = json.dumps(value)
-            environment = jinja2.Environment(autoescape=True)
-            template = environment.from_string(serialized)
-            rendered = template.render(template_vars)
-            rendered_values.append(json.loads(rendered))
+    @property
+    def has_templates(self) -> bool:
+        """Whether any value is a Jinja template."""
+        return any(template is not None for template in self._value_templates)
 
-        self.values = rendered_values
+    @property
+    def template_variables(self) -> frozenset[str]:
+        """Names of the variables the templated values reference."""
+        return self._template_variables
+
+    def render(self, template_vars: dict[str, str]) -> "ArgumentRule":
+        """Render the templated values for one request, leaving this rule unchanged.
+
+        Args:
+            template_vars (dict[str, str]): Template variables for rendering.
+
+        Returns:
+            ArgumentRule: A rule with the rendered values, or this rule if no value is templated.
+
+        """
+        if not self.has_templates:
+            return self
+        values = [
+            value if template is None else json.loads(template.render(template_vars))
+            for value, template in zip(self.values, self._value_templates, strict=True)
+        ]
+        # Rendered values are literals; user-supplied text in them must not be compiled as a template.
+        rendered = self.model_copy(update={"values": values})
+        rendered._value_matchers = compile_value_matchers(values)
+        rendered._value_templates, rendered._template_variables = (), frozenset()
+        return rendered
 
 
 class FieldRule(BaseModel):
@@ -155,6 +256,25 @@ class FieldRule(BaseModel):
     arguments: list[ArgumentRule] | None = None
     field_rules: list["FieldRule"] | None = None
 
+    _has_templates: bool = PrivateAttr(default=False)
+    _template_variables: frozenset[str] = PrivateAttr(default=frozenset())
+
+    def model_post_init(self, _: None = None) -> None:
+        """Post-init hook to collect the templated argument rules in this subtree."""
+        rules = [*(self.arguments or ()), *(self.field_rules or ())]
+        self._has_templates = any(rule.has_templates for rule in rules)
+        self._template_variables = frozenset().union(*(rule.template_variables for rule in rules))
+
+    @property
+    def has_templates(self) -> bool:
+        """Whether any argument rule of this field or its sub-fields has templated values."""
+        return self._has_templates
+
+    @property
+    def template_variables(self) -> frozenset[str]:
+        """Names of the variables referenced by templated argument values of this field or its sub-fields."""
+        return self._template_variables
+
     def is_leaf(self) -> bool:
         """Check if this field rule is a leaf (no sub-field rules).
 
@@ -163,47 +283,71 @@ class FieldRule(BaseModel):
 
         """
         return not self.field_rules
-    
-    def render_argument_values(self, template_vars: dict[str, str]) -> None:
-        """Render all argument rule values using provided template variables.
+
+    def render(self, template_vars: dict[str, str]) -> "FieldRule":
+        """Render all templated argument values for one request, leaving this rule unchanged.
 
         Args:
             template_vars (dict[str, str]): Template variables for rendering.
 
+        Returns:
+            FieldRule: A rule with rendered argument values, or this rule if nothing is templated.
+
         """
-        if self.arguments:
-            for arg_rule in self.arguments:
-                arg_rule.render_values(template_vars)
-        if self.field_rules:
-            for sub_field_rule in self.field_rules:
-                sub_field_rule.render_argument_values(template_vars)
+        if not self._has_templates:
+            return self
+        return FieldRule(
+            field_name=self.field_name,
+            description=self.description,
+            arguments=[rule.render(template_vars) for rule in self.arguments or ()] or self.arguments,
+            field_rules=[rule.render(template_vars) for rule in self.field_rules or ()] or self.field_rules,
+        )
+
+
+_RULE_LISTS = ("query_field_allowances", "mutation_field_allowances", "query_field_denials", "mutation_field_denials")
 
 
 class UserRules(BaseModel):
 
-    """User rules model defining all field allowances and denials for a user."""
+    """User rules model defining all field allowances and denials for a user.
+
+    Rule bundles are shared between requests, so the model is frozen.
+    """
 
-    query_field_allowances: list[FieldRule] | None = None
-    mutation_field_allowances: list[FieldRule] | None = None
-    query_field_denials: list[FieldRule] | None = None
-    mutation_field_denials: list[FieldRule] | None = None
+    model_config = ConfigDict(frozen=True)
 
-    def render_argument_values(self, template_vars: dict[str, str]) -> None:
-        """Render all argument rule values using provided template variables.
+    query_field_allowances: tuple[FieldRule, ...] | None = None
+    mutation_field_allowances: tuple[FieldRule, ...] | None = None
+    query_field_denials: tuple[FieldRule, ...] | None = None
+    mutation_field_denials: tuple[FieldRule, ...] | None = None
+
+    @property
+    def has_templates(self) -> bool:
+        """Whether any rule in the bundle has templated argument values."""
+        return any(rule.has_templates for name in _RULE_LISTS for rule in getattr(self, name) or ())
+
+    @property
+    def template_variables(self) -> frozenset[str]:
+        """Names of the variables referenced by templated argument values in the bundle."""
+        rules = (rule for name in _RULE_LISTS for rule in getattr(self, name) or ())
+        return frozenset().union(*(rule.template_variables for rule in rules))
+
+    def render(self, template_vars: dict[str, str]) -> "UserRules":
+        """Render all templated argument values for one request, leaving the shared bundle unchanged.
 
         Args:
             template_vars (dict[str, str]): Template variables for rendering.
 
+        Returns:
+            UserRules: A bundle with rendered argument values, or this bundle if nothing is templated.
+
         """
-        for field_rule_list in [
-            self.query_field_allowances,
-            self.mutation_field_allowances,
-            self.query_field_denials,
-            self.mutation_field_denials,
-        ]:
-            if field_rule_list:
-                for field_rule in field_rule_list:
-                    field_rule.render_argument_values(template_vars)
+        updates = {}
+        for name in _RULE_LISTS:
+            rules: tuple[FieldRule, ...] | None = getattr(self, name)
+            if rules and any(rule.has_templates for rule in rules):
+                updates[name] = tuple(rule.render(template_vars) for rule in rules)
+        return self.model_copy(update=updates) if updates else self
 
 
 class QueryPolicy(BaseModel):
@@ -250,6 +394,51 @@ class Permissions(BaseModel):
             self.queries = QueryPolicy(effect=PolicyEffect.DENY)
 
 
+class FieldCost(BaseModel):
+
+    """Cost of selecting a field, by field name."""
+
+    field_name: str
+    weight: float | None = None
+    list_size: int | None = None
+
+
+class CostPolicy(BaseModel):
+
+    """Query cost budget of a group.
+
+    Every selected field costs its weight, multiplied by the list sizes of the fields it is
+    selected under. A field's list size is the value of its first list size argument
+    (e.g. ``first: 50``), else its configured ``list_size``, else 1. An ``unlimited`` budget
+    lifts the limits of the user's other groups.
+    """
+
+    unlimited: bool = False
+    max_cost: float | None = None
+    max_depth: int | None = None
+    default_weight: float = 1.0
+    list_size_arguments: list[str] = ["first", "last", "limit"]
+    fields: list[FieldCost] | None = None
+
+    _field_costs: FrozenIndex[str, FieldCost] = PrivateAttr(default_factory=lambda: FrozenIndex({}))
+
+    def model_post_init(self, _: None = None) -> None:
+        """Post-init hook to index the field costs by field name."""
+        self._field_costs = FrozenIndex({field_cost.field_name: field_cost for field_cost in self.fields or ()})
+
+    def field_cost(self, field_name: str) -> FieldCost | None:
+        """Get the configured cost of a field.
+
+        Args:
+            field_name (str): Name of the field (not its alias).
+
+        Returns:
+            FieldCost | None: The field's cost, or None if it has the default weight and no list size.
+
+        """
+        return self._field_costs.get(field_name)
+
+
 class Group(BaseModel):
 
     """Group model with name and associated permissions."""
@@ -258,6 +447,7 @@ class Group(BaseModel):
     permissions: Permissions
     description: str | None = None
     idp_groups: list[str] | None = None
+    cost: CostPolicy | None = None
 
 
 class Groups(_ConfigParser, BaseModel):
@@ -267,52 +457,56 @@ class Groups(_ConfigParser, BaseModel):
     groups: list[Group]
     default_groups: list[str] | None = None
 
-    _group_lookup_cache: dict[str, Group] = {}
+    _groups_by_name: FrozenIndex[str, Group] = PrivateAttr(default_factory=lambda: FrozenIndex({}))
+    _idp_group_mapping: FrozenIndex[str, tuple[str, ...]] = PrivateAttr(default_factory=lambda: FrozenIndex({}))
+    _index_build_seconds: float = PrivateAttr(default=0.0)
 
     def model_post_init(self, _: None = None) -> None:
-        """Post-init hook to initialize group lookup cache."""
-        self._idp_group_mapping: dict[str, list[str]] = {}
+        """Post-init hook to build the group name and IdP group indexes."""
+        started = time.perf_counter()
+        groups_by_name: dict[str, Group] = {}
+        idp_group_mapping: dict[str, list[str]] = {}
         for group in self.groups:
+            groups_by_name.setdefault(group.name, group)
             if group.idp_groups:
                 for idp_group in group.idp_groups:
-                    if idp_group not in self._idp_group_mapping:
-                        self._idp_group_mapping[idp_group] = []
-                    self._idp_group_mapping[idp_group].append(group.name)
-
-    def get_idp_groups(self, user_idp_groups: list[str]) -> list[str]:
+                    idp_group_mapping.setdefault(idp_group, []).append(group.name)
+        self._groups_by_name = FrozenIndex(groups_by_name)
+        self._idp_group_mapping = FrozenIndex(
+            {idp_group: tuple(names) for idp_group, names in idp_group_mapping.items()}
+        )
+        self._index_build_seconds = time.perf_counter() - started
+
+    @property
+    def index_build_seconds(self) -> float:
+        """Time spent building the lookup indexes, in seconds."""
+        return self._index_build_seconds
+
+    def get_idp_groups(self, user_idp_groups: Iterable[str]) -> frozenset[str]:
         """Get local group names mapped from IdP group names.
 
         Args:
-            user_idp_groups (list[str]): List of user IdP group names.
+            user_idp_groups (Iterable[str]): User IdP group names.
 
         Returns:
-            list[str]: List of local group names.
+            frozenset[str]: Local group names.
         """
-        local_groups = []
-        for idp_group in user_idp_groups:
-            local_groups.extend(self._idp_group_mapping.get(idp_group, []))
-        return local_groups
+        mapping = self._idp_group_mapping
+        if not mapping:
+            return frozenset()
+        return frozenset(name for idp_group in user_idp_groups for name in mapping.get(idp_group, ()))
 
     def get_group(self, group_name: str) -> Group | None:
         """Get a group by name.
 
         Args:
             group_name (str): Name of the group to look up.
-            idp_group_mapping (dict[str, str] | None): Optional mapping of IdP group names to local group names.
 
         Returns:
             Group | None: Group object if found, else None.
 
         """
-        if group_name in self._group_lookup_cache:
-            return self._group_lookup_cache[group_name]
-
-        for group in self.groups:
-            if group.name == group_name.strip():
-                self._group_lookup_cache[group_name] = group
-                return group
-
-        return None
+        return self._groups_by_name.get(group_name.strip())
 
 # Recursive type representing an intermediate representation of parsed GraphQL document
 type RenderedFields = dict[str, list[FieldNode] | RenderedFields]
@@ -0,0 +1,880 @@
+"""Parse, identify and authorize steps of the GraphQL proxy, independent of the web framework.
+
+The Flask routes and the asyncio server both run these steps, so they give the same
+responses for the same requests. Settings and shared state are read from a config
+mapping: the Flask app config, or a plain dict for the asyncio server.
+"""
+
+import json
+import logging
+import posixpath
+from collections.abc import Iterable, Mapping, MutableMapping
+from dataclasses import dataclass, replace
+from typing import Any
+from urllib.parse import parse_qs, urljoin
+
+from graphql import GraphQLError, OperationType
+
+from graphql_authz_proxy.authz.cost import check_query_cost
+from graphql_authz_proxy.authz.policy import CompiledPolicy, OperationAccess
+from graphql_authz_proxy.authz.utils import (
+    MAX_EXPANDED_FIELDS,
+    FragmentExpansion,
+    SelectionConflictError,
+    extract_user_from_headers,
+    field_trees,
+    fragment_cycle_message,
+    sniff_operation_types,
+)
+from graphql_authz_proxy.authz.walker import SelectionWalker
+from graphql_authz_proxy.cache import CachedDocument, DocumentCache, LRUCache, hash_identity, hash_query
+from graphql_authz_proxy.identity_providers.base import IdentityProvider
+from graphql_authz_proxy.identity_providers.main import get_identity_provider
+from graphql_authz_proxy.models import Groups, User, UserRules, Users
+
+logger = logging.getLogger(__name__)
+
+# The Flask app config, or the dict the asyncio server keeps in its place.
+type ProxyConfig = MutableMapping[str, Any]
+
+# Methods proxied to non-GraphQL paths only with the ``proxy_write_methods`` config value.
+WRITE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+
+def build_config(  # noqa: PLR0913
+    *,
+    upstream_url: str,
+    upstream_graphql_path: str,
+    users_config: Users,
+    groups_config: Groups,
+    upstream_client: object,
+    enable_config_jinja: bool = False,
+    validate_token: bool = False,
+    idp: str = "github",
+    document_cache_size: int = 512,
+    document_cache_max_bytes: int = 128 * 1024 * 1024,
+    upstream_supports_apq: bool = False,
+    decision_cache_size: int = 4096,
+    identity_cache_size: int = 4096,
+    max_expanded_fields: int = MAX_EXPANDED_FIELDS,
+    max_batch_size: int = 32,
+    proxy_write_methods: bool = False,
+    native_authz: bool = False,
+    stream_threshold: int = 256 * 1024,
+    stream_chunk_size: int = 64 * 1024,
+    token_cache_ttl: float = 300.0,
+    token_cache_negative_ttl: float = 30.0,
+    token_cache_stale_ttl: float = 60.0,
+    token_cache_size: int = 10_000,
+    oidc_issuer: str | None = None,
+    oidc_audience: str | None = None,
+    oidc_jwks_uri: str | None = None,
+    introspection_url: str | None = None,
+    introspection_client_id: str | None = None,
+    introspection_client_secret: str | None = None,
+    introspection_max_in_flight: int = 16,
+) -> dict[str, Any]:
+    """Build the proxy config shared by the Flask app and the asyncio server.
+
+    Rule bundles for the group sets of all configured users are compiled here, ahead of
+    the first request.
+
+    Returns:
+        dict[str, Any]: The proxy config.
+
+    """
+    policy = CompiledPolicy(groups_config, decision_cache_size=decision_cache_size, native_authz=native_authz)
+    policy.warm(frozenset(user.groups) for user in users_config.users)
+    return {
+        "users_config": users_config,
+        "groups_config": groups_config,
+        "policy": policy,
+        "upstream_url": upstream_url,
+        "upstream_client": upstream_client,
+        "upstream_graphql_path": upstream_graphql_path,
+        "stream_threshold": stream_threshold,
+        "stream_chunk_size": stream_chunk_size,
+        "enable_config_jinja": enable_config_jinja,
+        "validate_token": validate_token,
+        "idp": idp,
+        "identity_provider": get_identity_provider(
+            idp,
+            token_cache_ttl=token_cache_ttl,
+            token_cache_negative_ttl=token_cache_negative_ttl,
+            token_cache_stale_ttl=token_cache_stale_ttl,
+            token_cache_size=token_cache_size,
+            issuer=oidc_issuer,
+            audience=oidc_audience,
+            jwks_uri=oidc_jwks_uri,
+            introspection_url=introspection_url,
+            client_id=introspection_client_id,
+            client_secret=introspection_client_secret,
+            max_in_flight=introspection_max_in_flight,
+        ),
+        "upstream_supports_apq": upstream_supports_apq,
+        "document_cache": DocumentCache(max_entries=document_cache_size, max_bytes=document_cache_max_bytes),
+        "identity_cache": LRUCache(max_entries=identity_cache_size),
+        "max_expanded_fields": max_expanded_fields,
+        "max_batch_size": max_batch_size,
+        "proxy_write_methods": proxy_write_methods,
+        "identity_cache_configs": (users_config, groups_config),
+    }
+
+
+def error_body(message: str, code: str, **extensions: Any) -> dict:  # noqa: ANN401
+    """Build a GraphQL error response body.
+
+    Args:
+        message (str): Error message.
+        code (str): Error code, put in the error extensions.
+        **extensions: Further error extensions.
+
+    Returns:
+        dict: The response body.
+
+    """
+    return {
+        "errors": [{
+            "message": message,
+            "extensions": {"code": code, **extensions},
+        }],
+    }
+
+
+class ProxyError(Exception):
+
+    """Raised by a pipeline step to answer the request with a GraphQL error."""
+
+    def __init__(self, message: str, code: str, status: int, **extensions: Any) -> None:  # noqa: ANN401
+        """Create the error with the GraphQL error code and HTTP status to respond with."""
+        super().__init__(message)
+        self.message = message
+        self.code = code
+        self.status = status
+        self.extensions = extensions
+
+    def body(self) -> dict:
+        """Get the response body for this error.
+
+        Returns:
+            dict: The GraphQL error response body.
+
+        """
+        return error_body(self.message, self.code, **self.extensions)
+
+
+class PersistedQueryError(ProxyError):
+
+    """Raised when an automatic persisted query request cannot be resolved."""
+
+
+@dataclass(frozen=True)
+class GraphQLRequest:
+
+    """A parsed GraphQL request and the body to forward upstream if it is allowed."""
+
+    document: CachedDocument
+    variables: dict
+    operation_name: str
+    forward_body: bytes
+
+
+@dataclass(frozen=True)
+class Identity:
+
+    """The user a request was made for and the groups their rules come from."""
+
+    user: User | None
+    username: str
+    user_email: str
+    access_token: str
+    group_names: frozenset[str]
+
+
+def is_json_content_type(content_type: str) -> bool:
+    """Check whether a Content-Type header denotes JSON, as Flask's ``request.is_json`` does.
+
+    Args:
+        content_type (str): Content-Type header value.
+
+    Returns:
+        bool: True for ``application/json`` and ``application/*+json``.
+
+    """
+    mimetype = content_type.split(";", 1)[0].strip().lower()
+    return mimetype == "application/json" or (mimetype.startswith("application/") and mimetype.endswith("+json"))
+
+
+def upstream_graphql_url(config: ProxyConfig) -> str:
+    """Get the URL of the upstream GraphQL endpoint.
+
+    Args:
+        config (ProxyConfig): Proxy config.
+
+    Returns:
+        str: Absolute URL.
+
+    """
+    return urljoin(config["upstream_url"], config["upstream_graphql_path"])
+
+
+def get_policy(config: ProxyConfig) -> CompiledPolicy:
+    """Get the compiled policy, recompiling it if the groups config was replaced.
+
+    Replacing the compiled policy drops its rule bundles and cached decisions.
+
+    Args:
+        config (ProxyConfig): Proxy config.
+
+    Returns:
+        CompiledPolicy: The policy compiled from the current groups config.
+
+    """
+    groups_config: Groups = config["groups_config"]
+    policy: CompiledPolicy = config["policy"]
+    if policy.groups_config is not groups_config:
+        policy = CompiledPolicy(
+            groups_config,
+            decision_cache_size=policy.decision_cache_size,
+            rendered_cache_size=policy.rendered_cache_size,
+            native_authz=policy.native_authz,
+        )
+        config["policy"] = policy
+    return policy
+
+
+def _identity_cache(config: ProxyConfig) -> LRUCache[str, tuple[User | None, frozenset[str]]]:
+    """Get the identity cache, clearing it if the users or groups config was replaced."""
+    identity_cache: LRUCache[str, tuple[User | None, frozenset[str]]] = config["identity_cache"]
+    configs = (config["users_config"], config["groups_config"])
+    cached_configs = config["identity_cache_configs"]
+    if cached_configs[0] is not configs[0] or cached_configs[1] is not configs[1]:
+        identity_cache.clear()
+        config["identity_cache_configs"] = configs
+    return identity_cache
+
+
+def _identity_provider(config: ProxyConfig) -> IdentityProvider:
+    """Get the identity provider of the config, or the default instance for the configured name."""
+    return config.get("identity_provider") or get_identity_provider(config.get("idp", "github"))
+
+
+def health_status(config: ProxyConfig) -> dict:
+    """Get the health check response body.
+
+    Args:
+        config (ProxyConfig): Proxy config.
+
+    Returns:
+        dict: Service status, enabled features, config status and cache and connection statistics.
+
+    """
+    groups: Groups = config["groups_config"]
+    document_cache: DocumentCache = config["document_cache"]
+    policy = get_policy(config)
+    return {
+        "status": "healthy",
+        "service": "graphql-authz-proxy",
+        "features": {
+            "graphql_parsing": True,
+            "mutation_detection": True,
+            "github_integration": True,
+            "config_driven_auth": True,
+            "parameter_validation": True,
+            "jsonpath_support": True,
+        },
+        "authorization": {
+            "groups_configured": len(groups.groups),
+            "rule_bundles_compiled": policy.bundle_count(),
+        },
+        "caches": {
+            "documents": document_cache.stats().to_dict(),
+            "decisions": policy.decision_stats().to_dict(),
+            "rendered_rules": policy.rendered_stats().to_dict(),
+            "identities": _identity_cache(config).stats().to_dict(),
+            "tokens": _identity_provider(config).cache_stats().to_dict(),
+        },
+        "upstream": config["upstream_client"].stats(),
+    }
+
+
+def _resolve_persisted_query(
+    data: dict,
+    document_cache: DocumentCache,
+    upstream_supports_apq: bool,
+) -> tuple[CachedDocument, bytes | None]:
+    """Resolve an Apollo-style automatic persisted query.
+
+    A request with both ``query`` and ``extensions.persistedQuery.sha256Hash`` registers
+    the query under its hash. A request with only the hash is served from the registry.
+
+    Returns:
+        tuple: (cached_document, body to forward upstream or None to forward the original body)
+
+    """
+    persisted_query = data["extensions"]["persistedQuery"]
+    if persisted_query.get("version", 1) != 1:
+        raise PersistedQueryError("Unsupported persisted query version", "PERSISTED_QUERY_NOT_SUPPORTED", 400)
+    query_hash = str(persisted_query.get("sha256Hash", "")).lower()
+    query = data.get("query")
+    if query:
+        if hash_query(query) != query_hash:
+            raise PersistedQueryError("Provided sha256Hash does not match query", "BAD_REQUEST", 400)
+        cached = document_cache.parse(query)
+    else:
+        cached = document_cache.get(query_hash)
+        if cached is None:
+            # Clients retry with the full query when they see this error.
+            raise PersistedQueryError("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND", 200)
+
+    if upstream_supports_apq:
+        return cached, None
+    upstream_data = {**data, "query": cached.query}
+    extensions = {key: value for key, value in data["extensions"].items() if key != "persistedQuery"}
+    if extensions:
+        upstream_data["extensions"] = extensions
+    else:
+        upstream_data.pop("extensions")
+    return cached, json.dumps(upstream_data).encode()
+
+
+def _parse_json_request(config: ProxyConfig, data: dict | None, body: bytes | None) -> GraphQLRequest:
+    """Parse a GraphQL request from a decoded JSON object.
+
+    Args:
+        config (ProxyConfig): Proxy config.
+        data (dict | None): The decoded request object.
+        body (bytes | None): Raw body the object was decoded from, or None to forward the object re-encoded.
+
+    Returns:
+        GraphQLRequest: The parsed request.
+
+    """
+    document_cache: DocumentCache = config["document_cache"]
+    variables = (data.get("variables") or {}) if data else {}
+    operation_name = data.get("operationName", "") if data else ""
+    if data and isinstance(data.get("extensions"), dict) and "persistedQuery" in data["extensions"]:
+        cached, forward_body = _resolve_persisted_query(
+            data, document_cache, config.get("upstream_supports_apq", False),
+        )
+        if forward_body is None:
+            forward_body = body if body is not None else json.dumps(data).encode()
+        return GraphQLRequest(
+            document=cached,
+            variables=variables,
+            operation_name=operation_name or cached.operation_name(),
+            forward_body=forward_body,
+        )
+    query = data.get("query", "") if data else ""
+    return GraphQLRequest(
+        document=document_cache.parse(query),
+        variables=variables,
+        operation_name=operation_name,
+        forward_body=body if body is not None else json.dumps(data).encode(),
+    )
+
+
+def decode_graphql_body(body: bytes, content_type: str) -> Any:  # noqa: ANN401
+    """Decode a GraphQL request body once, for :func:`authorize_without_parsing` and :func:`parse_graphql_request`.
+
+    Args:
+        body (bytes): Raw request body.
+        content_type (str): Content-Type header of the request.
+
+    Returns:
+        Any: The decoded JSON value, or a request object with the ``query`` field of a form body.
+
+    """
+    if is_json_content_type(content_type):
+        return json.loads(body)
+    form = parse_qs(body.decode(), keep_blank_values=True)
+    return {"query": form.get("query", [""])[0]}
+
+
+def is_parsed(config: ProxyConfig, data: Any) -> bool:  # noqa: ANN401
+    """Check whether parsing a decoded request would find its document in the document cache.
+
+    Args:
+        config (ProxyConfig): Proxy config.
+        data (Any): The body as decoded by :func:`decode_graphql_body`.
+
+    Returns:
+        bool: False if the request carries query text that has not been parsed yet.
+
+    """
+    query = data.get("query") if isinstance(data, dict) else None
+    if not isinstance(query, str) or not query:
+        return True
+    document_cache: DocumentCache = config["document_cache"]
+    return document_cache.is_cached(query)
+
+
+def parse_graphql_request(
+    config: ProxyConfig,
+    body: bytes,
+    content_type: str,
+    data: Any = None,  # noqa: ANN401
+) -> GraphQLRequest:
+    """Parse GraphQL query, variables, and operation name from a request body.
+
+    The body is forwarded as it is unless a persisted query had to be expanded.
+
+    Args:
+        config (ProxyConfig): Proxy config.
+        body (bytes): Raw request body.
+        content_type (str): Content-Type header of the request.
+        data (Any): The body as decoded by :func:`decode_graphql_body`, or None to decode it here.
+
+    Returns:
+        GraphQLRequest: The parsed request.
+
+    """
+    if data is None:
+        data = decode_graphql_body(body, content_type)
+    return _parse_json_request(config, data, body)
+
+
+def is_graphql_path(path: str, graphql_path: str) -> bool:
+    """Check whether a path names the GraphQL endpoint once dot segments and repeated slashes are resolved.
+
+    Write requests to such paths are not proxied unauthorized, since the upstream client
+    resolves e.g. ``/x/../graphql`` to the GraphQL endpoint before sending the request.
+
+    Args:
+        path (str): Request path.
+        graphql_path (str): Path of the GraphQL endpoint.
+
+    Returns:
+        bool: True if the path is the GraphQL endpoint's path.
+
+    """
+    return _normalize_path(path) == _normalize_path(graphql_path)
+
+
+def _normalize_path(path: str) -> str:
+    # normpath keeps exactly two leading slashes, so prefix one to collapse them too.
+    return posixpath.normpath(f"/{path}").strip("/")
+
+
+def is_batch_request(body: bytes, content_type: str) -> bool:
+    """Check whether a request body is a batch of GraphQL requests (a JSON array).
+
+    Args:
+        body (bytes): Raw request body.
+        content_type (str): Content-Type header of the request.
+
+    Returns:
+        bool: True for a JSON array body.
+
+    """
+    return is_json_content_type(content_type) and body.lstrip().startswith(b"[")
+
+
+def parse_graphql_batch(config: ProxyConfig, body: bytes) -> list[GraphQLRequest | ProxyError]:
+    """Parse each request of a batched request body.
+
+    Requests that cannot be parsed get an error in their place, so the other requests of the
+    batch are still served. Each request is forwarded on its own, re-encoded.
+
+    Args:
+        config (ProxyConfig): Proxy config.
+        body (bytes): Raw request body, a JSON array of request objects.
+
+    Returns:
+        list: The parsed request or the error for it, for each request in the batch.
+
+    Raises:
+        ProxyError: If the batch is empty or larger than the ``max_batch_size`` config value.
+
+    """
+    batch = json.loads(body)
+    max_batch_size = config.get("max_batch_size", 32)
+    if not batch:
+        raise ProxyError("Batch contains no operations.", "BAD_REQUEST", 400)
+    if len(batch) > max_batch_size:
+        raise ProxyError(
+            f"Batch of {len(batch)} operations exceeds the limit of {max_batch_size}.", "BAD_REQUEST", 400,
+        )
+    requests: list[GraphQLRequest | ProxyError] = []
+    for data in batch:
+        if not isinstance(data, dict):
+            requests.append(ProxyError("Batched operations must be JSON objects.", "BAD_REQUEST", 400))
+            continue
+        try:
+            requests.append(_parse_json_request(config, data, None))
+        except ProxyError as e:
+            requests.append(e)
+        except GraphQLError as e:
+            requests.append(ProxyError(e.message, "GRAPHQL_PARSE_FAILED", 400))
+    return requests
+
+
+def authorize_batch(
+    config: ProxyConfig,
+    identity: Identity,
+    requests: list[GraphQLRequest | ProxyError],
+    headers: Mapping[str, str],
+) -> list[GraphQLRequest | ProxyError]:
+    """Authorize each request of a batch on its own.
+
+    Args:
+        config (ProxyConfig): Proxy config.
+        identity (Identity): The identity the batch was made for.
+        requests (list): Parsed requests, or errors for requests that could not be parsed.
+        headers (Mapping[str, str]): Request headers, available to Jinja templates.
+
+    Returns:
+        list: The request if it is allowed, else the error for it, in batch order.
+
+    """
+    authorized: list[GraphQLRequest | ProxyError] = []
+    for graphql_request in requests:
+        if isinstance(graphql_request, GraphQLRequest):
+            try:
+                authorize(config, identity, graphql_request, headers)
+            except ProxyError as e:
+                authorized.append(e)
+                continue
+        authorized.append(graphql_request)
+    return authorized
+
+
+def batch_results(requests: list[GraphQLRequest | ProxyError], forwarded: Iterable[dict]) -> list[dict]:
+    """Build the response body of a batch.
+
+    Args:
+        requests (list): The batch from :func:`authorize_batch`.
+        forwarded (Iterable[dict]): Results of the allowed requests, in batch order.
+
+    Returns:
+        list[dict]: The result or error for each request, in batch order.
+
+    """
+    results = iter(forwarded)
+    return [next(results) if isinstance(request, GraphQLRequest) else request.body() for request in requests]
+
+
+def upstream_result(status: int, body: bytes) -> dict:
+    """Get the result of one batched request from the upstream response to it.
+
+    Args:
+        status (int): HTTP status of the upstream response.
+        body (bytes): Decoded body of the upstream response.
+
+    Returns:
+        dict: The upstream's JSON result, or an error if the response is not a JSON object.
+
+    """
+    try:
+        result = json.loads(body)
+    except ValueError:
+        result = None
+    if isinstance(result, dict):
+        return result
+    return error_body(f"Upstream responded with status {status}", "UPSTREAM_ERROR", status=status)
+
+
+def identify(config: ProxyConfig, headers: Mapping[str, str]) -> Identity:
+    """Find the configured user for the identity headers and the groups they belong to.
+
+    Users that are not configured get the default groups, if there are any. The user and
+    groups resolved for a combination of user, email and groups headers are cached.
+
+    Args:
+        config (ProxyConfig): Proxy config.
+        headers (Mapping[str, str]): Request headers.
+
+    Returns:
+        Identity: The user and their group names.
+
+    Raises:
+        ProxyError: If the user is not configured and there are no default groups.
+
+    """
+    identity_cache = _identity_cache(config)
+    key = hash_identity(
+        headers.get("X-Forwarded-User", ""),
+        headers.get("X-Forwarded-Email", ""),
+        headers.get("X-Forwarded-Groups", ""),
+    )
+    cached = identity_cache.get(key)
+    if cached is not None:
+        user, group_names = cached
+        return Identity(
+            user=user,
+            username=headers.get("X-Forwarded-User", ""),
+            user_email=headers.get("X-Forwarded-Email", ""),
+            access_token=headers.get("X-Forwarded-Access-Token", ""),
+            group_names=group_names,
+        )
+
+    user_email, username, access_token, idp_groups = extract_user_from_headers(headers)
+    users_config: Users = config["users_config"]
+    groups_config: Groups = config["groups_config"]
+
+    user = users_config.get_user(username)
+    if user is None:
+        user = users_config.get_user_by_email(user_email)
+    if user is None and not groups_config.default_groups:
+        raise ProxyError("User not configured.", "FORBIDDEN", 403, user=username, user_email=user_email)
+
+    groups_from_idp = groups_config.get_idp_groups(idp_groups)
+    if user is None:
+        group_names = get_policy(config).default_group_names.union(groups_from_idp)
+    else:
+        group_names = frozenset(user.groups).union(groups_from_idp)
+    identity_cache.put(key, (user, group_names))
+    return Identity(
+        user=user,
+        username=username,
+        user_email=user_email,
+        access_token=access_token,
+        group_names=group_names,
+    )
+
+
+def validate_identity(config: ProxyConfig, identity: Identity) -> Identity:
+    """Check the access token with the identity provider, if token validation is enabled.
+
+    Groups the identity provider reports for the token's user are mapped through the
+    groups' ``idp_groups`` and added to the identity. This may call out to the identity
+    provider, so the asyncio server runs it in a thread.
+
+    Args:
+        config (ProxyConfig): Proxy config.
+        identity (Identity): The identity to validate.
+
+    Returns:
+        Identity: The identity, with the groups from the identity provider added.
+
+    Raises:
+        ProxyError: If the token is invalid or belongs to someone else.
+
+    """
+    if not config.get("validate_token", False):
+        return identity
+    username = identity.user.username if identity.user else identity.username
+    user_email = identity.user.email if identity.user else identity.user_email
+    identity_provider = _identity_provider(config)
+    valid, reason = identity_provider.validate_token(identity.access_token, username, user_email)
+    if not valid:
+        raise ProxyError(f"Authentication failed: {reason}", "UNAUTHORIZED", 401, user=username, user_email=user_email)
+    groups_config: Groups = config["groups_config"]
+    groups_from_idp = groups_config.get_idp_groups(identity_provider.get_groups(identity.access_token, username))
+    if not groups_from_idp:
+        return identity
+    return replace(identity, group_names=identity.group_names.union(groups_from_idp))
+
+
+def check_authorization(
+    document: CachedDocument,
+    variables: dict,
+    user_rules: UserRules,
+    native_rules: object | None = None,
+    max_fields: int = MAX_EXPANDED_FIELDS,
+) -> tuple[bool, str, list[str]]:
+    """Check authorization for each operation in the GraphQL document.
+
+    Args:
+        document (CachedDocument): The parsed request document.
+        variables (dict): Request variables.
+        user_rules (UserRules): The user's rule bundle.
+        native_rules (object | None): The bundle compiled for the native rule engine, if any.
+        max_fields (int): Maximum number of fields the document may select with fragments expanded.
+
+    Returns:
+        tuple: (is_allowed, reason, parent_fields)
+
+    Raises:
+        FragmentExpansionError: If a fragment spreads itself or too many fields are selected.
+        SelectionConflictError: If a response key is selected both with and without sub-fields.
+
+    """
+    if native_rules is not None:
+        decision = _check_authorization_native(document, variables, native_rules, max_fields)
+        if decision is not None:
+            return decision
+    walker = SelectionWalker(document.fragments, variables, FragmentExpansion(max_fields, document.fragment_fields))
+    for definition in document.operations:
+        if definition.operation == OperationType.MUTATION:
+            field_denials = user_rules.mutation_field_denials
+            field_allowances = user_rules.mutation_field_allowances
+        elif definition.operation == OperationType.QUERY:
+            field_denials = user_rules.query_field_denials
+            field_allowances = user_rules.query_field_allowances
+        else:
+            continue
+        # Explicit allowances override denials
+        if field_allowances:
+            return walker.check_allowances(walker.collect(definition.selection_set), field_allowances)
+        if field_denials:
+            return walker.check_denials(walker.collect(definition.selection_set), field_denials)
+        raise ValueError("No field restrictions or allowances configured.")
+
+    return True, "No operations to authorize.", []
+
+
+def _check_authorization_native(
+    document: CachedDocument,
+    variables: dict,
+    native_rules: object,
+    max_fields: int = MAX_EXPANDED_FIELDS,
+) -> tuple[bool, str, list[str]] | None:
+    """Check the first query or mutation with the native rule engine.
+
+    Args:
+        document (CachedDocument): The parsed request document.
+        variables (dict): Request variables.
+        native_rules (object): The bundle compiled for the native rule engine.
+        max_fields (int): Maximum number of fields the document may select with fragments expanded.
+
+    Returns:
+        tuple | None: (is_allowed, reason, parent_fields), or None if the Python checks must decide.
+
+    """
+    for operation, field_dict in field_trees(document, variables, max_fields):
+        if operation in {OperationType.QUERY, OperationType.MUTATION}:
+            return native_rules.authorize(operation.value, field_dict)
+    return None
+
+
+def _template_variable(name: str, identity: Identity, headers: Mapping[str, str]) -> str | None:
+    """Get the value of a Jinja template variable: the username, the user email or a request header."""
+    if name == "username":
+        return identity.username
+    if name == "user_email":
+        return identity.user_email
+    return headers.get(name)
+
+
+def authorize(
+    config: ProxyConfig,
+    identity: Identity,
+    graphql_request: GraphQLRequest,
+    headers: Mapping[str, str],
+) -> None:
+    """Check the request against the rules of the user's groups.
+
+    Requests the rules allow must also be within the cost budget of one of the user's groups.
+    Decisions are cached per group set, document and relevant variables and, when the
+    user's rules contain Jinja templates, the values of the template variables.
+
+    Args:
+        config (ProxyConfig): Proxy config.
+        identity (Identity): The identity the request was made for.
+        graphql_request (GraphQLRequest): The parsed request.
+        headers (Mapping[str, str]): Request headers, available to Jinja templates.
+
+    Raises:
+        ProxyError: If the request is denied, its fragments spread themselves or expand to more
+            fields than allowed, or it selects a response key both with and without sub-fields.
+
+    """
+    # Fragment cycles and fragment bombs are rejected before any fragment is expanded.
+    document = graphql_request.document
+    max_fields = config.get("max_expanded_fields", MAX_EXPANDED_FIELDS)
+    if document.fragment_cycle:
+        raise ProxyError(fragment_cycle_message(document.fragment_cycle), "GRAPHQL_VALIDATION_FAILED", 400)
+    if document.expanded_fields > max_fields:
+        raise ProxyError(
+            f"Query selects more than {max_fields} fields with fragments expanded.", "GRAPHQL_VALIDATION_FAILED", 400,
+        )
+    policy = get_policy(config)
+    user_rules: UserRules = policy.rules_for(identity.group_names)
+    render_key = ""
+    if config.get("enable_config_jinja", False) and user_rules.has_templates:
+        # Only the variables the templates reference are looked up and key the rendered bundle.
+        variables = policy.template_variables(identity.group_names)
+        template_vars = {name: _template_variable(name, identity, headers) for name in variables}
+        user_rules, render_key = policy.rendered_rules_for(identity.group_names, template_vars)
+    decision_key = policy.decision_key(identity.group_names, document, graphql_request.variables, render_key)
+    decision = policy.get_decision(decision_key)
+    if decision is None:
+        try:
+            is_allowed, reason, parent_fields = check_authorization(
+                document, graphql_request.variables,
+                user_rules, policy.native_rules_for(identity.group_names, render_key), max_fields,
+            )
+        except SelectionConflictError as e:
+            raise ProxyError(e.message, "GRAPHQL_VALIDATION_FAILED", 400) from e
+        if is_allowed:
+            is_allowed, reason = check_query_cost(
+                document, graphql_request.variables, policy.cost_policies_for(identity.group_names),
+            )
+        decision = (is_allowed, reason, tuple(parent_fields or ()))
+        policy.put_decision(decision_key, decision)
+    is_allowed, reason, _ = decision
+    if not is_allowed:
+        raise _access_denied(identity, graphql_request.operation_name, reason)
+
+
+def _access_denied(identity: Identity, operation_name: str, reason: str) -> ProxyError:
+    """Log a denied request and build the error to answer it with."""
+    logger.warning(f"❌ Query '{operation_name}' denied for user {identity.username} ({identity.user_email})")
+    logger.warning(f"❌ Reason: {reason}")
+    return ProxyError(
+        f"Access denied: {reason}",
+        "FORBIDDEN",
+        403,
+        user=identity.username,
+        user_email=identity.user_email,
+        query=operation_name,
+        reason=reason,
+    )
+
+
+def authorize_without_parsing(  # noqa: PLR0911
+    config: ProxyConfig,
+    identity: Identity,
+    data: Any,  # noqa: ANN401
+) -> bool:
+    """Decide a request from its operation types alone, if the user's rules do not depend on more.
+
+    When the user's group set allows (or denies) every operation of a type, as with an allow
+    rule for ``*``, the operation types are sniffed from the query text and the document is
+    neither parsed nor walked. Such requests skip the document and decision caches, and the
+    fragment and cost checks of :func:`authorize`; the upstream validates the document.
+
+    Args:
+        config (ProxyConfig): Proxy config.
+        identity (Identity): The identity the request was made for.
+        data (Any): The request body as decoded by :func:`decode_graphql_body`.
+
+    Returns:
+        bool: True if the request is allowed, False if it must be parsed and passed to :func:`authorize`.
+
+    Raises:
+        ProxyError: If the request is denied.
+
+    """
+    policy = get_policy(config)
+    group_names = identity.group_names
+    if all(
+        policy.access_for(group_names, operation) == OperationAccess.CONDITIONAL
+        for operation in (OperationType.QUERY, OperationType.MUTATION)
+    ):
+        return False
+    if not isinstance(data, dict):
+        return False
+    if isinstance(data.get("extensions"), dict) and "persistedQuery" in data["extensions"]:
+        # Persisted queries are resolved through the document cache.
+        return False
+    query = data.get("query")
+    operation_name = data.get("operationName", "")
+    if not isinstance(query, str):
+        return False
+    operation_types = sniff_operation_types(query)
+    if not operation_types:
+        return False
+    # Only queries and mutations are authorized, as in check_authorization.
+    accesses = {
+        policy.access_for(group_names, operation)
+        for operation in operation_types
+        if operation in {OperationType.QUERY, OperationType.MUTATION}
+    }
+    if accesses == {OperationAccess.ALLOW}:
+        return True
+    if accesses == {OperationAccess.DENY}:
+        reason = "Wildcard '*' found in field restrictions, all fields are denied"
+        raise _access_denied(identity, operation_name, reason)
+    return False
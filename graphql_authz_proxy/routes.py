@@ -1,23 +1,31 @@
-from urllib.parse import urljoin
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
-from flask import Flask, Response, current_app, jsonify, request
-from graphql import (
-    DocumentNode,
-    FragmentDefinitionNode,
-    OperationDefinitionNode,
-    OperationType,
-    parse,
+from flask import Flask, Response, abort, current_app, jsonify, request
+
+from graphql_authz_proxy.pipeline import (
+    WRITE_METHODS,
+    GraphQLRequest,
+    ProxyConfig,
+    ProxyError,
+    authorize,
+    authorize_batch,
+    authorize_without_parsing,
+    batch_results,
+    decode_graphql_body,
+    error_body,
+    health_status,
+    identify,
+    is_batch_request,
+    is_graphql_path,
+    parse_graphql_batch,
+    parse_graphql_request,
+    upstream_graphql_url,
+    upstream_result,
+    validate_identity,
 )
-
-from graphql_authz_proxy.authz.permissions import check_field_allowances, check_field_denials
-from graphql_authz_proxy.authz.utils import (
-    convert_fields_to_dict,
-    extract_user_from_headers,
-    render_fields,
-)
-from graphql_authz_proxy.identity_providers.main import get_identity_provider
-from graphql_authz_proxy.models import FieldNodeDict, Group, Groups, PolicyEffect, User, UserRules, Users
+from graphql_authz_proxy.upstream import StreamedBody, UpstreamClient, filter_hop_by_hop_headers, iter_body
 
 
 def proxy_all(path: str) -> Response:
@@ -31,9 +39,12 @@ def proxy_all(path: str) -> Response:
         Response: Flask response with upstream content and status.
 
     """
+    if request.method in WRITE_METHODS and is_graphql_path(path, current_app.config["upstream_graphql_path"]):
+        # e.g. a trailing slash; GraphQL requests are only forwarded once authorized.
+        abort(405)
     try:
         # Forward the request to Dagster webserver
-        headers = dict(request.headers)
+        headers = filter_hop_by_hop_headers(request.headers)
         headers.pop("Host", None)
         headers.pop("Content-Length", None)
 
@@ -41,28 +52,70 @@ def proxy_all(path: str) -> Response:
         if request.query_string:
             url += f"?{request.query_string.decode()}"
 
-        response = requests.request(
+        upstream_client: UpstreamClient = current_app.config["upstream_client"]
+        response = upstream_client.request(
             method=request.method,
             url=url,
-            data=request.get_data(),
+            data=_streamed_request_body(),
             headers=headers,
-            timeout=30,
-        )
-
-        return Response(
-            response.content,
-            status=response.status_code,
-            headers=dict(response.headers),
+            stream=True,
         )
+        return _to_flask_response(response)
     except Exception as e:
         current_app.logger.exception(f"Error proxying request: {e!s}")
-        return jsonify({
-            "errors": [{
-                "message": "Proxy error",
-                "extensions": {"code": "PROXY_ERROR"},
-            }],
-        }), 502
-        
+        return jsonify(error_body("Proxy error", "PROXY_ERROR")), 502
+
+
+def _streamed_request_body() -> StreamedBody | Iterator[bytes] | bytes:
+    """Get the body of the current request for forwarding without reading it into memory.
+
+    Returns:
+        StreamedBody | Iterator[bytes] | bytes: A stream of known length, a chunk iterator
+        for a chunked request body, or an empty body.
+
+    """
+    chunk_size: int = current_app.config["stream_chunk_size"]
+    if request.content_length:
+        return StreamedBody(request.stream, request.content_length, chunk_size)
+    if "chunked" in request.headers.get("Transfer-Encoding", "").lower():
+        return iter_body(request.stream, chunk_size)
+    return b""
+
+
+def _to_flask_response(response: requests.Response) -> Response:
+    """Relay an upstream response that was requested with ``stream=True``.
+
+    Responses with a known length up to the ``stream_threshold`` config value are buffered.
+    Larger responses, or those of unknown length, are relayed chunk by chunk as they arrive,
+    so the upstream is only read as fast as the client consumes the body. The body is passed
+    through still content-encoded and hop-by-hop headers are dropped.
+
+    Args:
+        response (requests.Response): Upstream response, not yet read.
+
+    Returns:
+        Response: Flask response relaying the upstream response.
+
+    """
+    headers = filter_hop_by_hop_headers(response.headers)
+    content_length = response.headers.get("Content-Length", "")
+    if content_length.isdigit() and int(content_length) <= current_app.config["stream_threshold"]:
+        try:
+            body = response.raw.read(decode_content=False)
+        finally:
+            response.close()
+        return Response(body, status=response.status_code, headers=headers)
+
+    chunk_size: int = current_app.config["stream_chunk_size"]
+
+    def generate() -> Iterator[bytes]:
+        try:
+            yield from response.raw.stream(chunk_size, decode_content=False)
+        finally:
+            response.close()
+
+    return Response(generate(), status=response.status_code, headers=headers, direct_passthrough=True)
+
 
 def health_check() -> Response:
     """Health check endpoint for the proxy service.
@@ -72,174 +125,24 @@ def health_check() -> Response:
         Response: JSON response with health and config info.
 
     """
-    groups: Groups = current_app.config.get("groups_config")
-    config_status = {
-        "groups_configured": len(groups.groups),
-    }
-    
-    return jsonify({
-        "status": "healthy", 
-        "service": "graphql-authz-proxy",
-        "features": {
-            "graphql_parsing": True,
-            "mutation_detection": True,
-            "github_integration": True,
-            "config_driven_auth": True,
-            "parameter_validation": True,
-            "jsonpath_support": True,
-        },
-        "authorization": config_status,
-    })
-
-
-
-def _parse_graphql_request() -> tuple[str, dict, str]:
-    """Parse GraphQL query, variables, and operation name from request."""
-    if request.is_json:
-        data = request.get_json()
-        query = data.get("query", "") if data else ""
-        variables = data.get("variables", {}) if data else {}
-        operation_name = data.get("operationName", "") if data else ""
-    else:
-        query = request.form.get("query", "")
-        variables = {}
-        operation_name = ""
-    return query, variables, operation_name
-
-
-def _get_user(
-    users_config: Users,
-    username: str,
-    user_email: str
-) -> tuple[User | None, Response | None]:
-    """Get user object by username/email and validate token if required."""
-    user = users_config.get_user(username)
-    if user is None:
-        user = users_config.get_user_by_email(user_email)
-
-    if user is None:
-        return None, (jsonify({
-            "errors": [{
-                "message": "User not configured.",
-                "extensions": {
-                    "code": "FORBIDDEN",
-                    "user": username,
-                    "user_email": user_email,
-                },
-            }],
-        }), 403)
-
-    return user, None
-
-
-def _validate_user(
-    user: User,
-    access_token: str,
-    idp_name: str
-) -> tuple[bool, Response | None]:
-    identity_provider = get_identity_provider(idp_name)
-    valid, reason = identity_provider.validate_token(access_token, user.username, user.email)
-    if not valid:
-        return None, (jsonify({
-            "errors": [{
-                "message": f"Authentication failed: {reason}",
-                "extensions": {
-                    "code": "UNAUTHORIZED",
-                    "user": user.username,
-                    "user_email": user.email,
-                },
-            }],
-        }), 401)
-    return True, None
-
-
-def _collect_field_rules(
-    user_groups: list[Group],
-) -> UserRules:
-    """Collect field denials and allowances from user groups."""
-    query_field_denials = []
-    mutation_field_denials = []
-    query_field_allowances = []
-    mutation_field_allowances = []
-    for group in user_groups:
-        if group:
-            if group.permissions.queries and group.permissions.queries.fields:
-                if group.permissions.queries.effect == PolicyEffect.DENY:
-                    query_field_denials.extend(group.permissions.queries.fields)
-                elif group.permissions.queries.effect == PolicyEffect.ALLOW:
-                    query_field_allowances.extend(group.permissions.queries.fields)
-            if group.permissions.mutations and group.permissions.mutations.fields:
-                if group.permissions.mutations.effect == PolicyEffect.DENY:
-                    mutation_field_denials.extend(group.permissions.mutations.fields)
-                elif group.permissions.mutations.effect == PolicyEffect.ALLOW:
-                    mutation_field_allowances.extend(group.permissions.mutations.fields)
-    return UserRules(
-        query_field_allowances=query_field_allowances,
-        query_field_denials=query_field_denials,
-        mutation_field_allowances=mutation_field_allowances,
-        mutation_field_denials=mutation_field_denials,
-    )
+    return jsonify(health_status(current_app.config))
 
 
-def _check_authorization(
-    document: DocumentNode,
-    variables: dict,
-    user_rules: UserRules
-) -> tuple[bool, str, list[str]]:
-    """Check authorization for each operation in the GraphQL document."""
-    fragments = {}
-    for definition in document.definitions:
-        if isinstance(definition, FragmentDefinitionNode):
-            fragments[definition.name.value] = definition
-    for definition in document.definitions:
-        if isinstance(definition, OperationDefinitionNode):
-            fields = render_fields(
-                fragments=fragments,
-                variable_values=variables,
-                selection_set=definition.selection_set,
-            )
-            field_dict: FieldNodeDict = convert_fields_to_dict(fields)
-            if definition.operation == OperationType.MUTATION:
-                field_denials = user_rules.mutation_field_denials
-                field_allowances = user_rules.mutation_field_allowances
-            elif definition.operation == OperationType.QUERY:
-                field_denials = user_rules.query_field_denials
-                field_allowances = user_rules.query_field_allowances
-            else:
-                continue
-            # Explicit allowances override denials
-            if field_allowances:
-                is_allowed, reason, parent_fields = check_field_allowances(
-                    field_nodes=field_dict,
-                    field_rules=field_allowances,
-                )
-            elif field_denials:
-                is_allowed, reason, parent_fields = check_field_denials(
-                    field_nodes=field_dict,
-                    field_denials=field_denials,
-                )
-            else:
-                raise ValueError("No field restrictions or allowances configured.")
-            
-            return is_allowed, reason, parent_fields
-
-    return True, "No operations to authorize.", []
-
-
-def _forward_to_upstream(upstream_graphql_url: str) -> Response:
-    """Forward the request to the upstream Dagster webserver."""
-    headers = dict(request.headers)
-    response = requests.post(
+def _forward_to_upstream(upstream_graphql_url: str, body: bytes) -> Response:
+    """Forward the request to the upstream Dagster webserver.
+
+    ``body`` is the raw request body that was read for parsing, or its rewritten form.
+    """
+    headers = filter_hop_by_hop_headers(request.headers)
+    upstream_client: UpstreamClient = current_app.config["upstream_client"]
+    response = upstream_client.post(
         upstream_graphql_url,
-        data=request.get_data(),
+        data=body,
         headers=headers,
-        timeout=30,
-    )
-    return Response(
-        response.content,
-        status=response.status_code,
-        headers=dict(response.headers),
+        stream=True,
     )
+    return _to_flask_response(response)
+
 
 def proxy_graphql() -> Response:
     """Proxy and authorize GraphQL requests to the upstream Dagster server.
@@ -251,87 +154,78 @@ def proxy_graphql() -> Response:
 
     """
     try:
-        query, variables, operation_name = _parse_graphql_request()
-        document: DocumentNode = parse(query)
-        current_app.logger.info(f"Extracting user information from headers: {request.headers}")
-        user_email, username, access_token, idp_groups = extract_user_from_headers(request.headers)
-        users_config: Users = current_app.config.get("users_config")
-        groups_config: Groups = current_app.config.get("groups_config")
-        enable_jinja: bool = current_app.config.get("enable_config_jinja", False)
-        idp_name: str = current_app.config.get("idp", "github")
-        validate_token: bool = current_app.config.get("validate_token", False)
-        upstream_graphql_url: str = urljoin(
-            current_app.config["upstream_url"], 
-            current_app.config["upstream_graphql_path"],
-        )
-        user, error_response = _get_user(
-            users_config,
-            username,
-            user_email
-        )
-        if error_response and not groups_config.default_groups:
-            return error_response
-        
-        groups_from_idp = groups_config.get_idp_groups(idp_groups)
-
-        if validate_token:
-            is_valid, validation_response = _validate_user(
-                user,
-                access_token,
-                idp_name
-            )
-
-            if not is_valid:
-                return validation_response
-
-        if user is None and groups_config.default_groups:
-            user_groups = [groups_config.get_group(group_name) for group_name in groups_config.default_groups]
-        else:
-            user_groups = [groups_config.get_group(group_name) for group_name in user.groups]
-
-        user_groups.extend(groups_from_idp)
-        
-        user_rules: UserRules = _collect_field_rules(user_groups)
-        if enable_jinja:
-            user_rules.render_argument_values(
-                {"username": username, "user_email": user_email, **request.headers}
-            )
-        is_allowed, reason, _ = _check_authorization(
-            document, variables,
-            user_rules,
-        )
-        if not is_allowed:
-            current_app.logger.warning(f"❌ Query '{operation_name}' denied for user {username} ({user_email})")
-            current_app.logger.warning(f"❌ Reason: {reason}")
-            return jsonify({
-                "errors": [{
-                    "message": f"Access denied: {reason}",
-                    "extensions": {
-                        "code": "FORBIDDEN",
-                        "user": username,
-                        "user_email": user_email,
-                        "query": operation_name,
-                        "reason": reason
-                    },
-                }],
-            }), 403
-            
-
-        return _forward_to_upstream(upstream_graphql_url)
+        config = current_app.config
+        body = request.get_data(cache=True)
+        if is_batch_request(body, request.content_type or ""):
+            return _proxy_graphql_batch(config, body)
+        try:
+            current_app.logger.info(f"Extracting user information from headers: {request.headers}")
+            identity = identify(config, request.headers)
+            identity = validate_identity(config, identity)
+            # The body is read and decoded once; parsing and forwarding both use the same bytes.
+            data = decode_graphql_body(body, request.content_type or "")
+            if authorize_without_parsing(config, identity, data):
+                return _forward_to_upstream(upstream_graphql_url(config), body)
+            graphql_request = parse_graphql_request(config, body, request.content_type or "", data)
+            authorize(config, identity, graphql_request, request.headers)
+        except ProxyError as e:
+            return jsonify(e.body()), e.status
+
+        return _forward_to_upstream(upstream_graphql_url(config), graphql_request.forward_body)
     except Exception as e:
         current_app.logger.exception(f"Error processing request: {e!s}")
-        return jsonify({
-            "errors": [{
-                "message": "Internal server error",
-                "extensions": {"code": "INTERNAL_ERROR"},
-            }],
-        }), 500
+        return jsonify(error_body("Internal server error", "INTERNAL_ERROR")), 500
+
+
+def _proxy_graphql_batch(config: ProxyConfig, body: bytes) -> Response:
+    """Authorize each request of a batch and forward the allowed ones to the upstream concurrently.
+
+    The response is a JSON array with the upstream's result or the error for each request,
+    in batch order.
+
+    Args:
+        config (ProxyConfig): Proxy config.
+        body (bytes): Raw request body, a JSON array of request objects.
+
+    Returns:
+        Response: Flask response with the batch results or an error for the whole batch.
+
+    """
+    try:
+        batch = parse_graphql_batch(config, body)
+        identity = identify(config, request.headers)
+        identity = validate_identity(config, identity)
+    except ProxyError as e:
+        return jsonify(e.body()), e.status
+    batch = authorize_batch(config, identity, batch, request.headers)
+
+    url = upstream_graphql_url(config)
+    headers = filter_hop_by_hop_headers(request.headers)
+    headers.pop("Content-Length", None)
+    upstream_client: UpstreamClient = config["upstream_client"]
+    logger = current_app.logger
+
+    def forward(graphql_request: GraphQLRequest) -> dict:
+        try:
+            response = upstream_client.post(url, data=graphql_request.forward_body, headers=headers)
+        except Exception as e:
+            logger.exception(f"Error proxying batched request: {e!s}")
+            return error_body("Proxy error", "PROXY_ERROR")
+        return upstream_result(response.status_code, response.content)
+
+    allowed = [item for item in batch if isinstance(item, GraphQLRequest)]
+    results: list[dict] = []
+    if allowed:
+        with ThreadPoolExecutor(max_workers=min(len(allowed), upstream_client.pool_size)) as executor:
+            results = list(executor.map(forward, allowed))
+    return jsonify(batch_results(batch, results))
 
 
 def register_routes(
         flask_app: Flask,
         graphql_path: str = "/graphql",
         healthcheck_path: str = "/gqlproxy/health",
+        proxy_write_methods: bool = False,
     ) -> None:
     """Register all Flask routes for the proxy service.
 
@@ -339,9 +233,12 @@ def register_routes(
         flask_app (Flask): The Flask app instance.
         graphql_path (str): Path for GraphQL endpoint.
         healthcheck_path (str): Path for health check endpoint.
+        proxy_write_methods (bool): Whether POST, PUT, PATCH and DELETE requests to other paths are proxied.
 
     """
-    flask_app.route("/", defaults={"path": ""})(proxy_all)
-    flask_app.route("/<path:path>")(proxy_all)
+    # HEAD and OPTIONS are added by Flask.
+    methods = ["GET", *sorted(WRITE_METHODS)] if proxy_write_methods else ["GET"]
+    flask_app.route("/", defaults={"path": ""}, methods=methods)(proxy_all)
+    flask_app.route("/<path:path>", methods=methods)(proxy_all)
     flask_app.route(healthcheck_path, methods=["GET"])(health_check)
     flask_app.route(graphql_path, methods=["POST"])(proxy_graphql)
@@ -61,10 +61,12 @@ def client2(users_config, groups_config):
 
 @pytest.fixture(autouse=True)
 def mock_requests_post():
-    with patch("requests.post") as mock_post:
+    with patch("requests.Session.request") as mock_post:
         mock_response = Mock()
         mock_response.status_code = 200
         mock_response.content = b'{"data": {"result": "mocked"}}'
+        mock_response.raw.read.return_value = mock_response.content
+        mock_response.raw.stream.side_effect = lambda *args, **kwargs: iter([mock_response.content])
         mock_response.headers = {"Content-Type": "application/json"}
         mock_post.return_value = mock_response
         yield mock_post
\ No newline at end of file
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from graphql_authz_proxy.asgi_app import AsgiProxy, get_asgi_app  # noqa: E402
+from graphql_authz_proxy.async_upstream import AsyncUpstreamClient  # noqa: E402
+from graphql_authz_proxy.flask_app import get_flask_app  # noqa: E402
+from graphql_authz_proxy.models import Groups, Users  # noqa: E402
+
+from .fixtures import get_test_headers, groups_config, users_config  # noqa: E402
+
+UPSTREAM_DELAY = 0.2
+
+
+class _UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == "/slow":
+            time.sleep(UPSTREAM_DELAY)
+        response = json.dumps({"data": {"received": json.loads(body or b"null")}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def do_GET(self) -> None:
+        body = f"{self.path} {self.headers.get('Content-Length', '')}".encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def upstream_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _UpstreamHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _app_options(upstream_url, users_config, groups_config) -> dict:
+    return {
+        "upstream_url": upstream_url,
+        "upstream_graphql_path": "/graphql",
+        "users_config": users_config,
+        "groups_config": groups_config,
+        "healthcheck_path": "/health",
+    }
+
+
+async def _asgi_request(app, method: str, path: str, **kwargs) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://proxy") as client:
+        return await client.request(method, path, **kwargs)
+
+
+PARITY_CASES = [
+    # Allowed query
+    ({"json": {"query": "{ getUser(name: \"Ann\") { id } }"}}, get_test_headers("bob@company.com", "bob")),
+    # Denied by an argument rule
+    ({"json": {"query": "{ getUser(name: \"Bob\") { id } }"}}, get_test_headers("bob@company.com", "bob")),
+    # Denied mutation
+    ({"json": {"query": "mutation { deleteUser(id: 1) { id } }"}}, get_test_headers("bob@company.com", "bob")),
+    # Unknown user
+    ({"json": {"query": "{ getUser { id } }"}}, get_test_headers("nobody@company.com", "nobody")),
+    # Unknown persisted query
+    (
+        {"json": {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": "0" * 64}}}},
+        get_test_headers("bob@company.com", "bob"),
+    ),
+    # Invalid query
+    ({"json": {"query": "not a valid graphql"}}, get_test_headers("kgmcquate@gmail.com", "kgmcquate")),
+    # Form-encoded body
+    ({"data": {"query": "{ getUser { id } }"}}, get_test_headers("kgmcquate@gmail.com", "kgmcquate")),
+    # Batch with allowed, denied and invalid operations
+    (
+        {"json": [
+            {"query": "{ getUser(name: \"Ann\") { id } }"},
+            {"query": "{ getUser(name: \"Bob\") { id } }"},
+            {"query": "not a valid graphql"},
+            "not an object",
+        ]},
+        get_test_headers("bob@company.com", "bob"),
+    ),
+    # Empty batch
+    ({"json": []}, get_test_headers("bob@company.com", "bob")),
+]
+
+
+@pytest.mark.parametrize(("request_kwargs", "headers"), PARITY_CASES)
+def test_graphql_responses_match_flask(upstream_url, users_config, groups_config, request_kwargs, headers) -> None:
+    options = _app_options(upstream_url, users_config, groups_config)
+    with get_flask_app(**options).test_client() as client:
+        expected = client.post("/graphql", headers=headers, **request_kwargs)
+
+    response = asyncio.run(_asgi_request(get_asgi_app(**options), "POST", "/graphql", headers=headers, **request_kwargs))
+    assert response.status_code == expected.status_code
+    assert response.content == expected.get_data()
+
+
+def test_proxy_all_and_health(upstream_url, users_config, groups_config) -> None:
+    app = get_asgi_app(**_app_options(upstream_url, users_config, groups_config))
+    response = asyncio.run(_asgi_request(app, "GET", "/assets/app.js?v=1"))
+    assert response.status_code == 200
+    assert response.text == "/assets/app.js?v=1 "
+
+    response = asyncio.run(_asgi_request(app, "GET", "/health"))
+    assert response.json()["status"] == "healthy"
+    assert response.json()["authorization"]["groups_configured"] == 2
+
+    assert asyncio.run(_asgi_request(app, "DELETE", "/assets/app.js")).status_code == 405
+
+
+def test_write_requests_are_proxied_when_enabled(upstream_url, users_config, groups_config) -> None:
+    options = _app_options(upstream_url, users_config, groups_config)
+    body = json.dumps({"upload": "x" * 4096}).encode()
+    assert asyncio.run(_asgi_request(get_asgi_app(**options), "POST", "/upload", content=body)).status_code == 405
+
+    app = get_asgi_app(**options, proxy_write_methods=True)
+    response = asyncio.run(_asgi_request(app, "POST", "/upload", content=body))
+    assert response.status_code == 200
+    assert response.json() == {"data": {"received": {"upload": "x" * 4096}}}
+    # httpx resolves dot segments itself; see test_graphql_path_spellings for those.
+    for path in ("/graphql/", "/graphql//"):
+        assert asyncio.run(_asgi_request(app, "POST", path, content=body)).status_code == 405
+
+    # The guard protects the upstream GraphQL endpoint, wherever the proxy serves GraphQL.
+    proxy = AsgiProxy(app.config, graphql_path="/proxy/graphql", healthcheck_path="/health")
+    assert asyncio.run(_asgi_request(proxy, "POST", "/graphql", content=body)).status_code == 405
+
+
+def test_proxy_error_when_upstream_is_down(users_config, groups_config) -> None:
+    app = get_asgi_app(**_app_options("http://127.0.0.1:9", users_config, groups_config), upstream_connect_timeout=0.5)
+    response = asyncio.run(_asgi_request(app, "GET", "/foo"))
+    assert response.status_code == 502
+    assert response.json()["errors"][0]["extensions"]["code"] == "PROXY_ERROR"
+
+
+def test_slow_upstream_requests_run_concurrently(upstream_url) -> None:
+    app = get_asgi_app(
+        upstream_url=upstream_url,
+        upstream_graphql_path="/slow",
+        users_config=Users(users=[]),
+        groups_config=Groups.model_validate({
+            "groups": [{"name": "everyone", "permissions": {"queries": {"effect": "allow", "fields": [{"field_name": "*"}]}}}],
+            "default_groups": ["everyone"],
+        }),
+    )
+    requests = 20
+
+    async def _run() -> list[httpx.Response]:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://proxy") as client:
+            return await asyncio.gather(*(
+                client.post("/slow", json={"query": "{ a }"}, headers=get_test_headers("a@b.c", "a"))
+                for _ in range(requests)
+            ))
+
+    started = time.perf_counter()
+    responses = asyncio.run(_run())
+    elapsed = time.perf_counter() - started
+    assert [response.status_code for response in responses] == [200] * requests
+    assert elapsed < requests * UPSTREAM_DELAY / 2
+
+
+def test_new_documents_are_authorized_off_the_event_loop(upstream_url, users_config, groups_config, monkeypatch) -> None:
+    app = get_asgi_app(**_app_options(upstream_url, users_config, groups_config))
+    # asyncio.run runs the event loop in this thread.
+    loop_thread = threading.get_ident()
+    authorized_in = []
+    authorize = app._authorize
+
+    def _authorize(*args) -> bytes:
+        authorized_in.append(threading.get_ident() == loop_thread)
+        return authorize(*args)
+
+    monkeypatch.setattr(app, "_authorize", _authorize)
+
+    async def _run() -> list[httpx.Response]:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://proxy") as client:
+            return [
+                await client.post(
+                    "/graphql",
+                    json={"query": "{ getUser(name: \"Ann\") { id } }"},
+                    headers=get_test_headers("bob@company.com", "bob"),
+                )
+                for _ in range(2)
+            ]
+
+    assert [response.status_code for response in asyncio.run(_run())] == [200, 200]
+    # The first request parses the document in a worker thread, the second finds it cached.
+    assert authorized_in == [False, True]
+
+
+def test_upstream_stats_are_unknown_when_the_pool_cannot_be_inspected(upstream_url) -> None:
+    client = AsyncUpstreamClient(upstream_url)
+    assert client.stats() == {"pool_size": 10, "in_use": 0, "idle": 0, "created": 0}
+
+    async def _request() -> dict:
+        response = await client.send("GET", f"{upstream_url}/foo", headers=[])
+        await response.aread()
+        await response.aclose()
+        stats = client.stats()
+        await client.aclose()
+        # A transport without an httpcore pool
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(lambda _: httpx.Response(200)))
+        unknown = client.stats()
+        await client.aclose()
+        return {"stats": stats, "unknown": unknown}
+
+    results = asyncio.run(_request())
+    assert results["stats"] == {"pool_size": 10, "in_use": 0, "idle": 1, "created": 1}
+    assert results["unknown"] == {"pool_size": 10, "in_use": "unknown", "idle": "unknown", "created": "unknown"}
+
+
+def test_upstream_requests_wait_for_a_free_slot(upstream_url) -> None:
+    client = AsyncUpstreamClient(upstream_url, pool_size=2, max_connections=2, read_timeout=UPSTREAM_DELAY * 4)
+    finished = []
+
+    async def _request(index: int) -> None:
+        response = await client.send("POST", f"{upstream_url}/slow", headers=[], content=b"{}")
+        await response.aread()
+        await response.aclose()
+        finished.append(index)
+
+    async def _run() -> dict:
+        started = time.perf_counter()
+        await asyncio.gather(*(_request(index) for index in range(4)))
+        elapsed = time.perf_counter() - started
+        stats = client.stats()
+        # A slot stays taken until the response is closed.
+        response = await client.send("POST", f"{upstream_url}/slow", headers=[], content=b"{}")
+        await client.send("POST", f"{upstream_url}/slow", headers=[], content=b"{}")
+        with pytest.raises(httpx.PoolTimeout):
+            await client.send("POST", f"{upstream_url}/slow", headers=[], content=b"{}")
+        await response.aclose()
+        await client.aclose()
+        return {"elapsed": elapsed, "stats": stats}
+
+    results = asyncio.run(_run())
+    assert results["elapsed"] >= 2 * UPSTREAM_DELAY
+    assert results["stats"]["created"] == 2
+    assert sorted(finished[:2]) == [0, 1]
+    assert sorted(finished[2:]) == [2, 3]
@@ -0,0 +1,201 @@
+import threading
+import time
+
+from graphql import print_ast
+
+from graphql_authz_proxy.authz.utils import convert_fields_to_dict, render_fields
+from graphql_authz_proxy.cache import (
+    CachedDocument,
+    DocumentCache,
+    TOKEN_BYTES,
+    LRUCache,
+    TTLCache,
+    find_fragment_cycle,
+    hash_query,
+)
+
+from .fixtures import (
+    get_test_headers,
+    client,
+    users_config,
+    groups_config,
+    mock_requests_post
+)
+
+GET_USER_QUERY = """
+query GetUser($name: String!) {
+  getUser(name: $name) {
+    id
+  }
+}
+"""
+
+
+def test_lru_cache_evicts_least_recently_used() -> None:
+    cache = LRUCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats.evictions == 1
+    assert stats.entries == 2
+
+
+def test_lru_cache_evicts_by_size() -> None:
+    cache = LRUCache(max_entries=10, max_bytes=10)
+    cache.put("a", "a", size=4)
+    cache.put("b", "b", size=4)
+    cache.put("c", "c", size=4)
+    assert "a" not in cache
+    assert cache.stats().size_bytes == 8
+    # Values larger than the byte limit are never cached.
+    cache.put("d", "d", size=11)
+    assert "d" not in cache
+
+
+def test_lru_cache_counts_hits_and_misses() -> None:
+    cache = LRUCache(max_entries=2)
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("missing")
+    stats = cache.stats()
+    assert stats.hits == 1
+    assert stats.misses == 1
+
+
+def test_document_cache_reuses_parsed_document() -> None:
+    cache = DocumentCache(max_entries=4)
+    first = cache.parse(GET_USER_QUERY)
+    second = cache.parse(GET_USER_QUERY)
+    assert first is second
+    assert first.query_hash == hash_query(GET_USER_QUERY)
+    assert cache.stats().hits == 1
+
+
+def test_document_cache_limits_estimated_document_size() -> None:
+    query = "query Q($id: ID) { getUser(id: $id) { id name } }"
+    document = CachedDocument.from_query(query)
+    # 21 tokens, from "query" to the last "}", and the start and end of file tokens
+    assert document.size_bytes == len(query) + 23 * TOKEN_BYTES
+
+    cache = DocumentCache(max_bytes=document.size_bytes + TOKEN_BYTES)
+    cache.parse(query)
+    assert cache.stats().size_bytes == document.size_bytes
+    cache.parse("{ a }")
+    assert cache.stats().evictions == 1
+    assert cache.get(hash_query(query)) is None
+
+
+def test_render_fields_does_not_mutate_document() -> None:
+    cached = DocumentCache().parse(GET_USER_QUERY)
+    before = print_ast(cached.document)
+    operation = cached.document.definitions[0]
+    for name in ("Ann", "Bob"):
+        fields = render_fields({}, {"name": name}, operation.selection_set)
+        assert convert_fields_to_dict(fields)["getUser"]["arguments"]["name"] == name
+    assert print_ast(cached.document) == before
+
+
+def test_cached_document_authorized_with_each_requests_variables(client) -> None:
+    headers = get_test_headers("bob@company.com", "bob")
+    allowed = client.post("/graphql", json={"query": GET_USER_QUERY, "variables": {"name": "Ann"}}, headers=headers)
+    assert allowed.status_code == 200
+    denied = client.post("/graphql", json={"query": GET_USER_QUERY, "variables": {"name": "Bob"}}, headers=headers)
+    assert denied.status_code == 403
+    allowed_again = client.post(
+        "/graphql", json={"query": GET_USER_QUERY, "variables": {"name": "Ann"}}, headers=headers
+    )
+    assert allowed_again.status_code == 200
+
+    stats = client.get("/health").get_json()["caches"]["documents"]
+    assert stats["entries"] == 1
+    assert stats["hits"] == 2
+
+
+def test_cached_document_indexes_fragment_cycles() -> None:
+    assert CachedDocument.from_query("{ ...A } fragment A on Q { ...B ...B } fragment B on Q { x }").fragment_cycle is None
+    cached = CachedDocument.from_query("{ ...A } fragment A on Q { x { ...B } } fragment B on Q { ...C } fragment C on Q { ...B }")
+    assert cached.fragment_cycle == ("B", "C")
+    assert cached.expanded_fields == 0
+    assert CachedDocument.from_query("{ a { ...F id } b { ...F } } fragment F on T { id c { d } }").expanded_fields == 9
+    assert find_fragment_cycle({"A": {"A"}}) == ("A",)
+    assert find_fragment_cycle({"A": {"B", "Missing"}, "B": set()}) is None
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_ttl_cache_expires_entries_by_their_ttl() -> None:
+    clock = _Clock()
+    cache = TTLCache(clock=clock)
+    calls = []
+
+    def load(value, ttl):
+        def _load():
+            calls.append(value)
+            return value, ttl
+        return _load
+
+    assert cache.get_or_load("valid", load("ok", 10)) == "ok"
+    assert cache.get_or_load("invalid", load(None, 1)) is None
+    clock.now = 5
+    assert cache.get_or_load("valid", load("new", 10)) == "ok"
+    assert cache.get_or_load("invalid", load("now valid", 1)) == "now valid"
+    assert cache.get_or_load("uncached", load("a", 0)) == "a"
+    assert cache.get_or_load("uncached", load("b", 0)) == "b"
+    assert calls == ["ok", None, "now valid", "a", "b"]
+    assert cache.stats().hits == 1
+
+
+def test_ttl_cache_coalesces_concurrent_loads() -> None:
+    cache = TTLCache()
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        release.wait(5)
+        return "value", 60
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("key", load))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while cache.stats().coalesced < 7:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["value"] * 8
+    assert len(calls) == 1
+
+
+def test_ttl_cache_serves_stale_entries_while_refreshing() -> None:
+    clock = _Clock()
+    cache = TTLCache(stale_ttl=30, clock=clock)
+    refreshed = threading.Event()
+
+    def refresh():
+        refreshed.set()
+        return "new", 10
+
+    cache.get_or_load("key", lambda: ("old", 10))
+    clock.now = 15
+    assert cache.get_or_load("key", refresh) == "old"
+    assert refreshed.wait(5)
+    while cache.stats().entries and cache.get_or_load("key", refresh) == "old":
+        time.sleep(0.01)
+    assert cache.get_or_load("key", refresh) == "new"
+    assert cache.stats().stale_hits >= 1
+    # Past the stale window the entry is loaded again before returning.
+    clock.now = 100
+    assert cache.get_or_load("key", lambda: ("newest", 10)) == "newest"
@@ -109,3 +109,63 @@ groups:
     groups = Groups.parse_config_string(groups_yaml)
     assert isinstance(groups, Groups)
     assert len(groups.groups) == 2
+
+
+def test_user_lookups_match_exactly() -> None:
+    users = Users.parse_config(USERS_CONFIG)
+    assert users.get_user(" kgmcquate ").username == "kgmcquate"
+    assert users.get_user_by_email("kgmcquate@gmail.com ").username == "kgmcquate"
+    assert users.get_user_by_email("KGMcQuate@Gmail.com") is None
+    assert users.get_user("KGMcQuate") is None
+    assert users.get_user("nobody") is None
+    assert users.index_build_seconds >= 0
+
+
+def test_lookup_indexes_are_per_instance() -> None:
+    first = Users.parse_config_string("users: [{username: alice, email: a@example.com, groups: []}]")
+    second = Users.parse_config_string("users: [{username: bob, email: b@example.com, groups: []}]")
+    assert first.get_user("alice") is not None
+    assert second.get_user("alice") is None
+
+
+def test_duplicate_usernames_resolve_to_first_entry() -> None:
+    users = Users.parse_config_string("""
+users:
+  - {username: alice, email: first@example.com, groups: []}
+  - {username: alice, email: second@example.com, groups: []}
+""")
+    assert users.get_user("alice").email == "first@example.com"
+
+
+def test_group_lookups_use_index() -> None:
+    groups = Groups.parse_config(GROUPS_CONFIG)
+    assert groups.get_group("viewers").name == "viewers"
+    assert groups.get_group("missing") is None
+
+
+def test_values_that_are_not_templates_stay_literal() -> None:
+    groups = Groups.parse_config_string("""
+groups:
+  - name: literal
+    permissions:
+      queries:
+        effect: allow
+        fields:
+          - field_name: search
+            arguments:
+              - {argument_name: q, values: ["{{ broken", "{% x", "{{ name }}"]}
+""")
+    [argument_rule] = groups.get_group("literal").permissions.queries.fields[0].arguments
+    assert argument_rule.values == ["{{ broken", "{% x", "{{ name }}"]
+    assert argument_rule.template_variables == {"name"}
+    assert argument_rule.render({"name": "ann"}).values == ["{{ broken", "{% x", "ann"]
+
+
+def test_group_lookups_match_configured_names_exactly() -> None:
+    groups = Groups.parse_config_string("""
+groups:
+  - {name: " admin", permissions: {queries: {effect: allow, fields: [{field_name: "*"}]}}}
+""")
+    assert groups.get_group("admin") is None
+    assert groups.get_group(" admin ") is None
+    assert groups.get_group(" admin") is None
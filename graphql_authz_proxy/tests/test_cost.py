@@ -0,0 +1,129 @@
+from graphql_authz_proxy.authz.cost import CostAnalyzer, check_query_cost
+from graphql_authz_proxy.authz.policy import CompiledPolicy
+from graphql_authz_proxy.cache import CachedDocument
+from graphql_authz_proxy.flask_app import get_flask_app
+from graphql_authz_proxy.models import (
+    CostPolicy,
+    FieldCost,
+    FieldRule,
+    Group,
+    Groups,
+    Permissions,
+    PolicyEffect,
+    QueryPolicy,
+    User,
+    Users,
+)
+
+from .fixtures import get_test_headers, mock_requests_post
+
+ASSETS_QUERY = """
+query Assets($first: Int) {
+  assetNodes(first: $first) {
+    id
+    materializations { runId }
+  }
+}
+"""
+
+COST_POLICY = CostPolicy(
+    max_cost=500,
+    max_depth=4,
+    fields=[FieldCost(field_name="materializations", weight=5, list_size=20)],
+)
+
+
+def _cost(query: str, variables: dict | None = None, cost_policy: CostPolicy = COST_POLICY) -> tuple[float, int]:
+    document = CachedDocument.from_query(query)
+    query_cost = CostAnalyzer(document.fragments, variables or {}, cost_policy).selection_cost(
+        document.operations[0].selection_set,
+    )
+    return query_cost.cost, query_cost.depth
+
+
+def test_list_sizes_multiply_the_cost_of_sub_fields() -> None:
+    # assetNodes + first * (id + materializations + list_size * runId)
+    assert _cost(ASSETS_QUERY, {"first": 10}) == (1 + 10 * (1 + 5 + 20 * 1), 3)
+    assert _cost(ASSETS_QUERY) == (1 + 1 + 5 + 20, 3)
+    assert _cost("{ assetNodes(limit: 3) { id } }") == (1 + 3, 2)
+
+
+def test_aliases_and_fragments_are_each_counted() -> None:
+    query = "{ a: assetNodes(first: 2) { ...F } b: assetNodes(first: 3) { ...F } } fragment F on Asset { id key }"
+    assert _cost(query) == (1 + 2 * 2 + 1 + 3 * 2, 2)
+
+
+def test_query_is_within_budget_of_any_group() -> None:
+    document = CachedDocument.from_query(ASSETS_QUERY)
+    assert check_query_cost(document, {"first": 10}, [COST_POLICY])[0]
+    is_allowed, reason = check_query_cost(document, {"first": 100}, [COST_POLICY])
+    assert not is_allowed
+    assert reason == "Query cost 2601 exceeds the budget of 500"
+    assert check_query_cost(document, {"first": 100}, [COST_POLICY, CostPolicy(max_cost=5000)])[0]
+    assert check_query_cost(document, {"first": 100}, [])[0]
+    is_allowed, reason = check_query_cost(document, {}, [CostPolicy(max_depth=2)])
+    assert not is_allowed
+    assert reason == "Query depth 3 exceeds the maximum depth of 2"
+
+
+def _groups_config() -> Groups:
+    allow_all = Permissions(queries=QueryPolicy(effect=PolicyEffect.ALLOW, fields=[FieldRule(field_name="*")]))
+    return Groups(groups=[
+        Group(name="analysts", permissions=allow_all, cost=COST_POLICY),
+        Group(name="admin", permissions=allow_all, cost=CostPolicy(unlimited=True)),
+        Group(name="viewers", permissions=allow_all),
+    ])
+
+
+def test_unlimited_budgets_lift_the_limit() -> None:
+    policy = CompiledPolicy(_groups_config())
+    assert policy.cost_policies_for(frozenset({"analysts"})) == (COST_POLICY,)
+    assert policy.cost_policies_for(frozenset({"analysts", "admin"})) == ()
+    assert policy.cost_policies_for(frozenset({"viewers"})) == ()
+
+
+def test_groups_without_a_budget_keep_the_budgets_of_other_groups(mock_requests_post) -> None:
+    policy = CompiledPolicy(_groups_config())
+    assert policy.cost_policies_for(frozenset({"analysts", "viewers"})) == (COST_POLICY,)
+
+    flask_app = get_flask_app(
+        upstream_url="http://localhost:4000/",
+        upstream_graphql_path="/graphql",
+        users_config=Users(users=[User(username="ann", email="ann@company.com", groups=["analysts", "viewers"])]),
+        groups_config=_groups_config(),
+    )
+    with flask_app.test_client() as client:
+        headers = get_test_headers("ann@company.com", "ann")
+        response = client.post("/graphql", json={"query": ASSETS_QUERY, "variables": {"first": 100}}, headers=headers)
+        assert response.status_code == 403
+        assert response.get_json()["errors"][0]["extensions"]["reason"] == "Query cost 2601 exceeds the budget of 500"
+        assert mock_requests_post.call_count == 0
+
+
+def test_decision_key_includes_list_size_variables() -> None:
+    policy = CompiledPolicy(_groups_config())
+    document = CachedDocument.from_query(ASSETS_QUERY)
+    group_names = frozenset({"analysts"})
+    key = policy.decision_key(group_names, document, {"first": 10})
+    assert key != policy.decision_key(group_names, document, {"first": 100})
+    assert policy.decision_key(frozenset({"admin"}), document, {"first": 10})[2] == ()
+
+
+def test_queries_over_budget_are_forbidden(mock_requests_post) -> None:
+    flask_app = get_flask_app(
+        upstream_url="http://localhost:4000/",
+        upstream_graphql_path="/graphql",
+        users_config=Users(users=[User(username="ann", email="ann@company.com", groups=["analysts"])]),
+        groups_config=_groups_config(),
+    )
+    with flask_app.test_client() as client:
+        headers = get_test_headers("ann@company.com", "ann")
+        response = client.post("/graphql", json={"query": ASSETS_QUERY, "variables": {"first": 10}}, headers=headers)
+        assert response.status_code == 200
+
+        response = client.post("/graphql", json={"query": ASSETS_QUERY, "variables": {"first": 100}}, headers=headers)
+        assert response.status_code == 403
+        error = response.get_json()["errors"][0]
+        assert error["extensions"]["code"] == "FORBIDDEN"
+        assert error["extensions"]["reason"] == "Query cost 2601 exceeds the budget of 500"
+        assert mock_requests_post.call_count == 1
@@ -1,3 +1,4 @@
+import json
 from unittest.mock import Mock, patch
 
 from .fixtures import (
@@ -54,10 +55,12 @@ def test_proxy_arbitrary_route(client) -> None:
     assert response.status_code in (200, 502)
 
 def test_proxy_upstream_error(client) -> None:
-    with patch("requests.request") as mock_request:
+    with patch("requests.Session.request") as mock_request:
         mock_response = Mock()
         mock_response.status_code = 500
         mock_response.content = b""
+        mock_response.raw.read.return_value = mock_response.content
+        mock_response.raw.stream.side_effect = lambda *args, **kwargs: iter([mock_response.content])
         mock_response.headers = {}
         mock_request.return_value = mock_response
         response = client.get("/foo/bar", headers=get_test_headers("kgmcquate@gmail.com", "kgmcquate"))
@@ -78,8 +81,75 @@ def test_malformed_query(client) -> None:
     response = client.post("/graphql", json={"query": "not a valid graphql"}, headers=get_test_headers("kgmcquate@gmail.com", "kgmcquate"))
     assert response.status_code == 500
 
+def test_field_selected_with_and_without_sub_fields(client) -> None:
+    query = '{ getUser(name: "Ann") getUser(name: "Ann") { id } }'
+    response = client.post("/graphql", json={"query": query}, headers=get_test_headers("bob@company.com", "bob"))
+    assert response.status_code == 400
+    assert response.get_json()["errors"][0]["extensions"]["code"] == "GRAPHQL_VALIDATION_FAILED"
+
 def test_large_payload(client) -> None:
     large_query = "{" + "a" * 10000 + "}"
     response = client.post("/graphql", json={"query": large_query}, headers=get_test_headers("kgmcquate@gmail.com", "kgmcquate"))
     assert response.status_code in (200, 502, 400, 413)
 
+
+def test_graphql_body_is_forwarded_as_received(client, mock_requests_post) -> None:
+    body = b'{"query": "{ getUser(name: \\"Ann\\") { id } }",   "variables": {}}'
+    headers = {**get_test_headers("bob@company.com", "bob"), "Content-Type": "application/json"}
+    response = client.post("/graphql", data=body, headers=headers)
+    assert response.status_code == 200
+    assert mock_requests_post.call_args.kwargs["data"] is not None
+    assert mock_requests_post.call_args.kwargs["data"] == body
+
+def test_form_encoded_graphql_body_is_forwarded(client, mock_requests_post) -> None:
+    response = client.post(
+        "/graphql",
+        data={"query": "{ getUser { id } }"},
+        headers=get_test_headers("kgmcquate@gmail.com", "kgmcquate"),
+    )
+    assert response.status_code == 200
+    assert mock_requests_post.call_args.kwargs["data"] == b"query=%7B+getUser+%7B+id+%7D+%7D"
+
+
+def test_fragment_cycle_rejected(client, mock_requests_post) -> None:
+    query = "{ ...A } fragment A on Query { pipelineRunsOrError { ...B } } fragment B on Query { ...A }"
+    response = client.post("/graphql", json={"query": query}, headers=get_test_headers("bob@company.com", "bob-gh"))
+    assert response.status_code == 400
+    error = response.get_json()["errors"][0]
+    assert error["message"] == "Cannot spread fragment 'A' within itself via 'B'."
+    assert error["extensions"]["code"] == "GRAPHQL_VALIDATION_FAILED"
+    mock_requests_post.assert_not_called()
+
+
+def test_fragment_bomb_rejected(client, mock_requests_post) -> None:
+    definitions = [f"fragment F{i} on Query {{ a: f {{ ...F{i + 1} }} b: f {{ ...F{i + 1} }} }}" for i in range(40)]
+    query = "{ ...F0 } " + " ".join(definitions) + " fragment F40 on Query { id }"
+    response = client.post("/graphql", json={"query": query}, headers=get_test_headers("bob@company.com", "bob-gh"))
+    assert response.status_code == 400
+    assert response.get_json()["errors"][0]["extensions"]["code"] == "GRAPHQL_VALIDATION_FAILED"
+    mock_requests_post.assert_not_called()
+
+
+def test_batched_operations_are_authorized_one_by_one(client, mock_requests_post) -> None:
+    batch = [
+        {"query": '{ getUser(name: "Ann") { id } }'},
+        {"query": "mutation { deletePipelineRun { id } }"},
+        {"query": 'query Second { getUser(name: "Ann") { name } }', "operationName": "Second"},
+    ]
+    response = client.post("/graphql", json=batch, headers=get_test_headers("bob@company.com", "bob-gh"))
+    assert response.status_code == 200
+    results = response.get_json()
+    assert len(results) == 3
+    assert results[0] == {"data": {"result": "mocked"}}
+    assert results[1]["errors"][0]["extensions"]["code"] == "FORBIDDEN"
+    assert results[2] == {"data": {"result": "mocked"}}
+    forwarded = sorted(json.loads(call.kwargs["data"])["query"] for call in mock_requests_post.call_args_list)
+    assert forwarded == ['query Second { getUser(name: "Ann") { name } }', '{ getUser(name: "Ann") { id } }']
+
+
+def test_batch_size_is_limited(client, mock_requests_post) -> None:
+    batch = [{"query": "{ __typename }"}] * 33
+    response = client.post("/graphql", json=batch, headers=get_test_headers("bob@company.com", "bob-gh"))
+    assert response.status_code == 400
+    assert response.get_json()["errors"][0]["extensions"]["code"] == "BAD_REQUEST"
+    mock_requests_post.assert_not_called()
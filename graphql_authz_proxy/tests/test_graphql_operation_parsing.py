@@ -1,7 +1,16 @@
 import json
-from graphql import parse
+import pytest
+from graphql import OperationType, parse
 
-from graphql_authz_proxy.authz.utils import convert_fields_to_dict, render_fields
+from graphql_authz_proxy.authz.utils import (
+    FragmentExpansion,
+    FragmentExpansionError,
+    convert_fields_to_dict,
+    field_trees,
+    render_fields,
+    sniff_operation_types,
+)
+from graphql_authz_proxy.cache import CachedDocument
 
 SIMPLE_QUERY = """
 query HeroQuery($heroName: String!) {
@@ -131,4 +140,72 @@ def test_array_variables() -> None:
     assert field_dict["getUser"]["arguments"]["names"] == ["Ann", "Bob", "Sue"]
     assert field_dict["getUser"]["selection_set"] is not None
     assert "id" in field_dict["getUser"]["selection_set"]
-    assert "name" in field_dict["getUser"]["selection_set"]
\ No newline at end of file
+    assert "name" in field_dict["getUser"]["selection_set"]
+
+
+def _fragments(document) -> dict:
+    return {definition.name.value: definition for definition in document.definitions[1:]}
+
+
+def test_render_fields_reuses_fragment_expansions() -> None:
+    document = parse("""
+    query Q($id: ID) { a { ...F id } b { ...F } }
+    fragment F on T { id node(id: $id) { name } }
+    """)
+    expansion = FragmentExpansion()
+    fields = render_fields(_fragments(document), {"id": "1"}, document.definitions[0].selection_set, expansion)
+    field_dict = convert_fields_to_dict(fields)
+    # Appending to a spread fragment's fields must not change the fields of other spreads.
+    assert len(field_dict["a"]["selection_set"]["id"]) == 2
+    assert field_dict["b"]["selection_set"]["id"] == {"arguments": {}, "selection_set": None}
+    assert field_dict["b"]["selection_set"]["node"]["arguments"] == {"id": "1"}
+    assert list(expansion.memo) == ["F"]
+    assert expansion.remaining == expansion.max_fields - 9
+
+
+def test_field_trees_leave_the_cached_document_unchanged() -> None:
+    document = CachedDocument.from_query('{ a(ids: [1, 2], where: {tags: ["x"]}) b { c(ids: [3]) { d } } }')
+    [a, b] = document.operations[0].selection_set.selections
+    value_nodes = [a.arguments[0].value, a.arguments[1].value, b.selection_set.selections[0].arguments[0].value]
+    before = [(node, node.to_dict()) for node in value_nodes]
+    for _ in range(2):
+        [(_, field_dict)] = list(field_trees(document, {}))
+    assert [(node, node.to_dict()) for node in value_nodes] == before
+    assert field_dict["a"]["arguments"]["ids"]["values"][0]["value"] == "1"
+
+
+def test_render_fields_rejects_fragment_cycles() -> None:
+    document = parse("{ ...A } fragment A on Q { x { ...B } } fragment B on Q { y { ...A } }")
+    with pytest.raises(FragmentExpansionError, match="Cannot spread fragment 'A' within itself via 'B'."):
+        render_fields(_fragments(document), {}, document.definitions[0].selection_set)
+
+
+def test_render_fields_limits_expanded_fields() -> None:
+    # Every fragment doubles the fields of the next one: 2 ** 30 fields in total.
+    definitions = [f"fragment F{i} on Q {{ a: f {{ ...F{i + 1} }} b: f {{ ...F{i + 1} }} }}" for i in range(30)]
+    document = parse("{ ...F0 } " + " ".join(definitions) + " fragment F30 on Q { id }")
+    with pytest.raises(FragmentExpansionError, match="more than 1000 fields"):
+        render_fields(_fragments(document), {}, document.definitions[0].selection_set, FragmentExpansion(1000))
+
+
+def test_sniff_operation_types() -> None:
+    assert sniff_operation_types("{ a }") == (OperationType.QUERY,)
+    assert sniff_operation_types("mutation M { a(b: \"} query\") }") == (OperationType.MUTATION,)
+    assert sniff_operation_types(
+        "# mutation {\nquery Q { ...F } fragment F on Query { a } subscription { b }",
+    ) == (OperationType.QUERY, OperationType.SUBSCRIPTION)
+    assert sniff_operation_types("") == ()
+    # Anything the sniff cannot read at the top level is left to the parser.
+    for query in ("not a valid graphql", "{ a ", '"""description""" query { a }', "query { a }}"):
+        assert sniff_operation_types(query) is None
+
+
+def test_sniff_ends_comments_at_either_line_terminator() -> None:
+    query = "# x\rmutation M { launchRun { id } }\nquery Q { a }"
+    assert sniff_operation_types(query) == (OperationType.MUTATION, OperationType.QUERY)
+    assert [definition.operation for definition in parse(query).definitions] == [
+        OperationType.MUTATION, OperationType.QUERY,
+    ]
+    # Characters the lexer does not accept at the top level are left to the parser.
+    for query in ("query\u00a0{ a }", "{ a }\u2028mutation { b }", "@d query { a }", "query { a } ;"):
+        assert sniff_operation_types(query) is None
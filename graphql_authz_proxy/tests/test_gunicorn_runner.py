@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from graphql_authz_proxy.gunicorn_runner import GunicornApp, gunicorn_options
+
+from .fixtures import (
+    get_test_headers,
+    client,
+    users_config,
+    groups_config,
+    mock_requests_post
+)
+
+
+def test_worker_settings_are_passed_to_gunicorn(client) -> None:
+    options = gunicorn_options(
+        client.application,
+        "127.0.0.1",
+        5000,
+        worker_class="gthread",
+        threads=8,
+        keepalive=5,
+        backlog=512,
+        graceful_timeout=10,
+        max_requests=1000,
+        max_requests_jitter=50,
+    )
+    cfg = GunicornApp(client.application, options).cfg
+    assert cfg.worker_class_str == "gthread"
+    assert cfg.threads == 8
+    assert cfg.keepalive == 5
+    assert cfg.backlog == 512
+    assert cfg.graceful_timeout == 10
+    assert cfg.max_requests == 1000
+    assert cfg.max_requests_jitter == 50
+
+
+def test_threads_switch_sync_workers_to_gthread(client) -> None:
+    assert gunicorn_options(client.application, "127.0.0.1", 5000, threads=4)["worker_class"] == "gthread"
+    assert gunicorn_options(client.application, "127.0.0.1", 5000)["worker_class"] == "sync"
+
+
+def test_unknown_worker_class_is_rejected(client) -> None:
+    with pytest.raises(ValueError, match="Unsupported worker class"):
+        gunicorn_options(client.application, "127.0.0.1", 5000, worker_class="eventlet")
+
+
+def test_shared_caches_are_consistent_under_concurrent_requests(client) -> None:
+    flask_app = client.application
+    headers = get_test_headers("bob@company.com", "bob")
+    queries = [f'{{ getUser(name: "Ann") {{ id f{index} }} }}' for index in range(8)]
+    requests_per_thread = 25
+
+    def _send(thread: int) -> list[int]:
+        with flask_app.test_client() as thread_client:
+            return [
+                thread_client.post(
+                    "/graphql", json={"query": queries[(thread + index) % len(queries)]}, headers=headers,
+                ).status_code
+                for index in range(requests_per_thread)
+            ]
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        statuses = [status for result in executor.map(_send, range(16)) for status in result]
+
+    assert statuses == [200] * 16 * requests_per_thread
+    caches = client.get("/health").get_json()["caches"]
+    assert caches["documents"]["entries"] == len(queries)
+    assert caches["documents"]["hits"] + caches["documents"]["misses"] == len(statuses)
+    assert caches["decisions"]["entries"] == len(queries)
+    assert caches["decisions"]["hits"] + caches["decisions"]["misses"] == len(statuses)
@@ -0,0 +1,264 @@
+import base64
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from graphql_authz_proxy.identity_providers.github import GitHubIdentityProvider
+from graphql_authz_proxy.identity_providers.introspection import IntrospectionIdentityProvider
+from graphql_authz_proxy.identity_providers.main import get_identity_provider
+from graphql_authz_proxy.identity_providers.oidc import OIDCIdentityProvider
+from graphql_authz_proxy.models import Groups
+from graphql_authz_proxy.pipeline import Identity, validate_identity
+
+
+class _GitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    calls: list[str] = []
+
+    def do_POST(self) -> None:
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        token = self.headers["Authorization"].removeprefix("token ")
+        self.calls.append(token)
+        if token == "valid":
+            teams = {"nodes": [{"slug": "admins"}]} if request["variables"]["login"] == "bob" else {"nodes": []}
+            organization = {"login": "acme"}
+            if request["variables"]["withTeams"]:
+                organization["teams"] = teams
+            viewer = {"login": "bob", "email": "bob@company.com", "organizations": {"nodes": [organization]}}
+            status, body = 200, json.dumps({"data": {"viewer": viewer}}).encode()
+        elif token == "limited":
+            status, body = 403, b'{"message": "API rate limit exceeded"}'
+        else:
+            status, body = 401, b'{"message": "Bad credentials"}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def github_api_url():
+    _GitHubHandler.calls = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _GitHubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_github_token_validations_are_cached(github_api_url) -> None:
+    provider = GitHubIdentityProvider(api_url=github_api_url)
+    assert provider.validate_token("valid", "bob", "bob@company.com") == (True, None)
+    assert provider.validate_token("valid", "alice", None) == (False, "Username mismatch: header=alice github=bob")
+    assert provider.validate_token("invalid", "bob", None) == (False, "GitHub token invalid")
+    assert provider.validate_token("invalid", "bob", None) == (False, "GitHub token invalid")
+    assert _GitHubHandler.calls == ["valid", "valid", "invalid"]
+    assert provider.cache_stats().hits == 1
+
+
+def test_github_orgs_and_teams_come_from_one_cached_lookup(github_api_url) -> None:
+    provider = GitHubIdentityProvider(api_url=github_api_url)
+    assert provider.validate_token("valid", "bob", None) == (True, None)
+    assert provider.get_groups("valid", "bob") == ["acme", "acme:admins"]
+    assert provider.get_groups("valid", None) == ["acme"]
+    assert _GitHubHandler.calls == ["valid", "valid"]
+
+
+def test_github_groups_are_mapped_to_local_groups(github_api_url) -> None:
+    groups_config = Groups.model_validate({
+        "groups": [
+            {"name": "admin", "idp_groups": ["acme:admins"], "permissions": {}},
+            {"name": "members", "idp_groups": ["acme"], "permissions": {}},
+        ],
+    })
+    config = {
+        "validate_token": True,
+        "groups_config": groups_config,
+        "identity_provider": GitHubIdentityProvider(api_url=github_api_url),
+    }
+    identity = Identity(user=None, username="bob", user_email="", access_token="valid", group_names=frozenset({"x"}))
+    assert validate_identity(config, identity).group_names == {"x", "admin", "members"}
+    assert validate_identity({**config, "validate_token": False}, identity) is identity
+
+
+def test_github_rate_limit_responses_are_not_cached(github_api_url) -> None:
+    provider = GitHubIdentityProvider(api_url=github_api_url)
+    assert provider.validate_token("limited", "bob", None)[0] is False
+    assert provider.validate_token("limited", "bob", None)[0] is False
+    assert _GitHubHandler.calls == ["limited", "limited"]
+
+
+def test_concurrent_validations_of_a_token_share_one_call(github_api_url) -> None:
+    provider = GitHubIdentityProvider(api_url=github_api_url)
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda _: provider.validate_token("valid", "bob", None), range(32)))
+    assert results == [(True, None)] * 32
+    assert _GitHubHandler.calls == ["valid"]
+
+
+def test_identity_providers_are_reused() -> None:
+    assert get_identity_provider("github", token_cache_ttl=60) is get_identity_provider("github", token_cache_ttl=60)
+    assert get_identity_provider("github", token_cache_ttl=60) is not get_identity_provider("github", token_cache_ttl=30)
+
+
+class _OIDCHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    calls: list[str] = []
+    jwks: dict = {"keys": []}
+
+    def do_GET(self) -> None:
+        self.calls.append(self.path)
+        issuer = f"http://{self.headers['Host']}"
+        if self.path == "/.well-known/openid-configuration":
+            body = json.dumps({"issuer": issuer, "jwks_uri": f"{issuer}/keys"}).encode()
+        else:
+            body = json.dumps(self.jwks).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def _signing_key(kid: str) -> tuple[rsa.RSAPrivateKey, dict]:
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    return private_key, {**jwk, "kid": kid, "alg": "RS256", "use": "sig"}
+
+
+@pytest.fixture
+def oidc_issuer():
+    _OIDCHandler.calls = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OIDCHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _token(private_key, kid: str, issuer: str, **claims) -> str:
+    payload = {"iss": issuer, "aud": "proxy", "exp": int(time.time()) + 3600, "preferred_username": "bob", **claims}
+    return jwt.encode(payload, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+def test_oidc_tokens_are_verified_with_cached_keys(oidc_issuer) -> None:
+    private_key, jwk = _signing_key("key-1")
+    _OIDCHandler.jwks = {"keys": [jwk]}
+    provider = OIDCIdentityProvider(oidc_issuer, audience="proxy")
+
+    assert provider.validate_token(_token(private_key, "key-1", oidc_issuer), "bob", None) == (True, None)
+    assert provider.validate_token(_token(private_key, "key-1", oidc_issuer, n=1), "bob", None) == (True, None)
+    assert provider.validate_token(_token(private_key, "key-1", oidc_issuer), "alice", None) == (
+        False, "Username mismatch: header=alice oidc=bob",
+    )
+    assert _OIDCHandler.calls == ["/.well-known/openid-configuration", "/keys"]
+
+    assert provider.validate_token(_token(private_key, "key-1", oidc_issuer, aud="other"), None, None)[0] is False
+    assert provider.validate_token(_token(private_key, "key-1", "http://evil"), None, None)[0] is False
+    assert provider.validate_token(_token(private_key, "key-1", oidc_issuer, exp=1), None, None)[0] is False
+    forged_key, _ = _signing_key("key-1")
+    assert provider.validate_token(_token(forged_key, "key-1", oidc_issuer), None, None)[0] is False
+    assert len(_OIDCHandler.calls) == 2
+
+
+def test_oidc_keys_are_refetched_for_unknown_key_ids_at_a_limited_rate(oidc_issuer) -> None:
+    old_key, old_jwk = _signing_key("old")
+    new_key, new_jwk = _signing_key("new")
+    _OIDCHandler.jwks = {"keys": [old_jwk]}
+    provider = OIDCIdentityProvider(jwks_uri=f"{oidc_issuer}/keys", jwks_refresh_interval=0.2)
+
+    assert provider.validate_token(_token(old_key, "old", oidc_issuer, aud=None), None, None) == (True, None)
+    _OIDCHandler.jwks = {"keys": [old_jwk, new_jwk]}
+    # Within the refresh interval the unknown key is not fetched again.
+    assert provider.validate_token(_token(new_key, "new", oidc_issuer, aud=None), None, None)[0] is False
+    assert _OIDCHandler.calls == ["/keys"]
+    time.sleep(0.2)
+    assert provider.validate_token(_token(new_key, "new", oidc_issuer, aud=None, n=1), None, None) == (True, None)
+    assert _OIDCHandler.calls == ["/keys", "/keys"]
+
+
+class _IntrospectionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    calls: list[str] = []
+    delay = 0.0
+
+    def do_POST(self) -> None:
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        token = form["token"][0]
+        self.calls.append(token)
+        time.sleep(self.delay)
+        if self.headers.get("Authorization") != "Basic " + base64.b64encode(b"proxy:secret").decode():
+            status, response = 401, {"error": "invalid_client"}
+        elif token == "active":
+            status, response = 200, {
+                "active": True, "username": "bob", "exp": int(time.time()) + 3600, "groups": ["engineering"],
+            }
+        else:
+            status, response = 200, {"active": False}
+        body = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def introspection_url():
+    _IntrospectionHandler.calls = []
+    _IntrospectionHandler.delay = 0.0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _IntrospectionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/introspect"
+    server.shutdown()
+    server.server_close()
+
+
+def test_introspection_results_are_cached(introspection_url) -> None:
+    provider = get_identity_provider(
+        "introspection", introspection_url=introspection_url, client_id="proxy", client_secret="secret",
+    )
+    assert provider.validate_token("active", "bob", None) == (True, None)
+    assert provider.validate_token("active", "alice", None) == (
+        False, "Username mismatch: header=alice introspection=bob",
+    )
+    assert provider.get_groups("active", "bob") == ["engineering"]
+    assert provider.validate_token("revoked", "bob", None) == (False, "Token invalid: token not active")
+    assert provider.validate_token("revoked", "bob", None) == (False, "Token invalid: token not active")
+    assert _IntrospectionHandler.calls == ["active", "revoked"]
+
+
+def test_introspection_failures_are_not_cached(introspection_url) -> None:
+    provider = IntrospectionIdentityProvider(introspection_url, client_id="proxy", client_secret="wrong")
+    assert provider.validate_token("active", "bob", None) == (False, "Token invalid: introspection failed")
+    assert provider.validate_token("active", "bob", None) == (False, "Token invalid: introspection failed")
+    assert _IntrospectionHandler.calls == ["active", "active"]
+
+
+def test_introspections_in_flight_are_bounded(introspection_url) -> None:
+    _IntrospectionHandler.delay = 0.1
+    provider = IntrospectionIdentityProvider(
+        introspection_url, client_id="proxy", client_secret="secret", max_in_flight=2, timeout=0.15,
+    )
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(executor.map(lambda index: provider.validate_token(f"token-{index}", None, None), range(6)))
+    # Two introspections run at a time; requests still waiting after the timeout fail without being cached.
+    assert results.count((False, "Token invalid: introspection timed out")) >= 2
+    assert results.count((False, "Token invalid: token not active")) >= 2
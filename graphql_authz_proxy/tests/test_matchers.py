@@ -0,0 +1,57 @@
+import pytest
+
+from graphql_authz_proxy.authz.matchers import ObjectMatcher, PathMatcher
+from graphql_authz_proxy.authz.utils import get_value_of_jsonpath
+from graphql_authz_proxy.models import ArgumentRule
+
+
+@pytest.mark.parametrize(
+    ("data", "path"),
+    [
+        ({"a": {"b": 1}}, "a.b"),
+        ({"a": [{"b": 1}, {"b": 2}]}, "a.b"),
+        ({"a": [1, 2]}, "a"),
+        ({"a": None}, "a"),
+        ({"a": "s"}, "a.b"),
+        ("str", "a"),
+        ([{"a": 1}], "a"),
+        ({}, "a"),
+        ({"where": 1}, "where"),
+        ({"a-b": 1}, "a-b"),
+        ({"a": [{"b": 1}, {"b": 2}]}, "a[*].b"),
+        ({"a": {"b": {}}}, "a.b"),
+    ],
+)
+def test_path_matcher_extracts_like_jsonpath(data, path) -> None:
+    assert PathMatcher.compile(path, None).extract(data) == get_value_of_jsonpath(data, path)
+
+
+def test_plain_paths_do_not_use_jsonpath() -> None:
+    assert PathMatcher.compile("assetKey.path", ["a"]).expression is None
+    assert PathMatcher.compile("assets[*].path", ["a"]).expression is not None
+
+
+def test_object_matcher_all_and_any() -> None:
+    matcher = ObjectMatcher.compile({"assetKey": {"path": ["a"]}, "limit": 10})
+    assert matcher.all_match({"assetKey": {"path": ["a"]}, "limit": 10})
+    assert not matcher.all_match({"assetKey": {"path": ["a"]}, "limit": 20})
+    assert matcher.any_match({"assetKey": {"path": ["a"]}, "limit": 20})
+    assert not matcher.any_match({"assetKey": {"path": ["b"]}})
+
+
+def test_extracted_values_are_memoized() -> None:
+    matcher = PathMatcher.compile("assetKey.path", ["a"])
+    value = {"assetKey": {"path": ["a"]}}
+    memo = {}
+    assert matcher.matches(value, memo)
+    assert memo == {(id(value), "assetKey.path"): ["a"]}
+    # A memoized value is used instead of looking the path up again.
+    memo[(id(value), "assetKey.path")] = ["b"]
+    assert not matcher.matches(value, memo)
+
+
+def test_argument_rule_compiles_dict_values_at_load() -> None:
+    rule = ArgumentRule(argument_name="assetKey", values=["plain", {"path": ["a"]}])
+    plain, compiled = rule.value_matchers
+    assert plain is None
+    assert compiled.paths[0].keys == ("path",)
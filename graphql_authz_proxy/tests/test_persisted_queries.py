@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from graphql_authz_proxy.cache import hash_query
+from graphql_authz_proxy.flask_app import get_flask_app
+
+from .fixtures import (
+    get_test_headers,
+    client,
+    users_config,
+    groups_config,
+    mock_requests_post
+)
+
+QUERY = "query GetUser { getUser(name: \"Ann\") { id } }"
+QUERY_HASH = hash_query(QUERY)
+
+
+def _apq_body(query: str | None = None, query_hash: str = QUERY_HASH) -> dict:
+    body = {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": query_hash}}}
+    if query is not None:
+        body["query"] = query
+    return body
+
+
+def test_unknown_hash_returns_not_found(client) -> None:
+    response = client.post("/graphql", json=_apq_body(), headers=get_test_headers("bob@company.com", "bob"))
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["errors"][0]["extensions"]["code"] == "PERSISTED_QUERY_NOT_FOUND"
+
+
+def test_hash_mismatch_is_rejected(client) -> None:
+    response = client.post(
+        "/graphql",
+        json=_apq_body(QUERY, query_hash="0" * 64),
+        headers=get_test_headers("bob@company.com", "bob"),
+    )
+    assert response.status_code == 400
+
+
+def test_registered_hash_is_authorized_and_forwarded_with_query(client, mock_requests_post) -> None:
+    headers = get_test_headers("bob@company.com", "bob")
+    register = client.post("/graphql", json=_apq_body(QUERY), headers=headers)
+    assert register.status_code == 200
+
+    response = client.post("/graphql", json=_apq_body(), headers=headers)
+    assert response.status_code == 200
+    forwarded = json.loads(mock_requests_post.call_args.kwargs["data"])
+    assert forwarded["query"] == QUERY
+    assert "extensions" not in forwarded
+
+
+def test_registered_hash_is_still_authorized(client) -> None:
+    denied_query = "mutation { deletePipelineRun { id } }"
+    headers = get_test_headers("bob@company.com", "bob")
+    client.post("/graphql", json=_apq_body(denied_query, hash_query(denied_query)), headers=headers)
+    response = client.post("/graphql", json=_apq_body(query_hash=hash_query(denied_query)), headers=headers)
+    assert response.status_code == 403
+
+
+@pytest.fixture
+def apq_client(users_config, groups_config):
+    flask_app = get_flask_app(
+        upstream_url="http://localhost:4000/",
+        upstream_graphql_path="/graphql",
+        users_config=users_config,
+        groups_config=groups_config,
+        upstream_supports_apq=True,
+    )
+    with flask_app.test_client() as client:
+        yield client
+
+
+def test_hash_forwarded_unchanged_when_upstream_supports_apq(apq_client, mock_requests_post) -> None:
+    headers = get_test_headers("bob@company.com", "bob")
+    apq_client.post("/graphql", json=_apq_body(QUERY), headers=headers)
+    response = apq_client.post("/graphql", json=_apq_body(), headers=headers)
+    assert response.status_code == 200
+    forwarded = json.loads(mock_requests_post.call_args.kwargs["data"])
+    assert "query" not in forwarded
+    assert forwarded["extensions"]["persistedQuery"]["sha256Hash"] == QUERY_HASH
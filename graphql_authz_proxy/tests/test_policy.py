@@ -0,0 +1,357 @@
+import json
+
+import pytest
+from graphql import OperationType
+from pydantic import ValidationError
+
+from graphql_authz_proxy.authz.policy import CompiledPolicy, OperationAccess, classify_access
+from graphql_authz_proxy.cache import DocumentCache
+from graphql_authz_proxy.flask_app import get_flask_app
+from graphql_authz_proxy.models import (
+    ArgumentRule,
+    CostPolicy,
+    FieldRule,
+    Group,
+    Groups,
+    MutationPolicy,
+    Permissions,
+    PolicyEffect,
+    QueryPolicy,
+    User,
+    Users,
+)
+
+from .fixtures import (
+    get_test_headers,
+    client,
+    users_config,
+    groups_config,
+    mock_requests_post
+)
+
+
+def _groups_config(default_groups: list[str] | None = None) -> Groups:
+    return Groups(
+        groups=[
+            Group(
+                name="viewers",
+                idp_groups=["sso-viewers"],
+                permissions=Permissions(
+                    queries=QueryPolicy(effect=PolicyEffect.ALLOW, fields=[FieldRule(field_name="getUser")]),
+                ),
+            ),
+            Group(
+                name="auditors",
+                permissions=Permissions(
+                    queries=QueryPolicy(effect=PolicyEffect.ALLOW, fields=[FieldRule(field_name="getAuditLog")]),
+                ),
+            ),
+        ],
+        default_groups=default_groups,
+    )
+
+
+def test_rule_bundles_are_shared_per_group_set() -> None:
+    policy = CompiledPolicy(_groups_config())
+    first = policy.rules_for(frozenset({"viewers", "auditors"}))
+    second = policy.rules_for(frozenset({"auditors", "viewers"}))
+    assert first is second
+    assert [rule.field_name for rule in first.query_field_allowances] == ["getAuditLog", "getUser"]
+    assert policy.bundle_count() == 1
+
+
+def test_rule_bundles_are_immutable() -> None:
+    bundle = CompiledPolicy(_groups_config()).rules_for(frozenset({"viewers"}))
+    with pytest.raises(ValidationError):
+        bundle.query_field_allowances = ()
+
+
+def test_default_groups_bundle_is_compiled_at_startup() -> None:
+    policy = CompiledPolicy(_groups_config(default_groups=["viewers"]))
+    assert policy.bundle_count() == 1
+    assert policy.rules_for(policy.default_group_names).query_field_allowances[0].field_name == "getUser"
+
+
+def test_unknown_group_names_are_ignored(groups_config) -> None:
+    bundle = CompiledPolicy(groups_config).rules_for(frozenset({"viewers", "does-not-exist"}))
+    assert bundle == CompiledPolicy(groups_config).rules_for(frozenset({"viewers"}))
+
+
+def test_idp_groups_are_added_to_the_group_set() -> None:
+    flask_app = get_flask_app(
+        upstream_url="http://localhost:4000/",
+        upstream_graphql_path="/graphql",
+        users_config=Users(users=[]),
+        groups_config=_groups_config(default_groups=["auditors"]),
+    )
+    with flask_app.test_client() as client:
+        headers = {**get_test_headers("ann@company.com", "ann"), "X-Forwarded-Groups": "sso-viewers"}
+        response = client.post("/graphql", json={"query": "{ getUser { id } }"}, headers=headers)
+        assert response.status_code == 200
+
+        response = client.post("/graphql", json={"query": "{ getUser { id } }"}, headers=get_test_headers("a", "b"))
+        assert response.status_code == 403
+
+
+PAGED_QUERY = """
+query GetUser($name: String!, $cursor: String) {
+  getUser(name: $name, cursor: $cursor) {
+    id
+  }
+}
+"""
+
+
+def test_decisions_ignore_variables_not_inspected_by_rules(client) -> None:
+    headers = get_test_headers("bob@company.com", "bob")
+    for cursor in ("a", "b", "c"):
+        response = client.post(
+            "/graphql",
+            json={"query": PAGED_QUERY, "variables": {"name": "Ann", "cursor": cursor}},
+            headers=headers,
+        )
+        assert response.status_code == 200
+    stats = client.get("/health").get_json()["caches"]["decisions"]
+    assert stats["entries"] == 1
+    assert stats["hits"] == 2
+
+
+def test_decisions_depend_on_variables_inspected_by_rules(client) -> None:
+    headers = get_test_headers("bob@company.com", "bob")
+    allowed = client.post("/graphql", json={"query": PAGED_QUERY, "variables": {"name": "Ann"}}, headers=headers)
+    denied = client.post("/graphql", json={"query": PAGED_QUERY, "variables": {"name": "Bob"}}, headers=headers)
+    assert allowed.status_code == 200
+    assert denied.status_code == 403
+    assert client.get("/health").get_json()["caches"]["decisions"]["entries"] == 2
+
+
+def test_decisions_are_dropped_when_groups_config_is_replaced(client) -> None:
+    headers = get_test_headers("bob@company.com", "bob")
+    query = {"query": PAGED_QUERY, "variables": {"name": "Ann"}}
+    assert client.post("/graphql", json=query, headers=headers).status_code == 200
+
+    client.application.config["groups_config"] = Groups(
+        groups=[
+            Group(
+                name="viewers",
+                permissions=Permissions(queries=QueryPolicy(effect=PolicyEffect.DENY)),
+            ),
+        ],
+    )
+    assert client.post("/graphql", json=query, headers=headers).status_code == 403
+
+
+def test_decision_key_uses_only_relevant_variables(groups_config) -> None:
+    policy = CompiledPolicy(groups_config)
+    document = DocumentCache().parse(PAGED_QUERY)
+    viewers = frozenset({"viewers"})
+    assert policy.decision_key(viewers, document, {"name": "Ann", "cursor": "a"}) == policy.decision_key(
+        viewers, document, {"name": "Ann", "cursor": "b"}
+    )
+    assert policy.decision_key(viewers, document, {"name": "Ann"}) != policy.decision_key(
+        viewers, document, {"name": "Bob"}
+    )
+    # The admin group has no argument rules, so no variable is relevant.
+    assert policy.decision_key(frozenset({"admin"}), document, {"name": "Ann"})[2] == ()
+
+
+def test_identities_are_resolved_once_per_identity_headers(client) -> None:
+    headers = get_test_headers("bob@company.com", "bob")
+    query = {"query": PAGED_QUERY, "variables": {"name": "Ann"}}
+    assert client.post("/graphql", json=query, headers=headers).status_code == 200
+    assert client.post("/graphql", json=query, headers=headers).status_code == 200
+    assert client.post("/graphql", json=query, headers={**headers, "X-Forwarded-Groups": "a,b"}).status_code == 200
+    identities = client.get("/health").get_json()["caches"]["identities"]
+    assert identities["entries"] == 2
+    assert identities["hits"] == 1
+
+
+def test_idp_groups_resolve_to_a_frozenset() -> None:
+    groups_config = Groups(
+        groups=[
+            Group(name="viewers", idp_groups=["ad-readers", "ad-staff"], permissions=Permissions()),
+            Group(name="admin", idp_groups=["ad-admins"], permissions=Permissions()),
+        ],
+    )
+    assert groups_config.get_idp_groups(["ad-staff", "ad-readers", "unknown"]) == frozenset({"viewers"})
+    assert groups_config.get_idp_groups([]) == frozenset()
+
+
+def _templated_groups_config() -> Groups:
+    return Groups(
+        groups=[
+            Group(
+                name="self-service",
+                permissions=Permissions(
+                    queries=QueryPolicy(
+                        effect=PolicyEffect.ALLOW,
+                        fields=[
+                            FieldRule(
+                                field_name="getUser",
+                                arguments=[ArgumentRule(argument_name="name", values=["{{ username }}", "support"])],
+                            ),
+                        ],
+                    ),
+                ),
+            ),
+        ],
+        default_groups=["self-service"],
+    )
+
+
+def test_jinja_templates_render_per_request_without_changing_the_config() -> None:
+    groups_config = _templated_groups_config()
+    flask_app = get_flask_app(
+        upstream_url="http://localhost:4000/",
+        upstream_graphql_path="/graphql",
+        users_config=Users(users=[]),
+        groups_config=groups_config,
+        enable_config_jinja=True,
+    )
+    query = 'query($name: String!) { getUser(name: $name) { id } }'
+    with flask_app.test_client() as client:
+        for username, name, status in [("ann", "ann", 200), ("bob", "ann", 403), ("bob", "bob", 200), ("ann", "support", 200)]:
+            headers = {"X-Forwarded-User": username, "X-Forwarded-Email": f"{username}@company.com"}
+            response = client.post("/graphql", json={"query": query, "variables": {"name": name}}, headers=headers)
+            assert response.status_code == status
+        caches = client.get("/health").get_json()["caches"]
+        assert caches["rendered_rules"]["entries"] == 2
+        assert caches["rendered_rules"]["hits"] == 2
+        assert caches["decisions"]["entries"] == 4
+
+    argument_rule = groups_config.groups[0].permissions.queries.fields[0].arguments[0]
+    assert argument_rule.values == ["{{ username }}", "support"]
+
+
+def test_rules_without_templates_are_not_rendered(groups_config) -> None:
+    bundle = CompiledPolicy(groups_config).rules_for(frozenset({"viewers"}))
+    assert not bundle.has_templates
+    assert bundle.render({"username": "ann"}) is bundle
+    templated = CompiledPolicy(_templated_groups_config()).rules_for(frozenset({"self-service"}))
+    assert templated.has_templates
+    rendered = templated.render({"username": "ann"})
+    assert rendered.query_field_allowances[0].arguments[0].values == ["ann", "support"]
+
+
+def test_rendered_values_are_not_compiled_as_templates() -> None:
+    policy = CompiledPolicy(_templated_groups_config())
+    for username in ("a{{b", "{{ username }}", "{% x"):
+        rendered, _ = policy.rendered_rules_for(frozenset({"self-service"}), {"username": username})
+        argument_rule = rendered.query_field_allowances[0].arguments[0]
+        assert argument_rule.values == [username, "support"]
+        assert not argument_rule.has_templates
+        assert not rendered.has_templates
+
+
+def test_rendered_bundles_are_keyed_by_referenced_variables_only() -> None:
+    policy = CompiledPolicy(_templated_groups_config())
+    group_names = frozenset({"self-service"})
+    assert policy.template_variables(group_names) == ("username",)
+    first, first_key = policy.rendered_rules_for(group_names, {"username": "ann"})
+    second, second_key = policy.rendered_rules_for(group_names, {"username": "ann"})
+    other, other_key = policy.rendered_rules_for(group_names, {"username": "bob"})
+    assert first is second
+    assert first_key == second_key != other_key
+    assert other.query_field_allowances[0].arguments[0].values == ["bob", "support"]
+    assert policy.rendered_stats().entries == 2
+
+
+def test_wildcard_first_rules_classify_access() -> None:
+    wildcard = (FieldRule(field_name="*"),)
+    get_user = (FieldRule(field_name="getUser"),)
+    assert classify_access(wildcard, None) == OperationAccess.ALLOW
+    assert classify_access(wildcard, wildcard, (CostPolicy(max_cost=10),)) == OperationAccess.CONDITIONAL
+    assert classify_access((*get_user, *wildcard), None) == OperationAccess.CONDITIONAL
+    assert classify_access(get_user, wildcard) == OperationAccess.CONDITIONAL
+    assert classify_access(None, wildcard) == OperationAccess.DENY
+    assert classify_access(None, (*get_user, *wildcard)) == OperationAccess.CONDITIONAL
+    assert classify_access(None, None) == OperationAccess.CONDITIONAL
+
+
+def test_access_is_classified_per_group_set(groups_config) -> None:
+    policy = CompiledPolicy(groups_config)
+    admin = frozenset({"admin"})
+    viewers = frozenset({"viewers"})
+    assert policy.access_for(admin, OperationType.QUERY) == OperationAccess.ALLOW
+    assert policy.access_for(admin, OperationType.MUTATION) == OperationAccess.ALLOW
+    assert policy.access_for(viewers, OperationType.QUERY) == OperationAccess.CONDITIONAL
+    assert policy.access_for(viewers, OperationType.MUTATION) == OperationAccess.DENY
+    assert policy.access_for(viewers, OperationType.SUBSCRIPTION) == OperationAccess.CONDITIONAL
+
+
+def test_unconditional_requests_are_not_parsed(client, mock_requests_post) -> None:
+    admin_headers = get_test_headers("kgmcquate@gmail.com", "kgmcquate")
+    body = b'{"query": "mutation { launchRun { id } }"}'
+    response = client.post("/graphql", data=body, headers={**admin_headers, "Content-Type": "application/json"})
+    assert response.status_code == 200
+    assert mock_requests_post.call_args.kwargs["data"] == body
+
+    viewer_headers = get_test_headers("bob@company.com", "bob")
+    response = client.post("/graphql", json={"query": "mutation M { launchRun { id } }", "operationName": "M"},
+                           headers=viewer_headers)
+    assert response.status_code == 403
+    error = response.get_json()["errors"][0]
+    assert error["extensions"]["code"] == "FORBIDDEN"
+    assert error["extensions"]["query"] == "M"
+    assert error["extensions"]["reason"] == "Wildcard '*' found in field restrictions, all fields are denied"
+    assert client.get("/health").get_json()["caches"]["documents"]["entries"] == 0
+
+    # A viewer's queries depend on their fields and are still parsed.
+    response = client.post("/graphql", json={"query": '{ getUser(name: "Ann") { id } }'}, headers=viewer_headers)
+    assert response.status_code == 200
+    assert client.get("/health").get_json()["caches"]["documents"]["entries"] == 1
+
+
+def test_request_bodies_are_decoded_once(client, monkeypatch) -> None:
+    decoded = []
+    loads = json.loads
+    monkeypatch.setattr(json, "loads", lambda body, **kwargs: decoded.append(body) or loads(body, **kwargs))
+    viewer_headers = get_test_headers("bob@company.com", "bob")
+    # Viewers' queries fall back from the operation type to parsing the document.
+    response = client.post("/graphql", json={"query": '{ getUser(name: "Ann") { id } }'}, headers=viewer_headers)
+    assert response.status_code == 200
+    assert len(decoded) == 1
+
+
+def test_comments_ended_by_carriage_returns_do_not_hide_mutations(mock_requests_post) -> None:
+    flask_app = get_flask_app(
+        upstream_url="http://localhost:4000/",
+        upstream_graphql_path="/graphql",
+        users_config=Users(users=[User(username="ann", email="ann@company.com", groups=["readers"])]),
+        groups_config=Groups(groups=[
+            Group(
+                name="readers",
+                permissions=Permissions(
+                    queries=QueryPolicy(effect=PolicyEffect.ALLOW, fields=[FieldRule(field_name="*")]),
+                    mutations=MutationPolicy(effect=PolicyEffect.DENY, fields=[FieldRule(field_name="*")]),
+                ),
+            ),
+        ]),
+    )
+    body = {"query": "# x\rmutation M { launchRun { id } }\nquery Q { a }", "operationName": "M"}
+    with flask_app.test_client() as client:
+        response = client.post("/graphql", json=body, headers=get_test_headers("ann@company.com", "ann"))
+    assert response.status_code == 403
+    assert mock_requests_post.call_count == 0
+
+
+
+def test_lookups_survive_invalidation_after_compiling(groups_config, monkeypatch) -> None:
+    policy = CompiledPolicy(groups_config)
+    viewers = frozenset({"viewers"})
+    document = DocumentCache().parse('{ getUser(name: "Ann") { id } }')
+    compiled_for = policy.compiled_for
+
+    def _compiled_then_invalidated(group_names: frozenset[str]):
+        # A reload between compiling and reading the compiled entry
+        compiled = compiled_for(group_names)
+        policy.invalidate()
+        return compiled
+
+    monkeypatch.setattr(policy, "compiled_for", _compiled_then_invalidated)
+    assert policy.access_for(viewers, OperationType.MUTATION) == OperationAccess.DENY
+    assert policy.cost_policies_for(viewers) == ()
+    assert policy.template_variables(viewers) == ()
+    policy.native_rules_for(viewers)
+    assert policy.decision_key(viewers, document, {})[0] == viewers
+    assert policy.rules_for(viewers).mutation_field_denials[0].field_name == "*"
@@ -13,13 +13,31 @@ The interop is validated from two angles:
   exact same results as the pure-Python reference implementation.
 """
 
+from pathlib import Path
+
 import pytest
+from graphql import OperationType
 
 from graphql_authz_proxy import _rust
 from graphql_authz_proxy.authz.utils import (
     _extract_user_from_headers_py,
     extract_user_from_headers,
+    field_trees,
+)
+from graphql_authz_proxy.authz.policy import CompiledPolicy, compile_native_rules
+from graphql_authz_proxy.cache import CachedDocument
+from graphql_authz_proxy.models import (
+    ArgumentRule,
+    FieldRule,
+    Group,
+    Groups,
+    MutationPolicy,
+    Permissions,
+    PolicyEffect,
+    QueryPolicy,
+    UserRules,
 )
+from graphql_authz_proxy.pipeline import check_authorization
 
 # A representative set of proxy headers as forwarded by oauth2-proxy.
 SAMPLE_HEADERS = {
@@ -72,3 +90,199 @@ def test_native_version_is_reported() -> None:
     version = _rust.version()
     assert isinstance(version, str)
     assert version
+
+
+# Documents covering aliases, repeated fields, fragments, directives and every literal kind.
+SAMPLE_DOCUMENTS = [
+    '{ getUser(name: "Ann") { id name } }',
+    "query Q($name: String, $n: Int = 1) { getUser(name: $name, limit: $n) { id } missing: getUser(name: $other) }",
+    "mutation { deleteUser(id: 1) { ok } updateUser(id: 2, admin: true, role: ADMIN, score: 1.5e3, note: null) }",
+    "{ a: user { id } b: user { ...F ... on User @include(if: true) { email } } } fragment F on User { id name }",
+    "{ users(filter: {ids: [1, 2], name: {eq: $name}}) { id id } search(terms: [\"x\", \"y\"]) }",
+    '{ echo(s: """\n    block\n      text\n  """, t: "esc\\u00e9\\n") }',
+    "subscription { events { id } } query { viewer { login } }",
+]
+
+
+def test_field_trees_builds_each_operation() -> None:
+    """field_trees resolves variables and fragments for every operation."""
+    document = CachedDocument.from_query(SAMPLE_DOCUMENTS[3])
+    [(operation, fields)] = list(field_trees(document, {}))
+    assert operation == OperationType.QUERY
+    assert list(fields) == ["a", "b"]
+    assert list(fields["b"]["selection_set"]) == ["id", "name", "email"]
+
+
+def test_field_trees_renders_null_arguments() -> None:
+    """A null literal renders as None."""
+    document = CachedDocument.from_query(SAMPLE_DOCUMENTS[2])
+    [(_, fields)] = list(field_trees(document, {}))
+    assert fields["updateUser"]["arguments"]["note"] is None
+
+
+@pytest.mark.skipif(not _rust.RUST_AVAILABLE, reason="Rust extension not built")
+@pytest.mark.parametrize("query", SAMPLE_DOCUMENTS)
+def test_native_field_trees_match_reference(query: str) -> None:
+    """When built, the native parser produces the pure-Python field trees."""
+    variables = {"name": "Ann", "n": 3}
+    document = CachedDocument.from_query(query)
+    native = [(OperationType(operation), fields) for operation, fields in _rust.field_trees(query, variables)]
+    assert native == list(field_trees(document, variables))
+
+
+@pytest.mark.skipif(not _rust.RUST_AVAILABLE, reason="Rust extension not built")
+def test_native_field_trees_reject_fragment_cycles() -> None:
+    """Documents the native parser cannot handle raise ValueError so callers fall back."""
+    with pytest.raises(ValueError):
+        _rust.field_trees("{ ...A } fragment A on Q { ...B } fragment B on Q { ...A }", {})
+
+
+# Allowances and denials with nested field rules, plain and dict-valued argument rules.
+NATIVE_RULES_GROUPS = Groups(
+    groups=[
+        Group(
+            name="readers",
+            permissions=Permissions(
+                queries=QueryPolicy(
+                    effect=PolicyEffect.ALLOW,
+                    fields=[
+                        FieldRule(
+                            field_name="users",
+                            arguments=[
+                                ArgumentRule(argument_name="filter", values=[{"name": {"eq": "Ann"}}, {"id": 1}]),
+                            ],
+                        ),
+                        FieldRule(field_name="getUser", field_rules=[FieldRule(field_name="id")]),
+                        FieldRule(
+                            field_name="search",
+                            arguments=[ArgumentRule(argument_name="limit", values=[10, True])],
+                        ),
+                    ],
+                ),
+                mutations=MutationPolicy(
+                    effect=PolicyEffect.DENY,
+                    fields=[
+                        FieldRule(
+                            field_name="updateUser",
+                            arguments=[ArgumentRule(argument_name="input", values=[{"role": "admin"}, "root"])],
+                            field_rules=[FieldRule(field_name="secret")],
+                        ),
+                        FieldRule(field_name="deleteUser"),
+                    ],
+                ),
+            ),
+        ),
+    ],
+)
+
+NATIVE_RULES_REQUESTS = [
+    ('{ users(filter: {name: {eq: "Ann"}}) { id } }', {}),
+    ("query ($f: UserFilter) { users(filter: $f) { id } }", {"f": {"id": 1.0}}),
+    ("query ($f: UserFilter) { users(filter: $f) { id } }", {"f": {"id": 2}}),
+    ("{ getUser { id } }", {}),
+    ("{ getUser { email } }", {}),
+    ("query ($n: Int) { search(limit: $n) }", {"n": 1}),
+    ("query ($n: Int) { search(limit: $n) }", {"n": 10}),
+    ("{ search(limit: 10) }", {}),
+    ("{ other }", {}),
+    ('mutation { updateUser(input: {role: "admin"}) { id } }', {}),
+    ("mutation ($i: UserInput) { updateUser(input: $i) { id secret } }", {"i": {"role": "admin"}}),
+    ("mutation ($i: UserInput) { updateUser(input: $i) { id secret } }", {"i": "guest"}),
+    ("mutation { updateUser { id } }", {}),
+    ("mutation { deleteUser(id: 1) renameUser(id: 1) }", {}),
+]
+
+
+def test_native_rules_are_not_compiled_without_the_extension(monkeypatch) -> None:
+    """Without the extension, bundles use the Python checks."""
+    monkeypatch.setattr(_rust, "RUST_AVAILABLE", False)
+    policy = CompiledPolicy(NATIVE_RULES_GROUPS, native_authz=True)
+    assert policy.native_rules_for(frozenset({"readers"})) is None
+    document = CachedDocument.from_query("{ getUser { id } }")
+    assert check_authorization(document, {}, policy.rules_for(frozenset({"readers"})), None) == (
+        False, "No matching field allowances found, access denied", ["getUser"],
+    )
+
+
+def test_native_rules_are_opt_in(monkeypatch) -> None:
+    """The Python checks decide unless the native rule engine is enabled."""
+    compiled = []
+    monkeypatch.setattr(_rust, "RUST_AVAILABLE", True)
+    monkeypatch.setattr(_rust, "compile_rules", lambda rules: compiled.append(rules) or object())
+    policy = CompiledPolicy(NATIVE_RULES_GROUPS)
+    assert policy.native_rules_for(frozenset({"readers"})) is None
+    assert not compiled
+    assert CompiledPolicy(NATIVE_RULES_GROUPS, native_authz=True).native_rules_for(frozenset({"readers"})) is not None
+
+
+@pytest.mark.skipif(not _rust.RUST_AVAILABLE, reason="Rust extension not built")
+@pytest.mark.parametrize(("query", "variables"), NATIVE_RULES_REQUESTS)
+def test_native_rules_match_reference(query: str, variables: dict) -> None:
+    """When built, the native rule engine makes the Python checks' decisions."""
+    policy = CompiledPolicy(NATIVE_RULES_GROUPS, native_authz=True)
+    group_names = frozenset({"readers"})
+    native_rules = policy.native_rules_for(group_names)
+    assert native_rules is not None
+    document = CachedDocument.from_query(query)
+    user_rules = policy.rules_for(group_names)
+    expected = check_authorization(document, variables, user_rules)
+    assert tuple(check_authorization(document, variables, user_rules, native_rules)) == tuple(expected)
+
+
+@pytest.mark.skipif(not _rust.RUST_AVAILABLE, reason="Rust extension not built")
+def test_native_rules_reject_jsonpath_expressions() -> None:
+    """Rules with JSONPath expressions are left to the Python checks."""
+    rules = UserRules(
+        query_field_allowances=(
+            FieldRule(field_name="users", arguments=[ArgumentRule(argument_name="f", values=[{"ids[0]": 1}])]),
+        ),
+    )
+    with pytest.raises(ValueError):
+        _rust.compile_rules(rules.model_dump())
+    assert compile_native_rules(rules) is None
+
+
+# The authorization fixtures of the other test modules, with the rules above.
+FIXTURE_GROUPS = Groups(
+    groups=[
+        *Groups.parse_config(str(Path(__file__).parent / "authz_configs" / "groups.yaml")).groups,
+        *NATIVE_RULES_GROUPS.groups,
+    ],
+)
+
+DIFFERENTIAL_REQUESTS = [
+    *NATIVE_RULES_REQUESTS,
+    ('{ getUser(name: "Ann") { id } }', {}),
+    ('{ getUser(name: "Bob") { id } }', {}),
+    ("query ($name: String) { getUser(name: $name) { id name } }", {"name": "Ann"}),
+    # Alias keys
+    ('{ a: getUser(name: "Ann") { id } b: getUser(name: "Bob") { id } }', {}),
+    ("{ getUser: search(limit: 10) search: getUser { email } }", {}),
+    # Only the first operation's decision is returned
+    ("query A { other } query B { getUser { id } }", {}),
+    ("query A { getUser { id } } mutation B { deleteUser(id: 1) }", {}),
+    ("mutation M { renameUser(id: 1) } query Q { search(limit: 10) }", {}),
+    # Integer literals are compared as their source text
+    ('{ search(limit: "10") }', {}),
+    ("{ users(filter: {id: 1}) { id } }", {}),
+    ("query ($f: UserFilter) { users(filter: $f) { id } }", {"f": {"id": "1"}}),
+    (
+        (Path(__file__).parent / "graphql_queries" / "RecentAssetsEventsQuery.gql").read_text(),
+        {"assetKey": {"path": ["monthly_revenue_report"]}, "limit": 100, "partitions": []},
+    ),
+]
+
+
+@pytest.mark.skipif(not _rust.RUST_AVAILABLE, reason="Rust extension not built")
+@pytest.mark.parametrize("group_names", [frozenset({group.name}) for group in FIXTURE_GROUPS.groups])
+def test_native_rules_match_reference_on_fixtures(group_names: frozenset[str]) -> None:
+    """When built, the native rule engine decides every fixture request like the Python checks."""
+    policy = CompiledPolicy(FIXTURE_GROUPS, native_authz=True)
+    native_rules = policy.native_rules_for(group_names)
+    assert native_rules is not None
+    user_rules = policy.rules_for(group_names)
+    for query, variables in DIFFERENTIAL_REQUESTS:
+        document = CachedDocument.from_query(query)
+        expected = check_authorization(document, variables, user_rules)
+        actual = check_authorization(document, variables, user_rules, native_rules)
+        assert tuple(actual) == tuple(expected), query
@@ -0,0 +1,225 @@
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from graphql_authz_proxy.flask_app import get_flask_app
+from graphql_authz_proxy.models import Groups, Users
+from graphql_authz_proxy.pipeline import is_graphql_path
+from graphql_authz_proxy.upstream import UpstreamClient, filter_hop_by_hop_headers
+
+LARGE_CHUNK = b"x" * 1024
+LARGE_CHUNKS = 512
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        if self.path == "/large":
+            self._send_large()
+            return
+        if self.path == "/echo":
+            self._echo()
+            return
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        self._echo()
+
+    def _echo(self) -> None:
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            body = b""
+            while size := int(self.rfile.readline(), 16):
+                body += self.rfile.read(size)
+                self.rfile.readline()
+            self.rfile.readline()
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Request-Content-Length", self.headers.get("Content-Length", ""))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_large(self) -> None:
+        # A chunked response of unknown length with a hop-by-hop header.
+        self.send_response(200)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Connection", "keep-alive, X-Internal")
+        self.send_header("X-Internal", "secret")
+        self.send_header("X-Request-Connection", self.headers.get("Connection", ""))
+        self.end_headers()
+        for _ in range(LARGE_CHUNKS):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(LARGE_CHUNK), LARGE_CHUNK))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def upstream_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_connections_are_reused(upstream_url) -> None:
+    client = UpstreamClient(upstream_url, pool_size=2)
+    for _ in range(3):
+        response = client.request("GET", f"{upstream_url}/foo")
+        assert response.content == b"ok"
+    stats = client.stats()
+    assert stats["created"] == 1
+    assert stats["idle"] == 1
+    assert stats["in_use"] == 0
+
+
+def test_warm_opens_connections(upstream_url) -> None:
+    client = UpstreamClient(upstream_url, pool_size=4, warm_connections=3)
+    client.warm()
+    stats = client.stats()
+    assert 1 <= stats["created"] <= 3
+    assert stats["idle"] == stats["created"]
+
+
+def test_warm_failures_are_ignored() -> None:
+    client = UpstreamClient("http://127.0.0.1:9", connect_timeout=0.5, warm_connections=1)
+    client.warm()
+    assert client.stats()["idle"] == 0
+
+
+def test_stats_before_first_request() -> None:
+    assert UpstreamClient("http://localhost:4000").stats() == {"pool_size": 10, "in_use": 0, "idle": 0, "created": 0}
+
+
+def test_filter_hop_by_hop_headers() -> None:
+    headers = {
+        "Connection": "close, X-Hop",
+        "X-Hop": "1",
+        "Keep-Alive": "timeout=5",
+        "Transfer-Encoding": "chunked",
+        "Content-Type": "application/json",
+    }
+    assert filter_hop_by_hop_headers(headers) == {"Content-Type": "application/json"}
+
+
+def test_large_responses_are_streamed(upstream_url) -> None:
+    flask_app = get_flask_app(
+        upstream_url=upstream_url,
+        upstream_graphql_path="/graphql",
+        users_config=Users(users=[]),
+        groups_config=Groups(groups=[]),
+        stream_threshold=1024,
+        stream_chunk_size=4096,
+    )
+    with flask_app.test_client() as client:
+        response = client.get("/large", headers={"Connection": "close"}, buffered=False)
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert "X-Internal" not in response.headers
+        assert "Transfer-Encoding" not in response.headers
+        assert response.headers["X-Request-Connection"] != "close"
+        assert response.get_data() == LARGE_CHUNK * LARGE_CHUNKS
+
+
+def test_small_responses_are_buffered(upstream_url) -> None:
+    flask_app = get_flask_app(
+        upstream_url=upstream_url,
+        upstream_graphql_path="/graphql",
+        users_config=Users(users=[]),
+        groups_config=Groups(groups=[]),
+    )
+    with flask_app.test_client() as client:
+        response = client.get("/foo")
+        assert response.status_code == 200
+        assert response.get_data() == b"ok"
+
+
+def test_request_bodies_are_streamed_upstream(upstream_url) -> None:
+    flask_app = get_flask_app(
+        upstream_url=upstream_url,
+        upstream_graphql_path="/graphql",
+        users_config=Users(users=[]),
+        groups_config=Groups(groups=[]),
+        stream_chunk_size=1024,
+    )
+    body = LARGE_CHUNK * 64
+    with flask_app.test_client() as client:
+        response = client.get("/echo", data=body)
+        assert response.get_data() == body
+        assert response.headers["X-Request-Content-Length"] == str(len(body))
+
+        response = client.get(
+            "/echo",
+            input_stream=io.BytesIO(body),
+            headers={"Transfer-Encoding": "chunked"},
+            environ_overrides={"wsgi.input_terminated": True},
+        )
+        assert response.get_data() == body
+        assert response.headers["X-Request-Content-Length"] == ""
+
+
+def test_write_requests_are_streamed_upstream_when_enabled(upstream_url) -> None:
+    options = {
+        "upstream_url": upstream_url,
+        "upstream_graphql_path": "/graphql",
+        "users_config": Users(users=[]),
+        "groups_config": Groups(groups=[]),
+        "stream_chunk_size": 1024,
+    }
+    body = LARGE_CHUNK * 64
+    with get_flask_app(**options).test_client() as client:
+        assert client.post("/echo", data=body).status_code == 405
+
+    with get_flask_app(**options, proxy_write_methods=True).test_client() as client:
+        response = client.post("/echo", data=body)
+        assert response.status_code == 200
+        assert response.get_data() == body
+        assert response.headers["X-Request-Content-Length"] == str(len(body))
+
+        response = client.post(
+            "/echo",
+            input_stream=io.BytesIO(body),
+            headers={"Transfer-Encoding": "chunked"},
+            environ_overrides={"wsgi.input_terminated": True},
+        )
+        assert response.get_data() == body
+        assert response.headers["X-Request-Content-Length"] == ""
+
+        # Other spellings of the GraphQL path are not proxied without authorization.
+        for path in ("/graphql/", "/x/../graphql", "/./graphql", "/x/..//graphql/."):
+            assert client.post(path, data=body).status_code == 405
+
+
+@pytest.mark.parametrize(
+    ("path", "expected"),
+    [
+        ("graphql", True),
+        ("/graphql/", True),
+        ("/x/../graphql", True),
+        ("/./graphql", True),
+        ("//graphql", True),
+        ("/../graphql", True),
+        ("/x/..//graphql/.", True),
+        ("/graphql/x", False),
+        ("/x/graphql", False),
+        ("/", False),
+    ],
+)
+def test_graphql_path_spellings(path: str, expected: bool) -> None:
+    assert is_graphql_path(path, "/graphql") is expected
@@ -0,0 +1,72 @@
+import pytest
+from graphql import OperationType
+
+from graphql_authz_proxy.authz.permissions import check_field_allowances, check_field_denials
+from graphql_authz_proxy.authz.utils import FragmentExpansion, SelectionConflictError, field_trees
+from graphql_authz_proxy.authz.walker import SelectionWalker
+from graphql_authz_proxy.cache import CachedDocument
+from graphql_authz_proxy.models import ArgumentRule, FieldRule
+
+from .test_rust_interop import NATIVE_RULES_GROUPS, NATIVE_RULES_REQUESTS
+
+
+def _walk(query: str, variables: dict, rules: list[FieldRule], *, deny: bool = False) -> tuple[bool, str, list[str]]:
+    document = CachedDocument.from_query(query)
+    walker = SelectionWalker(document.fragments, variables)
+    fields = walker.collect(document.operations[0].selection_set)
+    return walker.check_denials(fields, rules) if deny else walker.check_allowances(fields, rules)
+
+
+@pytest.mark.parametrize(("query", "variables"), NATIVE_RULES_REQUESTS)
+def test_walker_matches_field_tree_checks(query: str, variables: dict) -> None:
+    rules = NATIVE_RULES_GROUPS.groups[0].permissions
+    document = CachedDocument.from_query(query)
+    [(operation, field_dict)] = list(field_trees(document, variables))
+    if operation == OperationType.QUERY:
+        expected = check_field_allowances(field_nodes=field_dict, field_rules=rules.queries.fields)
+        assert _walk(query, variables, rules.queries.fields) == expected
+    else:
+        expected = check_field_denials(field_nodes=field_dict, field_denials=rules.mutations.fields)
+        assert _walk(query, variables, rules.mutations.fields, deny=True) == expected
+
+
+def test_walker_checks_every_selection_of_a_repeated_field() -> None:
+    rules = [FieldRule(field_name="getUser", arguments=[ArgumentRule(argument_name="name", values=["Ann"])])]
+    assert _walk('{ getUser(name: "Ann") getUser(name: "Ann") }', {}, rules)[0]
+    is_allowed, reason, path = _walk('{ getUser(name: "Ann") getUser(name: "Bob") }', {}, rules)
+    assert not is_allowed
+    assert "'Bob'" in reason
+    assert path == ["getUser"]
+
+
+def test_walker_skips_subtrees_without_sub_field_rules() -> None:
+    # The fragment cycle is under a field no rule descends into, so it is never expanded.
+    query = "{ getUser { ...A } } fragment A on User { ...B } fragment B on User { ...A }"
+    assert _walk(query, {}, [FieldRule(field_name="getUser")]) == (True, "Field 'getUser' is allowed", ["getUser"])
+
+
+def test_walker_reuses_fragments_collected_for_the_document() -> None:
+    document = CachedDocument.from_query("{ a { ...F id } b { ...F } } fragment F on T { id }")
+    walker = SelectionWalker(document.fragments, {}, FragmentExpansion(memo=document.fragment_fields))
+    fields = walker.collect(document.operations[0].selection_set)
+    assert len(walker.collect(fields["a"].selection_set)["id"]) == 2
+    assert len(walker.collect(fields["b"].selection_set)["id"]) == 1
+    assert list(document.fragment_fields) == ["F"]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "{ a a { b } }",
+        "{ a { b } a }",
+        "{ a { c } ...F } fragment F on Q { a }",
+        "{ ...F a { c } } fragment F on Q { a }",
+        "{ a ... on Q { a { c } } }",
+    ],
+)
+def test_fields_selected_with_and_without_sub_fields_are_rejected(query: str) -> None:
+    rules = [FieldRule(field_name="a", field_rules=[FieldRule(field_name="b")])]
+    with pytest.raises(SelectionConflictError, match="Fields 'a' conflict"):
+        _walk(query, {}, rules)
+    with pytest.raises(SelectionConflictError, match="Fields 'a' conflict"):
+        list(field_trees(CachedDocument.from_query(query), {}))
@@ -0,0 +1,224 @@
+"""Pooled, keep-alive HTTP client used to forward requests to the upstream server."""
+
+import logging
+import os
+import threading
+from collections.abc import Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Headers that apply to a single connection and must not be forwarded by a proxy (RFC 9110, section 7.6.1).
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "proxy-connection",
+    "te",
+    "trailer",
+    "transfer-encoding",
+    "upgrade",
+})
+
+
+def filter_hop_by_hop_headers(headers: Mapping[str, str]) -> dict[str, str]:
+    """Drop hop-by-hop headers, including any listed in the ``Connection`` header.
+
+    Args:
+        headers (Mapping[str, str]): Request or response headers.
+
+    Returns:
+        dict[str, str]: Headers that may be forwarded to the next hop.
+
+    """
+    connection_headers = {
+        name.strip().lower() for name in headers.get("Connection", "").split(",") if name.strip()
+    }
+    return {
+        name: value
+        for name, value in headers.items()
+        if name.lower() not in HOP_BY_HOP_HEADERS and name.lower() not in connection_headers
+    }
+
+
+def iter_body(stream: BinaryIO, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Read a request body in chunks.
+
+    Args:
+        stream (BinaryIO): Request body stream.
+        chunk_size (int): Maximum size of each chunk in bytes.
+
+    Yields:
+        bytes: The next chunk of the body.
+
+    """
+    while chunk := stream.read(chunk_size):
+        yield chunk
+
+
+class StreamedBody:
+
+    """Request body of known length that is read from the client while it is sent upstream.
+
+    ``requests`` sends an iterable with a length as a body with that Content-Length,
+    so the body is never held in memory as a whole.
+    """
+
+    def __init__(self, stream: BinaryIO, length: int, chunk_size: int = 64 * 1024) -> None:
+        """Wrap a request body stream.
+
+        Args:
+            stream (BinaryIO): Request body stream.
+            length (int): Content length of the body in bytes.
+            chunk_size (int): Maximum size of each chunk in bytes.
+
+        """
+        self.stream = stream
+        self.length = length
+        self.chunk_size = chunk_size
+
+    def __len__(self) -> int:
+        """Return the content length of the body."""
+        return self.length
+
+    def __iter__(self) -> Iterator[bytes]:
+        """Read the body in chunks."""
+        return iter_body(self.stream, self.chunk_size)
+
+
+class UpstreamClient:
+
+    """HTTP client holding a pool of keep-alive connections to the upstream server.
+
+    The underlying session is created lazily in each process, so a client built before
+    Gunicorn forks its workers gives every worker its own connection pool.
+    """
+
+    def __init__(
+        self,
+        upstream_url: str,
+        pool_size: int = 10,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 30.0,
+        warm_connections: int = 0,
+    ) -> None:
+        """Configure the client. No connection is opened until the first request or :meth:`warm`.
+
+        Args:
+            upstream_url (str): Base URL of the upstream server.
+            pool_size (int): Maximum number of idle connections kept per worker.
+            connect_timeout (float): Seconds to wait for a connection to the upstream server.
+            read_timeout (float): Seconds to wait for the upstream server to send data.
+            warm_connections (int): Connections to open when a worker boots.
+
+        """
+        self.upstream_url = upstream_url
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.warm_connections = warm_connections
+        self._session: requests.Session | None = None
+        self._adapter: HTTPAdapter | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self) -> tuple[float, float]:
+        """The (connect, read) timeout passed to every request."""
+        return self.connect_timeout, self.read_timeout
+
+    @property
+    def session(self) -> requests.Session:
+        """The session of the current process, created on first use."""
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                    session = requests.Session()
+                    session.mount("http://", self._adapter)
+                    session.mount("https://", self._adapter)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def request(self, method: str, url: str, **kwargs: object) -> requests.Response:
+        """Send a request through the connection pool.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Absolute URL.
+            **kwargs: Passed on to :meth:`requests.Session.request`.
+
+        Returns:
+            requests.Response: The upstream response.
+
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def post(self, url: str, **kwargs: object) -> requests.Response:
+        """Send a POST request through the connection pool.
+
+        Args:
+            url (str): Absolute URL.
+            **kwargs: Passed on to :meth:`requests.Session.request`.
+
+        Returns:
+            requests.Response: The upstream response.
+
+        """
+        return self.request("POST", url, **kwargs)
+
+    def warm(self, connections: int | None = None) -> None:
+        """Open connections to the upstream server ahead of the first request.
+
+        Requests are sent concurrently so that each one opens its own connection,
+        which is then kept alive in the pool. Failures are logged and ignored.
+
+        Args:
+            connections (int | None): Number of connections to open, defaults to ``warm_connections``.
+
+        """
+        connections = min(self.warm_connections if connections is None else connections, self.pool_size)
+        if connections <= 0:
+            return
+
+        def _open(_: int) -> None:
+            try:
+                self.request("HEAD", self.upstream_url).close()
+            except requests.RequestException as e:
+                logger.warning(f"Could not pre-connect to upstream {self.upstream_url}: {e!s}")
+
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            list(executor.map(_open, range(connections)))
+
+    def stats(self) -> dict[str, int]:
+        """Get connection pool statistics for the current process.
+
+        Returns:
+            dict[str, int]: Connections in use, idle in the pool, and created so far.
+
+        """
+        in_use = idle = created = 0
+        if self._adapter is not None and self._pid == os.getpid():
+            pools = self._adapter.poolmanager.pools
+            for key in pools.keys():  # noqa: SIM118 - the container is not iterable
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                # The queue holds idle connections plus None placeholders for unopened slots.
+                queued = list(pool.pool.queue) if pool.pool is not None else []
+                idle += sum(1 for conn in queued if conn is not None)
+                in_use += pool.pool.maxsize - len(queued) if pool.pool is not None else 0
+                created += pool.num_connections
+        return {
+            "pool_size": self.pool_size,
+            "in_use": in_use,
+            "idle": idle,
+            "created": created,
+        }
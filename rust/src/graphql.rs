@@ -0,0 +1,904 @@
+//! GraphQL executable document parsing and field-tree extraction.
+//!
+//! This is a Rust port of `CachedDocument.from_query` plus
+//! `graphql_authz_proxy.authz.utils.render_fields` and `convert_fields_to_dict`:
+//! the document is parsed, fragments are inlined and every operation is turned
+//! into the compact `{field: {"arguments": ..., "selection_set": ...}}` tree the
+//! permission checks walk. This module has no Python dependency; `lib.rs`
+//! converts its output into Python objects.
+//!
+//! Anything this parser does not handle (type system definitions, fragment
+//! cycles, invalid syntax) is reported as an error, and the Python caller falls
+//! back to the pure-Python path, which gives the reference behaviour.
+
+use std::collections::HashMap;
+use std::fmt;
+
+/// Fragment spreads nested deeper than this are treated as a cycle.
+const MAX_DEPTH: usize = 256;
+
+/// Default limit on the fields a document may select with its fragments inlined
+/// (`graphql_authz_proxy.authz.utils.MAX_EXPANDED_FIELDS`).
+pub const MAX_FIELDS: usize = 100_000;
+
+/// An error that makes the caller fall back to the Python implementation.
+#[derive(Debug, Clone, PartialEq)]
+pub struct Error {
+    pub message: String,
+    pub position: usize,
+}
+
+impl fmt::Display for Error {
+    fn fmt(&self, f: &mut fmt::Formatter<'_>) -> fmt::Result {
+        write!(f, "{} at position {}", self.message, self.position)
+    }
+}
+
+impl std::error::Error for Error {}
+
+fn error<T>(message: impl Into<String>, position: usize) -> Result<T, Error> {
+    Err(Error {
+        message: message.into(),
+        position,
+    })
+}
+
+/// An argument value as written in the document.
+#[derive(Debug, Clone, PartialEq)]
+pub enum Value {
+    Variable(String),
+    /// Int, float and enum literals keep their source text, as graphql-core does.
+    Int(String),
+    Float(String),
+    Str { value: String, block: bool },
+    Boolean(bool),
+    Null,
+    Enum(String),
+    List(Vec<Value>),
+    Object(Vec<(String, Value)>),
+}
+
+/// A field with its arguments; `selection_set` is `None` for leaf fields.
+#[derive(Debug, Clone, PartialEq)]
+pub struct Field {
+    pub arguments: Vec<(String, Value)>,
+    pub selection_set: Option<FieldTree>,
+}
+
+/// The fields selected under one response key.
+#[derive(Debug, Clone, PartialEq)]
+pub enum Entry {
+    /// Leaf fields, in document order. Repeated leaves are all kept.
+    Leaves(Vec<Field>),
+    /// A field with a selection set. A later one replaces an earlier one.
+    Nested(Field),
+}
+
+/// Response keys mapped to their fields, in insertion order like a Python dict.
+#[derive(Debug, Clone, Default, PartialEq)]
+pub struct FieldTree {
+    pub entries: Vec<(String, Entry)>,
+}
+
+impl FieldTree {
+    fn position(&self, key: &str) -> Option<usize> {
+        self.entries.iter().position(|(name, _)| name == key)
+    }
+
+    /// Set a key, keeping its position if it exists (Python `dict.__setitem__`).
+    fn set(&mut self, key: String, entry: Entry) {
+        match self.position(&key) {
+            Some(index) => self.entries[index].1 = entry,
+            None => self.entries.push((key, entry)),
+        }
+    }
+
+    /// Merge another tree into this one (Python `dict.update`).
+    fn update(&mut self, other: FieldTree) {
+        for (key, entry) in other.entries {
+            self.set(key, entry);
+        }
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.entries.is_empty()
+    }
+}
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum OperationKind {
+    Query,
+    Mutation,
+    Subscription,
+}
+
+impl OperationKind {
+    /// The `graphql.OperationType` value.
+    pub fn as_str(self) -> &'static str {
+        match self {
+            OperationKind::Query => "query",
+            OperationKind::Mutation => "mutation",
+            OperationKind::Subscription => "subscription",
+        }
+    }
+}
+
+/// An operation of the document with its fragments inlined.
+#[derive(Debug, Clone, PartialEq)]
+pub struct Operation {
+    pub kind: OperationKind,
+    pub fields: FieldTree,
+}
+
+// ---------------------------------------------------------------------------
+// Lexer
+// ---------------------------------------------------------------------------
+
+#[derive(Debug, Clone, PartialEq)]
+enum Token {
+    Punct(char),
+    Spread,
+    Name(String),
+    Int(String),
+    Float(String),
+    Str(String),
+    BlockStr(String),
+    End,
+}
+
+struct Lexer<'a> {
+    source: &'a str,
+    bytes: &'a [u8],
+    position: usize,
+}
+
+impl<'a> Lexer<'a> {
+    fn new(source: &'a str) -> Self {
+        let position = if source.starts_with('\u{feff}') { 3 } else { 0 };
+        Lexer {
+            source,
+            bytes: source.as_bytes(),
+            position,
+        }
+    }
+
+    fn peek_byte(&self, offset: usize) -> Option<u8> {
+        self.bytes.get(self.position + offset).copied()
+    }
+
+    fn skip_ignored(&mut self) {
+        while let Some(byte) = self.peek_byte(0) {
+            match byte {
+                b' ' | b'\t' | b',' | b'\n' | b'\r' => self.position += 1,
+                b'#' => {
+                    while let Some(byte) = self.peek_byte(0) {
+                        if byte == b'\n' || byte == b'\r' {
+                            break;
+                        }
+                        self.position += 1;
+                    }
+                }
+                _ if self.source[self.position..].starts_with('\u{feff}') => self.position += 3,
+                _ => break,
+            }
+        }
+    }
+
+    /// Read the next token and the position it starts at.
+    fn next(&mut self) -> Result<(Token, usize), Error> {
+        self.skip_ignored();
+        let start = self.position;
+        let Some(byte) = self.peek_byte(0) else {
+            return Ok((Token::End, start));
+        };
+        let token = match byte {
+            b'!' | b'$' | b'&' | b'(' | b')' | b':' | b'=' | b'@' | b'[' | b']' | b'{' | b'|' | b'}' => {
+                self.position += 1;
+                Token::Punct(byte as char)
+            }
+            b'.' => {
+                if self.peek_byte(1) == Some(b'.') && self.peek_byte(2) == Some(b'.') {
+                    self.position += 3;
+                    Token::Spread
+                } else {
+                    return error("Unexpected character: '.'", start);
+                }
+            }
+            b'_' | b'a'..=b'z' | b'A'..=b'Z' => {
+                while let Some(b'_' | b'a'..=b'z' | b'A'..=b'Z' | b'0'..=b'9') = self.peek_byte(0) {
+                    self.position += 1;
+                }
+                Token::Name(self.source[start..self.position].to_string())
+            }
+            b'-' | b'0'..=b'9' => self.read_number(start)?,
+            b'"' => {
+                if self.peek_byte(1) == Some(b'"') && self.peek_byte(2) == Some(b'"') {
+                    Token::BlockStr(self.read_block_string(start)?)
+                } else {
+                    Token::Str(self.read_string(start)?)
+                }
+            }
+            _ => return error("Unexpected character", start),
+        };
+        Ok((token, start))
+    }
+
+    fn read_digits(&mut self) -> Result<(), Error> {
+        if !matches!(self.peek_byte(0), Some(b'0'..=b'9')) {
+            return error("Invalid number, expected digit", self.position);
+        }
+        while let Some(b'0'..=b'9') = self.peek_byte(0) {
+            self.position += 1;
+        }
+        Ok(())
+    }
+
+    fn read_number(&mut self, start: usize) -> Result<Token, Error> {
+        let mut is_float = false;
+        if self.peek_byte(0) == Some(b'-') {
+            self.position += 1;
+        }
+        if self.peek_byte(0) == Some(b'0') {
+            self.position += 1;
+            if let Some(b'0'..=b'9') = self.peek_byte(0) {
+                return error("Invalid number, unexpected digit after 0", self.position);
+            }
+        } else {
+            self.read_digits()?;
+        }
+        if self.peek_byte(0) == Some(b'.') {
+            is_float = true;
+            self.position += 1;
+            self.read_digits()?;
+        }
+        if let Some(b'e' | b'E') = self.peek_byte(0) {
+            is_float = true;
+            self.position += 1;
+            if let Some(b'+' | b'-') = self.peek_byte(0) {
+                self.position += 1;
+            }
+            self.read_digits()?;
+        }
+        // A number must not run into a name or a dot (e.g. `1.2.3`, `0x1`).
+        if let Some(b'.' | b'_' | b'a'..=b'z' | b'A'..=b'Z') = self.peek_byte(0) {
+            return error("Invalid number", self.position);
+        }
+        let text = self.source[start..self.position].to_string();
+        Ok(if is_float { Token::Float(text) } else { Token::Int(text) })
+    }
+
+    fn read_hex4(&self, position: usize) -> Option<u32> {
+        let digits = self.source.get(position..position + 4)?;
+        if !digits.bytes().all(|byte| byte.is_ascii_hexdigit()) {
+            return None;
+        }
+        u32::from_str_radix(digits, 16).ok()
+    }
+
+    fn read_string(&mut self, start: usize) -> Result<String, Error> {
+        self.position += 1;
+        let mut value = String::new();
+        loop {
+            let Some(ch) = self.source[self.position..].chars().next() else {
+                return error("Unterminated string", start);
+            };
+            match ch {
+                '"' => {
+                    self.position += 1;
+                    return Ok(value);
+                }
+                '\n' | '\r' => return error("Unterminated string", start),
+                '\\' => {
+                    let escape_start = self.position;
+                    let Some(escaped) = self.peek_byte(1) else {
+                        return error("Unterminated string", start);
+                    };
+                    self.position += 2;
+                    match escaped {
+                        b'"' => value.push('"'),
+                        b'\\' => value.push('\\'),
+                        b'/' => value.push('/'),
+                        b'b' => value.push('\u{8}'),
+                        b'f' => value.push('\u{c}'),
+                        b'n' => value.push('\n'),
+                        b'r' => value.push('\r'),
+                        b't' => value.push('\t'),
+                        b'u' => value.push(self.read_unicode_escape(escape_start)?),
+                        _ => return error("Invalid character escape sequence", escape_start),
+                    }
+                }
+                _ => {
+                    if (ch as u32) < 0x20 && ch != '\t' {
+                        return error("Invalid character within String", self.position);
+                    }
+                    value.push(ch);
+                    self.position += ch.len_utf8();
+                }
+            }
+        }
+    }
+
+    /// Read the code point of a `\u` escape; `self.position` is just after the `u`.
+    fn read_unicode_escape(&mut self, escape_start: usize) -> Result<char, Error> {
+        if self.peek_byte(0) == Some(b'{') {
+            let close = self.source[self.position..]
+                .find('}')
+                .filter(|&offset| (2..=9).contains(&offset));
+            let Some(offset) = close else {
+                return error("Invalid Unicode escape sequence", escape_start);
+            };
+            let digits = &self.source[self.position + 1..self.position + offset];
+            let code = u32::from_str_radix(digits, 16).ok().filter(|_| digits.bytes().all(|b| b.is_ascii_hexdigit()));
+            self.position += offset + 1;
+            return code
+                .and_then(char::from_u32)
+                .map_or_else(|| error("Invalid Unicode escape sequence", escape_start), Ok);
+        }
+        let Some(code) = self.read_hex4(self.position) else {
+            return error("Invalid Unicode escape sequence", escape_start);
+        };
+        self.position += 4;
+        if let Some(ch) = char::from_u32(code) {
+            return Ok(ch);
+        }
+        // A surrogate pair written as two escapes.
+        if (0xD800..=0xDBFF).contains(&code) && self.source[self.position..].starts_with("\\u") {
+            if let Some(low) = self.read_hex4(self.position + 2).filter(|low| (0xDC00..=0xDFFF).contains(low)) {
+                self.position += 6;
+                let combined = 0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00);
+                if let Some(ch) = char::from_u32(combined) {
+                    return Ok(ch);
+                }
+            }
+        }
+        error("Invalid Unicode escape sequence", escape_start)
+    }
+
+    fn read_block_string(&mut self, start: usize) -> Result<String, Error> {
+        self.position += 3;
+        let mut lines: Vec<String> = Vec::new();
+        let mut line = String::new();
+        loop {
+            let rest = &self.source[self.position..];
+            let Some(ch) = rest.chars().next() else {
+                return error("Unterminated string", start);
+            };
+            if rest.starts_with("\"\"\"") {
+                self.position += 3;
+                lines.push(line);
+                return Ok(dedent_block_string_lines(&lines).join("\n"));
+            }
+            if rest.starts_with("\\\"\"\"") {
+                line.push_str("\"\"\"");
+                self.position += 4;
+                continue;
+            }
+            match ch {
+                '\r' => {
+                    lines.push(std::mem::take(&mut line));
+                    self.position += if rest.starts_with("\r\n") { 2 } else { 1 };
+                }
+                '\n' => {
+                    lines.push(std::mem::take(&mut line));
+                    self.position += 1;
+                }
+                _ => {
+                    if (ch as u32) < 0x20 && ch != '\t' {
+                        return error("Invalid character within String", self.position);
+                    }
+                    line.push(ch);
+                    self.position += ch.len_utf8();
+                }
+            }
+        }
+    }
+}
+
+/// The GraphQL spec's BlockStringValue() algorithm, as graphql-core implements it.
+fn dedent_block_string_lines(lines: &[String]) -> Vec<String> {
+    let mut common_indent = usize::MAX;
+    let mut first_non_empty_line: Option<usize> = None;
+    let mut last_non_empty_line: isize = -1;
+    for (index, line) in lines.iter().enumerate() {
+        let indent = line.chars().take_while(|ch| *ch == ' ' || *ch == '\t').count();
+        if indent == line.chars().count() {
+            continue;
+        }
+        first_non_empty_line.get_or_insert(index);
+        last_non_empty_line = index as isize;
+        if index > 0 && indent < common_indent {
+            common_indent = indent;
+        }
+    }
+    let first = first_non_empty_line.unwrap_or(0);
+    let end = (last_non_empty_line + 1).max(0) as usize;
+    lines
+        .iter()
+        .enumerate()
+        .map(|(index, line)| {
+            if index > 0 {
+                line.chars().skip(common_indent.min(line.chars().count())).collect()
+            } else {
+                line.clone()
+            }
+        })
+        .skip(first)
+        .take(end.saturating_sub(first))
+        .collect()
+}
+
+// ---------------------------------------------------------------------------
+// Parser
+// ---------------------------------------------------------------------------
+
+#[derive(Debug, Clone)]
+enum Selection {
+    Field {
+        key: String,
+        arguments: Vec<(String, Value)>,
+        selection_set: Option<Vec<Selection>>,
+    },
+    FragmentSpread(String),
+    InlineFragment(Vec<Selection>),
+}
+
+struct Parser<'a> {
+    lexer: Lexer<'a>,
+    token: Token,
+    position: usize,
+}
+
+impl<'a> Parser<'a> {
+    fn new(source: &'a str) -> Result<Self, Error> {
+        let mut lexer = Lexer::new(source);
+        let (token, position) = lexer.next()?;
+        Ok(Parser {
+            lexer,
+            token,
+            position,
+        })
+    }
+
+    fn advance(&mut self) -> Result<Token, Error> {
+        let (token, position) = self.lexer.next()?;
+        self.position = position;
+        Ok(std::mem::replace(&mut self.token, token))
+    }
+
+    fn is_punct(&self, punct: char) -> bool {
+        self.token == Token::Punct(punct)
+    }
+
+    fn skip_punct(&mut self, punct: char) -> Result<bool, Error> {
+        if self.is_punct(punct) {
+            self.advance()?;
+            return Ok(true);
+        }
+        Ok(false)
+    }
+
+    fn expect_punct(&mut self, punct: char) -> Result<(), Error> {
+        if self.skip_punct(punct)? {
+            return Ok(());
+        }
+        error(format!("Expected '{punct}'"), self.position)
+    }
+
+    fn expect_name(&mut self) -> Result<String, Error> {
+        if let Token::Name(_) = self.token {
+            if let Token::Name(name) = self.advance()? {
+                return Ok(name);
+            }
+        }
+        error("Expected Name", self.position)
+    }
+
+    fn is_keyword(&self, keyword: &str) -> bool {
+        matches!(&self.token, Token::Name(name) if name == keyword)
+    }
+
+    fn parse_document(&mut self) -> Result<(Vec<(OperationKind, Vec<Selection>)>, HashMap<String, Vec<Selection>>), Error> {
+        let mut operations = Vec::new();
+        let mut fragments = HashMap::new();
+        if self.token == Token::End {
+            return error("Unexpected <EOF>", self.position);
+        }
+        while self.token != Token::End {
+            if self.is_punct('{') {
+                operations.push((OperationKind::Query, self.parse_selection_set()?));
+                continue;
+            }
+            let kind = match &self.token {
+                Token::Name(name) if name == "query" => OperationKind::Query,
+                Token::Name(name) if name == "mutation" => OperationKind::Mutation,
+                Token::Name(name) if name == "subscription" => OperationKind::Subscription,
+                Token::Name(name) if name == "fragment" => {
+                    self.advance()?;
+                    let name = self.expect_name()?;
+                    if name == "on" {
+                        return error("Unexpected Name \"on\"", self.position);
+                    }
+                    if !self.is_keyword("on") {
+                        return error("Expected \"on\"", self.position);
+                    }
+                    self.advance()?;
+                    self.expect_name()?;
+                    self.skip_directives()?;
+                    let selection_set = self.parse_selection_set()?;
+                    // Like a dict, a later fragment with the same name wins.
+                    fragments.insert(name, selection_set);
+                    continue;
+                }
+                _ => return error("Unsupported definition", self.position),
+            };
+            self.advance()?;
+            if let Token::Name(_) = self.token {
+                self.advance()?;
+            }
+            if self.is_punct('(') {
+                self.skip_variable_definitions()?;
+            }
+            self.skip_directives()?;
+            operations.push((kind, self.parse_selection_set()?));
+        }
+        Ok((operations, fragments))
+    }
+
+    fn skip_variable_definitions(&mut self) -> Result<(), Error> {
+        self.expect_punct('(')?;
+        loop {
+            self.expect_punct('$')?;
+            self.expect_name()?;
+            self.expect_punct(':')?;
+            self.skip_type()?;
+            if self.skip_punct('=')? {
+                self.parse_value(true)?;
+            }
+            self.skip_directives()?;
+            if self.skip_punct(')')? {
+                return Ok(());
+            }
+        }
+    }
+
+    fn skip_type(&mut self) -> Result<(), Error> {
+        if self.skip_punct('[')? {
+            self.skip_type()?;
+            self.expect_punct(']')?;
+        } else {
+            self.expect_name()?;
+        }
+        self.skip_punct('!')?;
+        Ok(())
+    }
+
+    fn skip_directives(&mut self) -> Result<(), Error> {
+        while self.skip_punct('@')? {
+            self.expect_name()?;
+            if self.is_punct('(') {
+                self.parse_arguments()?;
+            }
+        }
+        Ok(())
+    }
+
+    fn parse_selection_set(&mut self) -> Result<Vec<Selection>, Error> {
+        self.expect_punct('{')?;
+        let mut selections = Vec::new();
+        loop {
+            selections.push(self.parse_selection()?);
+            if self.skip_punct('}')? {
+                return Ok(selections);
+            }
+        }
+    }
+
+    fn parse_selection(&mut self) -> Result<Selection, Error> {
+        if self.token == Token::Spread {
+            self.advance()?;
+            let is_spread = matches!(&self.token, Token::Name(name) if name != "on");
+            if is_spread {
+                let name = self.expect_name()?;
+                self.skip_directives()?;
+                return Ok(Selection::FragmentSpread(name));
+            }
+            if self.is_keyword("on") {
+                self.advance()?;
+                self.expect_name()?;
+            }
+            self.skip_directives()?;
+            return Ok(Selection::InlineFragment(self.parse_selection_set()?));
+        }
+        let name_or_alias = self.expect_name()?;
+        let key = name_or_alias.clone();
+        if self.skip_punct(':')? {
+            self.expect_name()?;
+        }
+        let arguments = if self.is_punct('(') {
+            self.parse_arguments()?
+        } else {
+            Vec::new()
+        };
+        self.skip_directives()?;
+        let selection_set = if self.is_punct('{') {
+            Some(self.parse_selection_set()?)
+        } else {
+            None
+        };
+        Ok(Selection::Field {
+            key,
+            arguments,
+            selection_set,
+        })
+    }
+
+    fn parse_arguments(&mut self) -> Result<Vec<(String, Value)>, Error> {
+        self.expect_punct('(')?;
+        let mut arguments = Vec::new();
+        loop {
+            let name = self.expect_name()?;
+            self.expect_punct(':')?;
+            arguments.push((name, self.parse_value(false)?));
+            if self.skip_punct(')')? {
+                return Ok(arguments);
+            }
+        }
+    }
+
+    fn parse_value(&mut self, is_const: bool) -> Result<Value, Error> {
+        let position = self.position;
+        match self.advance()? {
+            Token::Punct('$') if !is_const => Ok(Value::Variable(self.expect_name()?)),
+            Token::Punct('[') => {
+                let mut values = Vec::new();
+                while !self.skip_punct(']')? {
+                    values.push(self.parse_value(is_const)?);
+                }
+                Ok(Value::List(values))
+            }
+            Token::Punct('{') => {
+                let mut fields = Vec::new();
+                while !self.skip_punct('}')? {
+                    let name = self.expect_name()?;
+                    self.expect_punct(':')?;
+                    fields.push((name, self.parse_value(is_const)?));
+                }
+                Ok(Value::Object(fields))
+            }
+            Token::Int(text) => Ok(Value::Int(text)),
+            Token::Float(text) => Ok(Value::Float(text)),
+            Token::Str(value) => Ok(Value::Str { value, block: false }),
+            Token::BlockStr(value) => Ok(Value::Str { value, block: true }),
+            Token::Name(name) => Ok(match name.as_str() {
+                "true" => Value::Boolean(true),
+                "false" => Value::Boolean(false),
+                "null" => Value::Null,
+                _ => Value::Enum(name),
+            }),
+            _ => error("Unexpected token in value", position),
+        }
+    }
+}
+
+// ---------------------------------------------------------------------------
+// Field trees
+// ---------------------------------------------------------------------------
+
+/// Collect the fields of a selection set, inlining fragments (`render_fields`).
+///
+/// `remaining` is the number of fields that may still be selected; fragments are
+/// inlined at every spread, so it bounds the work a fragment bomb can cause.
+fn render_fields(
+    fragments: &HashMap<String, Vec<Selection>>,
+    selections: &[Selection],
+    depth: usize,
+    remaining: &mut usize,
+) -> Result<FieldTree, Error> {
+    if depth > MAX_DEPTH {
+        return error("Selection sets nested too deeply or fragment cycle", 0);
+    }
+    let mut tree = FieldTree::default();
+    for selection in selections {
+        match selection {
+            Selection::FragmentSpread(name) => {
+                if let Some(fragment) = fragments.get(name) {
+                    tree.update(render_fields(fragments, fragment, depth + 1, remaining)?);
+                }
+            }
+            Selection::InlineFragment(selection_set) => {
+                tree.update(render_fields(fragments, selection_set, depth + 1, remaining)?);
+            }
+            Selection::Field { .. } if *remaining == 0 => {
+                return error("Document selects too many fields with fragments expanded", 0);
+            }
+            Selection::Field {
+                key,
+                arguments,
+                selection_set: Some(selection_set),
+            } => {
+                *remaining -= 1;
+                let field = Field {
+                    arguments: arguments.clone(),
+                    selection_set: Some(render_fields(fragments, selection_set, depth + 1, remaining)?),
+                };
+                tree.set(key.clone(), Entry::Nested(field));
+            }
+            Selection::Field {
+                key,
+                arguments,
+                selection_set: None,
+            } => {
+                *remaining -= 1;
+                let field = Field {
+                    arguments: arguments.clone(),
+                    selection_set: None,
+                };
+                match tree.position(key) {
+                    None => tree.entries.push((key.clone(), Entry::Leaves(vec![field]))),
+                    Some(index) => match &mut tree.entries[index].1 {
+                        Entry::Leaves(fields) => fields.push(field),
+                        // The Python implementation fails here as well.
+                        Entry::Nested(_) => return error(format!("Field '{key}' is both a leaf and an object"), 0),
+                    },
+                }
+            }
+        }
+    }
+    Ok(tree)
+}
+
+/// Parse a GraphQL document and build the field tree of each operation.
+///
+/// Args:
+///     source: The GraphQL query text.
+///     max_fields: Maximum number of fields all operations may select together.
+///
+/// Returns the operations in document order, or an error if the document is
+/// not an executable document this module can handle.
+pub fn field_trees(source: &str, max_fields: usize) -> Result<Vec<Operation>, Error> {
+    let mut parser = Parser::new(source)?;
+    let (operations, fragments) = parser.parse_document()?;
+    let mut remaining = max_fields;
+    operations
+        .into_iter()
+        .map(|(kind, selections)| {
+            Ok(Operation {
+                kind,
+                fields: render_fields(&fragments, &selections, 0, &mut remaining)?,
+            })
+        })
+        .collect()
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn parse(source: &str) -> Result<Vec<Operation>, Error> {
+        field_trees(source, MAX_FIELDS)
+    }
+
+    fn leaf(arguments: Vec<(&str, Value)>) -> Field {
+        Field {
+            arguments: arguments.into_iter().map(|(name, value)| (name.to_string(), value)).collect(),
+            selection_set: None,
+        }
+    }
+
+    fn keys(tree: &FieldTree) -> Vec<&str> {
+        tree.entries.iter().map(|(key, _)| key.as_str()).collect()
+    }
+
+    #[test]
+    fn parses_literal_arguments() {
+        let operations = parse(r#"{ a(x: 1, y: "s", z: true, e: ENUM, f: -1.5e3, n: null, v: $var) }"#).unwrap();
+        assert_eq!(operations.len(), 1);
+        assert_eq!(operations[0].kind, OperationKind::Query);
+        let expected = leaf(vec![
+            ("x", Value::Int("1".into())),
+            ("y", Value::Str { value: "s".into(), block: false }),
+            ("z", Value::Boolean(true)),
+            ("e", Value::Enum("ENUM".into())),
+            ("f", Value::Float("-1.5e3".into())),
+            ("n", Value::Null),
+            ("v", Value::Variable("var".into())),
+        ]);
+        assert_eq!(operations[0].fields.entries, vec![("a".to_string(), Entry::Leaves(vec![expected]))]);
+    }
+
+    #[test]
+    fn parses_lists_and_objects() {
+        let operations = parse(r#"{ a(o: {k: [1, {m: $v}]}) }"#).unwrap();
+        let Entry::Leaves(fields) = &operations[0].fields.entries[0].1 else { panic!() };
+        assert_eq!(
+            fields[0].arguments[0].1,
+            Value::Object(vec![(
+                "k".into(),
+                Value::List(vec![Value::Int("1".into()), Value::Object(vec![("m".into(), Value::Variable("v".into()))])]),
+            )])
+        );
+    }
+
+    #[test]
+    fn decodes_string_escapes() {
+        let operations = parse(r#"{ a(s: "q\"\\\né😀\u{1F600}") }"#).unwrap();
+        let Entry::Leaves(fields) = &operations[0].fields.entries[0].1 else { panic!() };
+        assert_eq!(
+            fields[0].arguments[0].1,
+            Value::Str { value: "q\"\\\n\u{e9}\u{1F600}\u{1F600}".into(), block: false }
+        );
+    }
+
+    #[test]
+    fn dedents_block_strings() {
+        let operations = parse("{ a(s: \"\"\"\n    first\n      second\n\n    \\\"\"\" third\n  \"\"\") }").unwrap();
+        let Entry::Leaves(fields) = &operations[0].fields.entries[0].1 else { panic!() };
+        assert_eq!(
+            fields[0].arguments[0].1,
+            Value::Str { value: "first\n  second\n\n\"\"\" third".into(), block: true }
+        );
+    }
+
+    #[test]
+    fn keeps_repeated_leaves_and_replaces_objects() {
+        let operations = parse("{ d(x: 1) d(x: 2) e: d a { id } a { name } }").unwrap();
+        let fields = &operations[0].fields;
+        assert_eq!(keys(fields), vec!["d", "e", "a"]);
+        let Entry::Leaves(leaves) = &fields.entries[0].1 else { panic!() };
+        assert_eq!(leaves.len(), 2);
+        let Entry::Nested(nested) = &fields.entries[2].1 else { panic!() };
+        assert_eq!(keys(nested.selection_set.as_ref().unwrap()), vec!["name"]);
+    }
+
+    #[test]
+    fn inlines_fragments_like_dict_update() {
+        let source = "query Q($n: Int = 1) @dir { a { id b: id ...F ... on T { c } ... @skip(if: true) { d } } ...G }
+            fragment F on T { id g(k: 2) }
+            fragment G on Q { a { q } }";
+        let operations = parse(source).unwrap();
+        let fields = &operations[0].fields;
+        assert_eq!(keys(fields), vec!["a"]);
+        let Entry::Nested(nested) = &fields.entries[0].1 else { panic!() };
+        // The spread of G replaced the whole `a` entry.
+        assert_eq!(keys(nested.selection_set.as_ref().unwrap()), vec!["q"]);
+
+        let operations = parse("{ a { id b: id ...F ... on T { c } } } fragment F on T { id g }").unwrap();
+        let Entry::Nested(nested) = &operations[0].fields.entries[0].1 else { panic!() };
+        assert_eq!(keys(nested.selection_set.as_ref().unwrap()), vec!["id", "b", "g", "c"]);
+    }
+
+    #[test]
+    fn ignores_unknown_fragments() {
+        let operations = parse("{ a { ...Missing } }").unwrap();
+        let Entry::Nested(nested) = &operations[0].fields.entries[0].1 else { panic!() };
+        assert!(nested.selection_set.as_ref().unwrap().is_empty());
+    }
+
+    #[test]
+    fn returns_every_operation() {
+        let operations = parse("mutation M { x } subscription { y } query { z }").unwrap();
+        let kinds: Vec<_> = operations.iter().map(|operation| operation.kind.as_str()).collect();
+        assert_eq!(kinds, vec!["mutation", "subscription", "query"]);
+    }
+
+    #[test]
+    fn rejects_fragment_cycles_and_invalid_documents() {
+        assert!(parse("{ ...A } fragment A on Q { ...B } fragment B on Q { ...A }").is_err());
+        assert!(parse("{ a { id } a }").is_err());
+        assert!(parse("type Query { a: Int }").is_err());
+        assert!(parse("{ a(").is_err());
+        assert!(parse("").is_err());
+        assert!(parse("{ a(x: 01) }").is_err());
+    }
+
+    #[test]
+    fn limits_expanded_fields() {
+        let source = "{ ...A ...A } fragment A on Q { a b { ...B } } fragment B on Q { c d }";
+        assert_eq!(field_trees(source, 8).unwrap().len(), 1);
+        assert!(field_trees(source, 7).is_err());
+        let bomb = "{ ...A } fragment A on Q { a: b { ...B } c: b { ...B } } \
+                    fragment B on Q { a: b { ...C } c: b { ...C } } fragment C on Q { a: b { d } c: b { d } }";
+        assert!(field_trees(bomb, 21).is_err());
+        assert!(field_trees(bomb, 22).is_ok());
+    }
+}
@@ -6,8 +6,15 @@
 //! through the `graphql_authz_proxy._rust` shim, which falls back to the
 //! pure-Python implementation when this extension is not built.
 
-use pyo3::exceptions::PyTypeError;
+mod graphql;
+mod rules;
+
+use pyo3::exceptions::{PyTypeError, PyValueError};
 use pyo3::prelude::*;
+use pyo3::types::{PyBool, PyDict, PyFloat, PyInt, PyList, PyString, PyTuple};
+
+use graphql::{Entry, Field, FieldTree, Value};
+use rules::{Argument, AuthorizeError, Json, Node, Reason};
 
 /// Parse a raw `X-Forwarded-Groups` header value into a list of group names.
 ///
@@ -45,6 +52,345 @@ fn extract_user_from_headers(
     Ok((user_email, user, access_token, groups))
 }
 
+/// Convert a literal value to the `graphql_ast_to_dict` form the Python path produces.
+fn value_to_ast_dict(py: Python<'_>, value: &Value) -> PyResult<PyObject> {
+    let node = PyDict::new(py);
+    match value {
+        Value::Variable(name) => {
+            node.set_item("kind", "variable")?;
+            let name_node = PyDict::new(py);
+            name_node.set_item("kind", "name")?;
+            name_node.set_item("value", name)?;
+            node.set_item("name", name_node)?;
+        }
+        Value::Int(text) => {
+            node.set_item("kind", "int_value")?;
+            node.set_item("value", text)?;
+        }
+        Value::Float(text) => {
+            node.set_item("kind", "float_value")?;
+            node.set_item("value", text)?;
+        }
+        Value::Str { value, block } => {
+            node.set_item("kind", "string_value")?;
+            node.set_item("value", value)?;
+            node.set_item("block", *block)?;
+        }
+        Value::Boolean(value) => {
+            node.set_item("kind", "boolean_value")?;
+            node.set_item("value", *value)?;
+        }
+        Value::Null => node.set_item("kind", "null_value")?,
+        Value::Enum(text) => {
+            node.set_item("kind", "enum_value")?;
+            node.set_item("value", text)?;
+        }
+        Value::List(values) => {
+            node.set_item("kind", "list_value")?;
+            let items = values
+                .iter()
+                .map(|value| value_to_ast_dict(py, value))
+                .collect::<PyResult<Vec<_>>>()?;
+            node.set_item("values", PyList::new(py, items)?)?;
+        }
+        Value::Object(fields) => {
+            node.set_item("kind", "object_value")?;
+            let items = PyList::empty(py);
+            for (name, value) in fields {
+                let field = PyDict::new(py);
+                field.set_item("kind", "object_field")?;
+                let name_node = PyDict::new(py);
+                name_node.set_item("kind", "name")?;
+                name_node.set_item("value", name)?;
+                field.set_item("name", name_node)?;
+                field.set_item("value", value_to_ast_dict(py, value)?)?;
+                items.append(field)?;
+            }
+            node.set_item("fields", items)?;
+        }
+    }
+    Ok(node.into_any().unbind())
+}
+
+/// Convert a top-level argument value the way `render_fields` does.
+///
+/// Variables are resolved from the request, scalars become their source text
+/// (booleans stay booleans) and lists and objects keep their AST form.
+fn argument_value(py: Python<'_>, value: &Value, variables: &Bound<'_, PyDict>) -> PyResult<PyObject> {
+    Ok(match value {
+        Value::Variable(name) => match variables.get_item(name)? {
+            Some(value) => value.unbind(),
+            None => py.None(),
+        },
+        Value::Int(text) | Value::Float(text) | Value::Enum(text) => text.into_pyobject(py)?.into_any().unbind(),
+        Value::Str { value, .. } => value.into_pyobject(py)?.into_any().unbind(),
+        Value::Boolean(value) => value.into_pyobject(py)?.to_owned().into_any().unbind(),
+        Value::Null => py.None(),
+        Value::List(_) | Value::Object(_) => value_to_ast_dict(py, value)?,
+    })
+}
+
+fn field_to_dict(py: Python<'_>, field: &Field, variables: &Bound<'_, PyDict>) -> PyResult<PyObject> {
+    let arguments = PyDict::new(py);
+    for (name, value) in &field.arguments {
+        arguments.set_item(name, argument_value(py, value, variables)?)?;
+    }
+    let node = PyDict::new(py);
+    node.set_item("arguments", arguments)?;
+    match &field.selection_set {
+        Some(tree) if !tree.is_empty() => node.set_item("selection_set", tree_to_dict(py, tree, variables)?)?,
+        _ => node.set_item("selection_set", py.None())?,
+    }
+    Ok(node.into_any().unbind())
+}
+
+/// Convert a field tree to the dict `convert_fields_to_dict(render_fields(...))` returns.
+fn tree_to_dict(py: Python<'_>, tree: &FieldTree, variables: &Bound<'_, PyDict>) -> PyResult<PyObject> {
+    let result = PyDict::new(py);
+    for (key, entry) in &tree.entries {
+        let value = match entry {
+            Entry::Nested(field) => field_to_dict(py, field, variables)?,
+            Entry::Leaves(fields) if fields.len() == 1 => field_to_dict(py, &fields[0], variables)?,
+            Entry::Leaves(fields) => {
+                let items = fields
+                    .iter()
+                    .map(|field| field_to_dict(py, field, variables))
+                    .collect::<PyResult<Vec<_>>>()?;
+                PyList::new(py, items)?.into_any().unbind()
+            }
+        };
+        result.set_item(key, value)?;
+    }
+    Ok(result.into_any().unbind())
+}
+
+/// Parse a GraphQL document and build the field tree of each operation.
+///
+/// Native counterpart of `graphql_authz_proxy.authz.utils.field_trees`. Parsing
+/// and fragment inlining run without the GIL.
+///
+/// Returns a list of `(operation_type, field_tree)` tuples in document order,
+/// where `operation_type` is `"query"`, `"mutation"` or `"subscription"`.
+///
+/// Raises `ValueError` if the document cannot be handled natively, including
+/// when it selects more than `max_fields` fields with fragments expanded.
+#[pyfunction]
+#[pyo3(signature = (query, variables, max_fields = graphql::MAX_FIELDS))]
+fn field_trees(
+    py: Python<'_>,
+    query: &str,
+    variables: &Bound<'_, PyDict>,
+    max_fields: usize,
+) -> PyResult<Vec<(&'static str, PyObject)>> {
+    let operations = py
+        .allow_threads(|| graphql::field_trees(query, max_fields))
+        .map_err(|e| PyValueError::new_err(e.to_string()))?;
+    operations
+        .iter()
+        .map(|operation| Ok((operation.kind.as_str(), tree_to_dict(py, &operation.fields, variables)?)))
+        .collect()
+}
+
+/// Convert a JSON-like Python value for comparison in Rust.
+///
+/// Raises `ValueError` for anything else (tuples, sets, integers beyond 64 bits,
+/// dicts with non-string keys), whose `==` semantics the rule engine does not model.
+fn to_json(value: &Bound<'_, PyAny>) -> PyResult<Json> {
+    if value.is_none() {
+        Ok(Json::Null)
+    } else if let Ok(value) = value.downcast_exact::<PyBool>() {
+        Ok(Json::Bool(value.is_true()))
+    } else if value.is_exact_instance_of::<PyInt>() {
+        value
+            .extract::<i64>()
+            .map(Json::Int)
+            .map_err(|_| PyValueError::new_err("Integer out of range for the native rule engine"))
+    } else if let Ok(value) = value.downcast_exact::<PyFloat>() {
+        Ok(Json::Float(value.value()))
+    } else if let Ok(value) = value.downcast_exact::<PyString>() {
+        Ok(Json::Str(value.to_str()?.to_string()))
+    } else if let Ok(values) = value.downcast_exact::<PyList>() {
+        values.iter().map(|value| to_json(&value)).collect::<PyResult<_>>().map(Json::List)
+    } else if let Ok(items) = value.downcast_exact::<PyDict>() {
+        items
+            .iter()
+            .map(|(key, value)| {
+                let key = key
+                    .downcast_exact::<PyString>()
+                    .map_err(|_| PyValueError::new_err("Dict keys must be strings for the native rule engine"))?;
+                Ok((key.to_str()?.to_string(), to_json(&value)?))
+            })
+            .collect::<PyResult<_>>()
+            .map(Json::Dict)
+    } else {
+        Err(PyValueError::new_err(format!(
+            "Unsupported value type for the native rule engine: {}",
+            value.get_type().name()?
+        )))
+    }
+}
+
+/// Iterate a rule list attribute that may be `None`, a list or a tuple.
+fn rule_items<'py>(value: Option<Bound<'py, PyAny>>) -> PyResult<Vec<Bound<'py, PyAny>>> {
+    match value {
+        None => Ok(Vec::new()),
+        Some(value) if value.is_none() => Ok(Vec::new()),
+        Some(value) => {
+            if let Ok(items) = value.downcast::<PyList>() {
+                Ok(items.iter().collect())
+            } else if let Ok(items) = value.downcast::<PyTuple>() {
+                Ok(items.iter().collect())
+            } else {
+                Err(PyValueError::new_err("Rule lists must be lists or tuples"))
+            }
+        }
+    }
+}
+
+fn to_field_rule(rule: &Bound<'_, PyAny>) -> PyResult<rules::FieldRule> {
+    let rule = rule.downcast::<PyDict>()?;
+    let field_name: String = rule
+        .get_item("field_name")?
+        .ok_or_else(|| PyValueError::new_err("Field rule without field_name"))?
+        .extract()?;
+    let arguments = rule_items(rule.get_item("arguments")?)?
+        .iter()
+        .map(|argument| {
+            let argument = argument.downcast::<PyDict>()?;
+            let argument_name: String = argument
+                .get_item("argument_name")?
+                .ok_or_else(|| PyValueError::new_err("Argument rule without argument_name"))?
+                .extract()?;
+            let values = rule_items(argument.get_item("values")?)?
+                .iter()
+                .map(to_json)
+                .collect::<PyResult<_>>()?;
+            rules::ArgumentRule::new(argument_name, values).map_err(|e| PyValueError::new_err(e.to_string()))
+        })
+        .collect::<PyResult<_>>()?;
+    let field_rules = rule_items(rule.get_item("field_rules")?)?
+        .iter()
+        .map(to_field_rule)
+        .collect::<PyResult<_>>()?;
+    Ok(rules::FieldRule {
+        field_name,
+        arguments,
+        field_rules,
+    })
+}
+
+fn to_field_rules(bundle: &Bound<'_, PyDict>, name: &str) -> PyResult<Vec<rules::FieldRule>> {
+    rule_items(bundle.get_item(name)?)?.iter().map(to_field_rule).collect()
+}
+
+/// Convert a field tree from `field_trees`, keeping each argument value for denial reasons.
+fn to_tree<'py>(tree: &Bound<'py, PyDict>, values: &mut Vec<Bound<'py, PyAny>>) -> PyResult<rules::Tree> {
+    tree.iter()
+        .map(|(key, node)| {
+            let key: String = key.extract()?;
+            if node.downcast::<PyList>().is_ok() {
+                return Ok((key, Node::Repeated));
+            }
+            let node = node.downcast::<PyDict>()?;
+            let mut arguments = Vec::new();
+            if let Some(items) = node.get_item("arguments")? {
+                for (name, value) in items.downcast::<PyDict>()?.iter() {
+                    let argument = Argument {
+                        value: to_json(&value)?,
+                        index: values.len(),
+                    };
+                    values.push(value);
+                    arguments.push((name.extract()?, argument));
+                }
+            }
+            let selection_set = match node.get_item("selection_set")? {
+                Some(nested) if !nested.is_none() => Some(to_tree(nested.downcast::<PyDict>()?, values)?),
+                _ => None,
+            };
+            Ok((
+                key,
+                Node::Field {
+                    arguments,
+                    selection_set,
+                },
+            ))
+        })
+        .collect()
+}
+
+/// A rule bundle compiled for native evaluation.
+///
+/// Native counterpart of `check_field_allowances` and `check_field_denials`
+/// for the four rule lists of a `UserRules` bundle.
+#[pyclass(frozen, module = "graphql_authz_proxy_rs")]
+struct RuleSet {
+    rules: rules::RuleSet,
+}
+
+#[pymethods]
+impl RuleSet {
+    /// Compile a rule bundle from `UserRules.model_dump()`.
+    ///
+    /// Raises `ValueError` for rules the native engine cannot evaluate exactly
+    /// like the Python checks, such as JSONPath expressions in argument values.
+    #[new]
+    fn new(bundle: &Bound<'_, PyDict>) -> PyResult<Self> {
+        Ok(RuleSet {
+            rules: rules::RuleSet {
+                query_field_allowances: to_field_rules(bundle, "query_field_allowances")?,
+                mutation_field_allowances: to_field_rules(bundle, "mutation_field_allowances")?,
+                query_field_denials: to_field_rules(bundle, "query_field_denials")?,
+                mutation_field_denials: to_field_rules(bundle, "mutation_field_denials")?,
+            },
+        })
+    }
+
+    /// Authorize the field tree of one query or mutation.
+    ///
+    /// The tree is converted with the GIL held; the rules are then evaluated
+    /// without it.
+    ///
+    /// Returns `(is_allowed, reason, path)`, or `None` if the tree needs the
+    /// Python checks (for example a field the rules inspect is selected twice).
+    /// Raises `ValueError` if the bundle has no rules for the operation type.
+    fn authorize(
+        &self,
+        py: Python<'_>,
+        operation: &str,
+        field_tree: &Bound<'_, PyDict>,
+    ) -> PyResult<Option<(bool, String, Vec<String>)>> {
+        let is_mutation = match operation {
+            "query" => false,
+            "mutation" => true,
+            _ => return Err(PyValueError::new_err(format!("Cannot authorize a {operation} operation"))),
+        };
+        let mut values = Vec::new();
+        let tree = match to_tree(field_tree, &mut values) {
+            Ok(tree) => tree,
+            Err(e) if e.is_instance_of::<PyValueError>(py) => return Ok(None),
+            Err(e) => return Err(e),
+        };
+        let decision = match py.allow_threads(|| self.rules.authorize(is_mutation, &tree)) {
+            Ok(decision) => decision,
+            Err(AuthorizeError::NoRules) => {
+                return Err(PyValueError::new_err("No field restrictions or allowances configured."))
+            }
+            Err(AuthorizeError::Unsupported(_)) => return Ok(None),
+        };
+        // Same wording as the Python checks, with the value formatted by `str()`.
+        let reason = match decision.reason {
+            Reason::Message(message) => message,
+            Reason::ArgumentForbidden { argument, field, value } => {
+                format!("Argument '{argument}' value '{}' is forbidden for field '{field}'", values[value].str()?)
+            }
+            Reason::ArgumentNotAllowed { argument, field, value } => {
+                format!("Argument '{argument}'value '{}' is not allowed for field '{field}'", values[value].str()?)
+            }
+        };
+        Ok(Some((decision.allowed, reason, decision.path)))
+    }
+}
+
 /// Return the version of the native crate, for diagnostics/health checks.
 #[pyfunction]
 fn version() -> String {
@@ -56,6 +402,8 @@ fn version() -> String {
 fn graphql_authz_proxy_rs(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add("__version__", env!("CARGO_PKG_VERSION"))?;
     m.add_function(wrap_pyfunction!(extract_user_from_headers, m)?)?;
+    m.add_function(wrap_pyfunction!(field_trees, m)?)?;
+    m.add_class::<RuleSet>()?;
     m.add_function(wrap_pyfunction!(version, m)?)?;
     Ok(())
 }
@@ -0,0 +1,563 @@
+//! Native evaluation of compiled rule bundles.
+//!
+//! This is a Rust port of `graphql_authz_proxy.authz.permissions`
+//! (`check_field_allowances` and `check_field_denials`) and of the static-path
+//! `ObjectMatcher`s from `graphql_authz_proxy.authz.matchers`. A `RuleSet` is
+//! compiled once per rule bundle and evaluates field trees without touching
+//! Python objects, so `lib.rs` can release the GIL while it runs.
+//!
+//! Values compare like Python's `==` on JSON data: `true == 1 == 1.0`, dicts
+//! ignore key order and lists do not. Rules or trees this module cannot
+//! evaluate exactly like the Python code are reported as `Unsupported` and the
+//! caller falls back to the Python implementation.
+
+use std::fmt;
+
+/// A JSON-like value, from a rule or from a request.
+#[derive(Debug, Clone)]
+pub enum Json {
+    Null,
+    Bool(bool),
+    Int(i64),
+    Float(f64),
+    Str(String),
+    List(Vec<Json>),
+    /// Keys are unique, as in the Python dict the value came from.
+    Dict(Vec<(String, Json)>),
+}
+
+enum Number {
+    Int(i64),
+    Float(f64),
+}
+
+impl Json {
+    fn number(&self) -> Option<Number> {
+        match self {
+            Json::Bool(value) => Some(Number::Int(i64::from(*value))),
+            Json::Int(value) => Some(Number::Int(*value)),
+            Json::Float(value) => Some(Number::Float(*value)),
+            _ => None,
+        }
+    }
+
+    fn get(&self, key: &str) -> Option<&Json> {
+        match self {
+            Json::Dict(items) => items.iter().find(|(name, _)| name == key).map(|(_, value)| value),
+            _ => None,
+        }
+    }
+
+    /// Python truthiness.
+    fn is_truthy(&self) -> bool {
+        match self {
+            Json::Null => false,
+            Json::Bool(value) => *value,
+            Json::Int(value) => *value != 0,
+            Json::Float(value) => *value != 0.0,
+            Json::Str(value) => !value.is_empty(),
+            Json::List(values) => !values.is_empty(),
+            Json::Dict(items) => !items.is_empty(),
+        }
+    }
+}
+
+fn int_equals_float(int: i64, float: f64) -> bool {
+    // Compare exactly, like Python: 2**63 is not equal to 2**63 - 1.
+    float.fract() == 0.0 && (-9.223_372_036_854_776e18..9.223_372_036_854_776e18).contains(&float) && float as i64 == int
+}
+
+impl PartialEq for Json {
+    fn eq(&self, other: &Json) -> bool {
+        if let (Some(left), Some(right)) = (self.number(), other.number()) {
+            return match (left, right) {
+                (Number::Int(left), Number::Int(right)) => left == right,
+                (Number::Float(left), Number::Float(right)) => left == right,
+                (Number::Int(int), Number::Float(float)) | (Number::Float(float), Number::Int(int)) => {
+                    int_equals_float(int, float)
+                }
+            };
+        }
+        match (self, other) {
+            (Json::Null, Json::Null) => true,
+            (Json::Str(left), Json::Str(right)) => left == right,
+            (Json::List(left), Json::List(right)) => left == right,
+            (Json::Dict(left), Json::Dict(right)) => {
+                left.len() == right.len() && left.iter().all(|(key, value)| other.get(key) == Some(value))
+            }
+            _ => false,
+        }
+    }
+}
+
+/// Raised for rules or field trees this module cannot evaluate like the Python code.
+#[derive(Debug, Clone, PartialEq, Eq)]
+pub struct Unsupported(pub String);
+
+impl fmt::Display for Unsupported {
+    fn fmt(&self, f: &mut fmt::Formatter<'_>) -> fmt::Result {
+        f.write_str(&self.0)
+    }
+}
+
+impl std::error::Error for Unsupported {}
+
+// ---------------------------------------------------------------------------
+// Rules
+// ---------------------------------------------------------------------------
+
+/// Path segments that `PathMatcher` resolves with plain dict lookups.
+fn is_static_key(key: &str) -> bool {
+    let mut chars = key.chars();
+    matches!(chars.next(), Some('A'..='Z' | 'a'..='z' | '_'))
+        && chars.all(|ch| ch.is_ascii_alphanumeric() || ch == '_')
+        && key != "where"
+        && key != "wherenot"
+}
+
+/// Expected value at a path of plain keys inside an argument value.
+#[derive(Debug, Clone)]
+struct PathMatcher {
+    keys: Vec<String>,
+    expected: Json,
+}
+
+impl PathMatcher {
+    fn matches(&self, data: &Json) -> bool {
+        self.extract(data).unwrap_or(&Json::Null) == &self.expected
+    }
+
+    fn extract<'a>(&self, data: &'a Json) -> Option<&'a Json> {
+        if !data.is_truthy() {
+            return None;
+        }
+        self.keys.iter().try_fold(data, |value, key| value.get(key))
+    }
+}
+
+/// `flatten_jsonpaths`: dotted paths of the leaves of a nested dict.
+fn flatten_paths(items: &[(String, Json)], parent: &str, paths: &mut Vec<(String, Json)>) {
+    for (key, value) in items {
+        let path = if parent.is_empty() { key.clone() } else { format!("{parent}.{key}") };
+        match value {
+            Json::Dict(nested) => flatten_paths(nested, &path, paths),
+            _ => paths.push((path, value.clone())),
+        }
+    }
+}
+
+/// An allowed or denied argument value: compared with `==`, or path by path for dicts.
+#[derive(Debug, Clone)]
+enum ValueRule {
+    Equals(Json),
+    Object(Vec<PathMatcher>),
+}
+
+impl ValueRule {
+    fn compile(value: Json) -> Result<ValueRule, Unsupported> {
+        let Json::Dict(items) = &value else {
+            return Ok(ValueRule::Equals(value));
+        };
+        let mut paths = Vec::new();
+        flatten_paths(items, "", &mut paths);
+        paths
+            .into_iter()
+            .map(|(path, expected)| {
+                let keys: Vec<String> = path.split('.').map(str::to_string).collect();
+                if keys.iter().all(|key| is_static_key(key)) {
+                    Ok(PathMatcher { keys, expected })
+                } else {
+                    Err(Unsupported(format!("JSONPath expression '{path}'")))
+                }
+            })
+            .collect::<Result<_, _>>()
+            .map(ValueRule::Object)
+    }
+
+    fn all_match(&self, data: &Json) -> bool {
+        match self {
+            ValueRule::Equals(expected) => data == expected,
+            ValueRule::Object(paths) => paths.iter().all(|path| path.matches(data)),
+        }
+    }
+
+    fn any_match(&self, data: &Json) -> bool {
+        match self {
+            ValueRule::Equals(expected) => data == expected,
+            ValueRule::Object(paths) => paths.iter().any(|path| path.matches(data)),
+        }
+    }
+}
+
+/// `ArgumentRule`.
+#[derive(Debug, Clone)]
+pub struct ArgumentRule {
+    pub argument_name: String,
+    values: Vec<ValueRule>,
+}
+
+impl ArgumentRule {
+    pub fn new(argument_name: String, values: Vec<Json>) -> Result<Self, Unsupported> {
+        Ok(ArgumentRule {
+            argument_name,
+            values: values.into_iter().map(ValueRule::compile).collect::<Result<_, _>>()?,
+        })
+    }
+}
+
+/// `FieldRule`.
+#[derive(Debug, Clone)]
+pub struct FieldRule {
+    pub field_name: String,
+    pub arguments: Vec<ArgumentRule>,
+    pub field_rules: Vec<FieldRule>,
+}
+
+/// The four rule lists of a `UserRules` bundle.
+#[derive(Debug, Clone, Default)]
+pub struct RuleSet {
+    pub query_field_allowances: Vec<FieldRule>,
+    pub mutation_field_allowances: Vec<FieldRule>,
+    pub query_field_denials: Vec<FieldRule>,
+    pub mutation_field_denials: Vec<FieldRule>,
+}
+
+// ---------------------------------------------------------------------------
+// Field trees and decisions
+// ---------------------------------------------------------------------------
+
+/// An argument value and the index of the request object it was converted from,
+/// so the caller can format denial reasons with the original value.
+#[derive(Debug, Clone)]
+pub struct Argument {
+    pub value: Json,
+    pub index: usize,
+}
+
+/// A node of a field tree, as built by `convert_fields_to_dict`.
+#[derive(Debug, Clone)]
+pub enum Node {
+    Field {
+        arguments: Vec<(String, Argument)>,
+        selection_set: Option<Vec<(String, Node)>>,
+    },
+    /// A leaf field selected more than once, which the Python checks do not support.
+    Repeated,
+}
+
+pub type Tree = Vec<(String, Node)>;
+
+fn lookup<'a>(tree: &'a [(String, Node)], key: &str) -> Option<&'a Node> {
+    tree.iter().find(|(name, _)| name == key).map(|(_, node)| node)
+}
+
+#[derive(Debug, Clone, PartialEq)]
+pub enum Reason {
+    Message(String),
+    /// A denied argument value; the caller formats the message with the value at `value`.
+    ArgumentForbidden { argument: String, field: String, value: usize },
+    /// An argument value no allowance matches.
+    ArgumentNotAllowed { argument: String, field: String, value: usize },
+}
+
+#[derive(Debug, Clone, PartialEq)]
+pub struct Decision {
+    pub allowed: bool,
+    pub reason: Reason,
+    pub path: Vec<String>,
+}
+
+fn decision(allowed: bool, reason: impl Into<String>, path: Vec<String>) -> Decision {
+    Decision {
+        allowed,
+        reason: Reason::Message(reason.into()),
+        path,
+    }
+}
+
+fn with_field(path: &[String], field: &str) -> Vec<String> {
+    let mut path = path.to_vec();
+    path.push(field.to_string());
+    path
+}
+
+type Arguments<'a> = &'a [(String, Argument)];
+type Children<'a> = Option<&'a Vec<(String, Node)>>;
+
+fn field_parts<'a>(node: &'a Node, field: &str) -> Result<(Arguments<'a>, Children<'a>), Unsupported> {
+    match node {
+        Node::Field {
+            arguments,
+            selection_set,
+        } => Ok((arguments, selection_set.as_ref().filter(|tree| !tree.is_empty()))),
+        Node::Repeated => Err(Unsupported(format!("Field '{field}' is selected more than once"))),
+    }
+}
+
+fn argument<'a>(arguments: Arguments<'a>, name: &str) -> Option<&'a Argument> {
+    arguments.iter().rev().find(|(key, _)| key == name).map(|(_, argument)| argument)
+}
+
+// The path is passed by value and each sub-field check continues with the path the
+// previous one returned: the Python checks rebind `parent_fields` to the returned list.
+
+/// `check_field_denials`.
+fn check_denials(nodes: &[(String, Node)], rules: &[FieldRule], mut path: Vec<String>) -> Result<Decision, Unsupported> {
+    if rules.is_empty() {
+        return Ok(decision(true, "No field restrictions to check", path));
+    }
+    for rule in rules {
+        if rule.field_name == "*" {
+            return Ok(decision(false, "Wildcard '*' found in field restrictions, all fields are denied", path));
+        }
+        let Some(node) = lookup(nodes, &rule.field_name) else {
+            continue;
+        };
+        let (arguments, children) = field_parts(node, &rule.field_name)?;
+        for argument_rule in &rule.arguments {
+            let Some(value) = argument(arguments, &argument_rule.argument_name) else {
+                continue;
+            };
+            if argument_rule.values.iter().any(|denied| denied.any_match(&value.value)) {
+                return Ok(Decision {
+                    allowed: false,
+                    reason: Reason::ArgumentForbidden {
+                        argument: argument_rule.argument_name.clone(),
+                        field: rule.field_name.clone(),
+                        value: value.index,
+                    },
+                    path: with_field(&path, &rule.field_name),
+                });
+            }
+        }
+        let Some(children) = children else {
+            continue;
+        };
+        if rule.field_rules.is_empty() {
+            let reason = format!("Field '{}' has sub-fields but no sub-field restrictions defined", rule.field_name);
+            return Ok(decision(false, reason, path));
+        }
+        path.push(rule.field_name.clone());
+        for child in children {
+            let result = check_denials(std::slice::from_ref(child), &rule.field_rules, path)?;
+            if !result.allowed {
+                return Ok(result);
+            }
+            path = result.path;
+        }
+        path.pop();
+    }
+    Ok(decision(true, "All field permissions are satisfied.", path))
+}
+
+/// `check_field_allowances`.
+fn check_allowances(
+    nodes: &[(String, Node)],
+    rules: &[FieldRule],
+    mut path: Vec<String>,
+) -> Result<Decision, Unsupported> {
+    if rules.is_empty() {
+        return Ok(decision(false, "No field allowances defined, all fields are denied", path));
+    }
+    for rule in rules {
+        if rule.field_name == "*" {
+            return Ok(decision(true, "Wildcard '*' found in field allowances, all fields are allowed", path));
+        }
+        let Some(node) = lookup(nodes, &rule.field_name) else {
+            continue;
+        };
+        let (arguments, children) = field_parts(node, &rule.field_name)?;
+        for argument_rule in &rule.arguments {
+            let Some(value) = argument(arguments, &argument_rule.argument_name) else {
+                continue;
+            };
+            if !argument_rule.values.is_empty()
+                && !argument_rule.values.iter().any(|allowed| allowed.all_match(&value.value))
+            {
+                return Ok(Decision {
+                    allowed: false,
+                    reason: Reason::ArgumentNotAllowed {
+                        argument: argument_rule.argument_name.clone(),
+                        field: rule.field_name.clone(),
+                        value: value.index,
+                    },
+                    path: with_field(&path, &rule.field_name),
+                });
+            }
+        }
+        match children {
+            Some(children) if !rule.field_rules.is_empty() => {
+                path.push(rule.field_name.clone());
+                for child in children {
+                    let result = check_allowances(std::slice::from_ref(child), &rule.field_rules, path)?;
+                    if !result.allowed {
+                        return Ok(result);
+                    }
+                    path = result.path;
+                }
+                path.pop();
+            }
+            _ => {
+                let reason = format!("Field '{}' is allowed", rule.field_name);
+                return Ok(decision(true, reason, with_field(&path, &rule.field_name)));
+            }
+        }
+    }
+    Ok(decision(false, "No matching field allowances found, access denied", path))
+}
+
+/// Why a rule set did not produce a decision.
+#[derive(Debug, Clone, PartialEq, Eq)]
+pub enum AuthorizeError {
+    /// The bundle has neither allowances nor denials for the operation type.
+    NoRules,
+    Unsupported(Unsupported),
+}
+
+impl RuleSet {
+    /// Authorize the field tree of one query or mutation, like `check_authorization`.
+    ///
+    /// Allowances, if there are any for the operation type, take precedence over denials.
+    pub fn authorize(&self, is_mutation: bool, tree: &[(String, Node)]) -> Result<Decision, AuthorizeError> {
+        let (allowances, denials) = if is_mutation {
+            (&self.mutation_field_allowances, &self.mutation_field_denials)
+        } else {
+            (&self.query_field_allowances, &self.query_field_denials)
+        };
+        let result = if !allowances.is_empty() {
+            check_allowances(tree, allowances, Vec::new())
+        } else if !denials.is_empty() {
+            check_denials(tree, denials, Vec::new())
+        } else {
+            return Err(AuthorizeError::NoRules);
+        };
+        result.map_err(AuthorizeError::Unsupported)
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn rule(name: &str, arguments: Vec<ArgumentRule>, field_rules: Vec<FieldRule>) -> FieldRule {
+        FieldRule {
+            field_name: name.to_string(),
+            arguments,
+            field_rules,
+        }
+    }
+
+    fn string(value: &str) -> Json {
+        Json::Str(value.to_string())
+    }
+
+    fn field(arguments: Vec<(&str, Json)>, selection_set: Option<Tree>) -> Node {
+        Node::Field {
+            arguments: arguments
+                .into_iter()
+                .enumerate()
+                .map(|(index, (name, value))| (name.to_string(), Argument { value, index }))
+                .collect(),
+            selection_set,
+        }
+    }
+
+    fn tree(nodes: Vec<(&str, Node)>) -> Tree {
+        nodes.into_iter().map(|(name, node)| (name.to_string(), node)).collect()
+    }
+
+    #[test]
+    fn compares_like_python() {
+        assert_eq!(Json::Bool(true), Json::Int(1));
+        assert_eq!(Json::Int(2), Json::Float(2.0));
+        assert_ne!(Json::Int(i64::MAX), Json::Float(9.223_372_036_854_776e18));
+        assert_ne!(Json::Str("1".into()), Json::Int(1));
+        assert_ne!(Json::Null, Json::Bool(false));
+        assert_ne!(Json::Float(f64::NAN), Json::Float(f64::NAN));
+        let left = Json::Dict(vec![("a".into(), Json::Int(1)), ("b".into(), Json::Null)]);
+        let right = Json::Dict(vec![("b".into(), Json::Null), ("a".into(), Json::Float(1.0))]);
+        assert_eq!(left, right);
+        assert_ne!(Json::List(vec![Json::Int(1), Json::Int(2)]), Json::List(vec![Json::Int(2), Json::Int(1)]));
+    }
+
+    #[test]
+    fn allowances_check_arguments_and_sub_fields() {
+        let name_rule = ArgumentRule::new("name".into(), vec![string("Ann")]).unwrap();
+        let rules = RuleSet {
+            query_field_allowances: vec![rule("getUser", vec![name_rule], vec![rule("id", vec![], vec![])])],
+            ..RuleSet::default()
+        };
+        let allowed = tree(vec![("getUser", field(vec![("name", string("Ann"))], Some(tree(vec![("id", field(vec![], None))]))))]);
+        // Like the Python check, a rule whose sub-fields all pass does not allow the query by itself.
+        let result = rules.authorize(false, &allowed).unwrap();
+        assert!(!result.allowed);
+        assert_eq!(result.path, vec!["getUser"]);
+        let leaf_rules = RuleSet {
+            query_field_allowances: vec![rule("getUser", vec![], vec![])],
+            ..RuleSet::default()
+        };
+        let result = leaf_rules.authorize(false, &allowed).unwrap();
+        assert!(result.allowed);
+        assert_eq!(result.path, vec!["getUser"]);
+
+        let other_user = tree(vec![("getUser", field(vec![("name", string("Bob"))], None))]);
+        let result = rules.authorize(false, &other_user).unwrap();
+        assert!(!result.allowed);
+        assert_eq!(
+            result.reason,
+            Reason::ArgumentNotAllowed { argument: "name".into(), field: "getUser".into(), value: 0 }
+        );
+
+        let other_field = tree(vec![("getUser", field(vec![], Some(tree(vec![("email", field(vec![], None))]))))]);
+        let result = rules.authorize(false, &other_field).unwrap();
+        assert!(!result.allowed);
+        assert_eq!(result.path, vec!["getUser"]);
+        assert_eq!(result.reason, Reason::Message("No matching field allowances found, access denied".into()));
+    }
+
+    #[test]
+    fn denials_match_any_path_of_dict_values() {
+        let filter = Json::Dict(vec![("owner".into(), Json::Dict(vec![("name".into(), string("root"))]))]);
+        let rules = RuleSet {
+            mutation_field_denials: vec![rule("update", vec![ArgumentRule::new("input".into(), vec![filter]).unwrap()], vec![])],
+            ..RuleSet::default()
+        };
+        let input = Json::Dict(vec![("owner".into(), Json::Dict(vec![("name".into(), string("root"))]))]);
+        let result = rules.authorize(true, &tree(vec![("update", field(vec![("input", input)], None))])).unwrap();
+        assert!(!result.allowed);
+        assert_eq!(result.path, vec!["update"]);
+
+        let result = rules.authorize(true, &tree(vec![("update", field(vec![("input", Json::Null)], None))])).unwrap();
+        assert!(result.allowed);
+
+        let nested = tree(vec![("update", field(vec![], Some(tree(vec![("id", field(vec![], None))]))))]);
+        let result = rules.authorize(true, &nested).unwrap();
+        assert!(!result.allowed);
+        assert!(result.path.is_empty());
+    }
+
+    #[test]
+    fn wildcards_and_missing_rules() {
+        let rules = RuleSet {
+            query_field_denials: vec![rule("*", vec![], vec![])],
+            ..RuleSet::default()
+        };
+        assert!(!rules.authorize(false, &tree(vec![("a", field(vec![], None))])).unwrap().allowed);
+        assert_eq!(rules.authorize(true, &[]), Err(AuthorizeError::NoRules));
+    }
+
+    #[test]
+    fn reports_unsupported_input() {
+        let rules = RuleSet {
+            query_field_allowances: vec![rule("a", vec![], vec![])],
+            ..RuleSet::default()
+        };
+        assert!(matches!(
+            rules.authorize(false, &tree(vec![("a", Node::Repeated)])),
+            Err(AuthorizeError::Unsupported(_))
+        ));
+        let jsonpath = Json::Dict(vec![("items[*]".into(), Json::Int(1))]);
+        assert!(ArgumentRule::new("a".into(), vec![jsonpath]).is_err());
+        assert!(ArgumentRule::new("a".into(), vec![Json::Dict(vec![("where".into(), Json::Int(1))])]).is_err());
+    }
+}